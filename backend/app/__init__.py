@@ -2,7 +2,6 @@ import os
 from flask import Flask
 from flask_cors import CORS
 from dotenv import load_dotenv
-import stripe
 from flask_jwt_extended import JWTManager
 from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail
@@ -23,14 +22,95 @@ def create_app():
 
         # Stripe
         STRIPE_SECRET_KEY              = os.getenv('STRIPE_SECRET_KEY'),
+        STRIPE_WEBHOOK_SECRET          = os.getenv('STRIPE_WEBHOOK_SECRET'),
+        # Point the Stripe SDK at a local stand-in (tests, load tests)
+        STRIPE_API_BASE                = os.getenv('STRIPE_API_BASE'),
+
+        # Local Stripe object cache (seconds before prices / completed sessions are re-fetched)
+        STRIPE_CACHE_TTL               = int(os.getenv('STRIPE_CACHE_TTL', 3600)),
+        STRIPE_SESSION_CACHE_TTL       = int(os.getenv('STRIPE_SESSION_CACHE_TTL', 900)),
+        STRIPE_MISSING_PRICE_TTL       = int(os.getenv('STRIPE_MISSING_PRICE_TTL', 300)),
+
+        # Stripe webhook inbox (embedded consumer off = only process_stripe_events.py applies events)
+        STRIPE_EVENT_CONSUMER          = os.getenv('STRIPE_EVENT_CONSUMER', 'true').lower() in ('true','1','yes'),
+        STRIPE_EVENT_BATCH_SIZE        = int(os.getenv('STRIPE_EVENT_BATCH_SIZE', 100)),
+        STRIPE_EVENT_POLL_INTERVAL     = float(os.getenv('STRIPE_EVENT_POLL_INTERVAL', 2.0)),
+        STRIPE_EVENT_MAX_ATTEMPTS      = int(os.getenv('STRIPE_EVENT_MAX_ATTEMPTS', 5)),
+        STRIPE_EVENT_STALE_AFTER       = int(os.getenv('STRIPE_EVENT_STALE_AFTER', 300)),
 
         # OpenAI / Claude
         OPENAI_API_KEY                 = os.getenv('OPENAI_API_KEY'),
         CLAUDE_API_KEY                 = os.getenv('CLAUDE_API_KEY'),
 
+        # LLM gateway (base URLs can point at local stubs)
+        OPENAI_BASE_URL                = os.getenv('OPENAI_BASE_URL'),
+        ANTHROPIC_BASE_URL             = os.getenv('ANTHROPIC_BASE_URL'),
+        LLM_ROUTES                     = os.getenv('LLM_ROUTES'),  # JSON: {docType: {primary, secondary}}
+        LLM_HEDGE_PERCENTILE           = float(os.getenv('LLM_HEDGE_PERCENTILE', 95)),
+        LLM_HEDGE_MIN_SAMPLES          = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', 20)),
+        LLM_HEDGE_MAX                  = int(os.getenv('LLM_HEDGE_MAX', 4)),  # hedges in flight per worker; 0 = off
+        LLM_TIMEOUT                    = float(os.getenv('LLM_TIMEOUT', 60)),
+        LLM_POOL_SIZE                  = int(os.getenv('LLM_POOL_SIZE', 20)),
+
+        # Shared per-box SQLite store (defaults to instance/local_store.db)
+        LOCAL_STORE_PATH               = os.getenv('LOCAL_STORE_PATH'),
+
+        # Chat response cache: sqlite (shared by workers), memory or none
+        RESPONSE_CACHE_BACKEND         = os.getenv('RESPONSE_CACHE_BACKEND', 'sqlite'),
+        RESPONSE_CACHE_TTL             = int(os.getenv('RESPONSE_CACHE_TTL', 3600)),
+        RESPONSE_CACHE_MAX_ENTRIES     = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 5000)),
+
+        # Near-duplicate (MinHash/LSH) prompt cache, per worker
+        SEMANTIC_CACHE_ENABLED         = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() in ('true','1','yes'),
+        SEMANTIC_CACHE_THRESHOLD       = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.8)),
+        SEMANTIC_CACHE_MAX_ENTRIES     = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', 2000)),
+        SEMANTIC_CACHE_TTL             = int(os.getenv('SEMANTIC_CACHE_TTL', 3600)),
+        SEMANTIC_CACHE_AUDIT_RATE      = float(os.getenv('SEMANTIC_CACHE_AUDIT_RATE', 0.02)),
+
+        # Server-side conversation memory (prompt budget / verbatim window, in tokens)
+        CONVERSATION_TOKEN_BUDGET      = int(os.getenv('CONVERSATION_TOKEN_BUDGET', 6000)),
+        CONVERSATION_WINDOW_TOKENS     = int(os.getenv('CONVERSATION_WINDOW_TOKENS', 3000)),
+
+        # Per-user admission control for /api/chat (shared via LOCAL_STORE_PATH)
+        ADMISSION_ENABLED              = os.getenv('ADMISSION_ENABLED', 'true').lower() in ('true','1','yes'),
+        ADMISSION_MAX_CONCURRENT       = int(os.getenv('ADMISSION_MAX_CONCURRENT', 3)),
+        ADMISSION_RATE_PER_MINUTE      = float(os.getenv('ADMISSION_RATE_PER_MINUTE', 30)),
+        ADMISSION_BURST                = int(os.getenv('ADMISSION_BURST', 10)),
+        ADMISSION_QUEUE_TIMEOUT        = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 10)),
+        ADMISSION_MAX_QUEUE            = int(os.getenv('ADMISSION_MAX_QUEUE', 20)),
+        ADMISSION_LEASE_TTL            = int(os.getenv('ADMISSION_LEASE_TTL', 600)),
+
+        # Idempotency-Key records (seconds to keep responses / in-flight claims)
+        IDEMPOTENCY_TTL                = int(os.getenv('IDEMPOTENCY_TTL', 86400)),
+        IDEMPOTENCY_LOCK_TTL           = int(os.getenv('IDEMPOTENCY_LOCK_TTL', 300)),
+        IDEMPOTENCY_WAIT_TIMEOUT       = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', 60)),
+
+        # Credits charged for the first generation in each session
+        CHAT_CREDIT_COST               = int(os.getenv('CHAT_CREDIT_COST', 1)),
+
+        # Background chat jobs (0 workers = only run_jobs.py processes the queue)
+        CHAT_JOB_WORKERS               = int(os.getenv('CHAT_JOB_WORKERS', 2)),
+        CHAT_JOB_POLL_INTERVAL         = float(os.getenv('CHAT_JOB_POLL_INTERVAL', 1.0)),
+        CHAT_JOB_STALE_AFTER           = int(os.getenv('CHAT_JOB_STALE_AFTER', 120)),
+        CHAT_JOB_MAX_ATTEMPTS          = int(os.getenv('CHAT_JOB_MAX_ATTEMPTS', 3)),
+        CHAT_JOB_BACKOFF_BASE          = float(os.getenv('CHAT_JOB_BACKOFF_BASE', 5)),
+        CHAT_JOB_BACKOFF_MAX           = float(os.getenv('CHAT_JOB_BACKOFF_MAX', 300)),
+
         # JWT
         JWT_SECRET_KEY                 = os.getenv('JWT_SECRET_KEY'),
 
+        # Password hashing (werkzeug method + PBKDF2 cost; stored hashes are upgraded on login)
+        PASSWORD_HASH_METHOD           = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256'),
+        PASSWORD_HASH_ITERATIONS       = int(os.getenv('PASSWORD_HASH_ITERATIONS', 600000)),
+        # Hashing threads per worker, and how many more calls may wait for them
+        PASSWORD_HASH_WORKERS          = int(os.getenv('PASSWORD_HASH_WORKERS', 2)),
+        PASSWORD_HASH_MAX_QUEUE        = int(os.getenv('PASSWORD_HASH_MAX_QUEUE', 32)),
+        PASSWORD_HASH_TIMEOUT          = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10)),
+
+        # Authenticated-user snapshots, per worker (0 TTL = only memoized per request)
+        USER_CACHE_TTL                 = int(os.getenv('USER_CACHE_TTL', 60)),
+        USER_CACHE_MAX_ENTRIES         = int(os.getenv('USER_CACHE_MAX_ENTRIES', 10000)),
+
         # Mailer
         MAIL_SERVER                    = os.getenv('MAIL_SERVER', 'smtp.example.com'),
         MAIL_PORT                      = int(os.getenv('MAIL_PORT', 587)),
@@ -39,13 +119,45 @@ def create_app():
         MAIL_USERNAME                  = os.getenv('MAIL_USERNAME'),
         MAIL_PASSWORD                  = os.getenv('MAIL_PASSWORD'),
         MAIL_DEFAULT_SENDER            = os.getenv('MAIL_DEFAULT_SENDER'),
+        # Messages per SMTP connection before flask_mail reconnects (None = unlimited)
+        MAIL_MAX_EMAILS                = int(os.getenv('MAIL_MAX_EMAILS')) if os.getenv('MAIL_MAX_EMAILS') else None,
+
+        # Outbound mail queue (embedded sender off = only process_mail_queue.py sends)
+        MAIL_QUEUE_ENABLED             = os.getenv('MAIL_QUEUE_ENABLED', 'true').lower() in ('true','1','yes'),
+        MAIL_QUEUE_BATCH_SIZE          = int(os.getenv('MAIL_QUEUE_BATCH_SIZE', 50)),
+        MAIL_QUEUE_POLL_INTERVAL       = float(os.getenv('MAIL_QUEUE_POLL_INTERVAL', 5.0)),
+        MAIL_QUEUE_MAX_ATTEMPTS        = int(os.getenv('MAIL_QUEUE_MAX_ATTEMPTS', 8)),
+        MAIL_QUEUE_BACKOFF_BASE        = float(os.getenv('MAIL_QUEUE_BACKOFF_BASE', 30)),
+        MAIL_QUEUE_BACKOFF_MAX         = float(os.getenv('MAIL_QUEUE_BACKOFF_MAX', 3600)),
+        MAIL_QUEUE_STALE_AFTER         = int(os.getenv('MAIL_QUEUE_STALE_AFTER', 300)),
+
+        # Prometheus /metrics (per-worker samples are merged through LOCAL_STORE_PATH)
+        METRICS_ENABLED                = os.getenv('METRICS_ENABLED', 'true').lower() in ('true','1','yes'),
+        METRICS_FLUSH_INTERVAL         = float(os.getenv('METRICS_FLUSH_INTERVAL', 5)),
+        METRICS_TOKEN                  = os.getenv('METRICS_TOKEN'),
+
+        # Sampling profiler (requests sent with `X-Profile: <token>`, or a random fraction)
+        PROFILING_ENABLED              = os.getenv('PROFILING_ENABLED', 'false').lower() in ('true','1','yes'),
+        PROFILING_TOKEN                = os.getenv('PROFILING_TOKEN'),
+        PROFILING_SAMPLE_RATE          = float(os.getenv('PROFILING_SAMPLE_RATE', 0.0)),
+        PROFILING_ROUTES               = os.getenv('PROFILING_ROUTES', '/api/chat,/api/sessions,/api/dashboard'),
+        PROFILING_FORMAT               = os.getenv('PROFILING_FORMAT', 'speedscope'),  # or 'collapsed'
+        PROFILING_DIR                  = os.getenv('PROFILING_DIR'),
+        PROFILING_INTERVAL             = float(os.getenv('PROFILING_INTERVAL', 0.005)),
+        PROFILING_MAX_SECONDS          = float(os.getenv('PROFILING_MAX_SECONDS', 120)),
+        PROFILING_MAX_ACTIVE           = int(os.getenv('PROFILING_MAX_ACTIVE', 2)),
+        PROFILING_KEEP                 = int(os.getenv('PROFILING_KEEP', 200)),
+
+        # Enterprise applications
+        ADMIN_NOTIFICATION_EMAIL       = os.getenv('ADMIN_NOTIFICATION_EMAIL'),
+        ENTERPRISE_PRICE_ID            = os.getenv('ENTERPRISE_PRICE_ID'),
     )
 
     # —— Stripe setup —— #
+    # The SDK itself is imported on first use (app/services/stripe_client.py)
     stripe_key = app.config['STRIPE_SECRET_KEY']
     if not stripe_key:
         raise RuntimeError("STRIPE_SECRET_KEY not set in environment")
-    stripe.api_key = stripe_key
 
     # —— Map plan_keys to Stripe Price IDs —— #
     app.config['STRIPE_PRICE_IDS'] = {
@@ -65,6 +177,7 @@ def create_app():
     if not app.config['JWT_SECRET_KEY']:
         raise RuntimeError("JWT_SECRET_KEY not set in environment")
     jwt.init_app(app)
+    from .services import user_cache  # noqa: F401  (registers the user lookup loader)
 
     # —— Mail setup —— #
     mail.init_app(app)
@@ -77,11 +190,25 @@ def create_app():
     from .routes.chat      import chat_bp
     from .routes.billing   import billing_bp
     from .routes.dashboard import dashboard_bp
+    from .routes.enterprise import bp as enterprise_bp
 
     app.register_blueprint(auth_bp,      url_prefix='/api/auth')
     app.register_blueprint(chat_bp,      url_prefix='/api/chat')
     app.register_blueprint(billing_bp,   url_prefix='/api/billing')
     app.register_blueprint(dashboard_bp)  # includes its own /api/dashboard path
+    app.register_blueprint(enterprise_bp, url_prefix='/api/enterprise')
+
+    # —— Metrics —— #
+    if app.config['METRICS_ENABLED']:
+        from .services import metrics
+        from .routes.metrics import metrics_bp
+        metrics.init_app(app)
+        app.register_blueprint(metrics_bp)  # serves /metrics
+
+    # —— Profiling —— #
+    if app.config['PROFILING_ENABLED']:
+        from .services import profiler
+        profiler.init_app(app)
 
     # Optional sessions blueprint
     try:
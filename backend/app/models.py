@@ -20,8 +20,8 @@ class User(db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
 
     # Stripe integration
-    stripe_customer_id = db.Column(db.String(255), nullable=True)
-    stripe_subscription_id = db.Column(db.String(255), nullable=True)
+    stripe_customer_id = db.Column(db.String(255), nullable=True, index=True)
+    stripe_subscription_id = db.Column(db.String(255), nullable=True, index=True)
 
     # Subscription & seat limits
     subscription_plan = db.Column(
@@ -107,3 +107,396 @@ class User(db.Model):
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
         }
+
+
+class ConversationTurn(db.Model):
+    """
+    One message in a server-side chat conversation. token_count is computed
+    once at insert time so prompt building never re-tokenizes history.
+    """
+    __tablename__ = 'conversation_turns'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(
+        db.String(36),
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False
+    )
+    session_id = db.Column(db.String(255), nullable=False)
+    role = db.Column(db.String(16), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    token_count = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+    __table_args__ = (
+        db.Index('ix_conversation_turns_user_session', 'user_id', 'session_id', 'id'),
+    )
+
+
+class ConversationSummary(db.Model):
+    """
+    Rolling summary of every turn up to and including summarized_through.
+    """
+    __tablename__ = 'conversation_summaries'
+
+    user_id = db.Column(
+        db.String(36),
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    session_id = db.Column(db.String(255), primary_key=True)
+    summary = db.Column(db.Text, nullable=False, default='')
+    token_count = db.Column(db.Integer, nullable=False, default=0)
+    summarized_through = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow
+    )
+
+
+class ChatJob(db.Model):
+    """
+    Queued long-running chat generation. The table doubles as the queue:
+    runners claim rows with a conditional UPDATE and keep heartbeat_at
+    fresh while working, so jobs orphaned by a restart can be re-queued.
+    """
+    __tablename__ = 'chat_jobs'
+
+    id = db.Column(
+        db.String(36),
+        primary_key=True,
+        default=lambda: str(uuid.uuid4())
+    )
+    user_id = db.Column(
+        db.String(36),
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True
+    )
+    # queued -> running -> succeeded | failed
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    payload = db.Column(db.JSON, nullable=False)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    claimed_by = db.Column(db.String(64), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    # Not claimed before this time (set when a rate-limited job backs off)
+    run_after = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_chat_jobs_status_created', 'status', 'created_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class Session(db.Model):
+    """
+    A saved Wizard session. Replaces the per-user JSON files so reads and
+    writes touch one row instead of every session the user owns.
+    """
+    __tablename__ = 'sessions'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # Client-generated id (e.g. "session_1721490000000"), unique per user
+    session_id = db.Column(db.String(255), nullable=False)
+    user_id = db.Column(
+        db.String(36),
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False
+    )
+    name = db.Column(db.String(255), nullable=False, default='')
+    document_type = db.Column(db.String(100), nullable=False, default='')
+    current_phase = db.Column(db.Integer, nullable=False, default=1)
+    notes = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(32), nullable=False, default='in_progress')
+
+    # Bumped on every write; clients send it back as base_version on PATCH
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # Number of chat_history rows, so appends know their next position
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Timestamps
+    created = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow
+    )
+    completed_at = db.Column(db.DateTime, nullable=True)
+    # Set when the analysis credit for this session is reserved
+    charged_at = db.Column(db.DateTime, nullable=True)
+
+    # chat_history lives in session_messages so appends are plain INSERTs;
+    # the FK cascades on delete, so nothing is loaded to delete a session
+    messages = db.relationship(
+        'SessionMessage',
+        order_by='SessionMessage.position',
+        passive_deletes=True,
+        lazy='select'
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'session_id', name='uq_sessions_user_session'),
+        db.Index('ix_sessions_user_timestamp', 'user_id', 'timestamp'),
+        # Filtered listings stay index-ordered by timestamp
+        db.Index('ix_sessions_user_status_timestamp', 'user_id', 'status', 'timestamp'),
+        db.Index('ix_sessions_user_doctype_timestamp', 'user_id', 'document_type', 'timestamp'),
+    )
+
+    def to_dict(self):
+        data = {
+            'session_id': self.session_id,
+            'name': self.name,
+            'document_type': self.document_type,
+            'current_phase': self.current_phase,
+            'chat_history': [m.message for m in self.messages],
+            'notes': self.notes,
+            'created': self.created.isoformat(),
+            'timestamp': self.timestamp.isoformat(),
+            'status': self.status,
+            'user_id': self.user_id,
+            'version': self.version,
+        }
+        if self.completed_at:
+            data['completed_at'] = self.completed_at.isoformat()
+        return data
+
+
+class SessionMessage(db.Model):
+    """One chat_history entry of a Session, stored as its own row"""
+    __tablename__ = 'session_messages'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    session_pk = db.Column(
+        db.Integer,
+        db.ForeignKey('sessions.id', ondelete='CASCADE'),
+        nullable=False
+    )
+    position = db.Column(db.Integer, nullable=False)
+    message = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint('session_pk', 'position', name='uq_session_messages_position'),
+    )
+
+
+class UserAggregate(db.Model):
+    """
+    Per-user dashboard counters, maintained in the same transaction as the
+    session and credit writes that change them. `version` bumps on every
+    change and backs the dashboard/session-list ETags.
+    """
+    __tablename__ = 'user_aggregates'
+
+    user_id = db.Column(
+        db.String(36),
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    pending_count = db.Column(db.Integer, nullable=False, default=0)
+    all_count = db.Column(db.Integer, nullable=False, default=0)
+    doc_type_counts = db.Column(db.JSON, nullable=False, default=dict)
+    credits_used = db.Column(db.Integer, nullable=False, default=0)
+    # Mirrors users.credits_remaining; None = unlimited
+    credits_remaining = db.Column(db.Integer, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow
+    )
+
+
+class UsageLedger(db.Model):
+    """
+    Append-only record of every LLM call: tokens in/out and credits charged.
+    Rows are never updated; reporting reads usage_rollups instead.
+    """
+    __tablename__ = 'usage_ledger'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(
+        db.String(36),
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False
+    )
+    session_id = db.Column(db.String(255), nullable=True)
+    kind = db.Column(db.String(32), nullable=False, default='chat')
+    provider = db.Column(db.String(32), nullable=True)
+    model = db.Column(db.String(100), nullable=True)
+    doc_type = db.Column(db.String(100), nullable=True)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    completion_tokens = db.Column(db.Integer, nullable=False, default=0)
+    total_tokens = db.Column(db.Integer, nullable=False, default=0)
+    credits_charged = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+    __table_args__ = (
+        db.Index('ix_usage_ledger_user_created', 'user_id', 'created_at'),
+        db.Index('ix_usage_ledger_user_session', 'user_id', 'session_id'),
+        db.Index('ix_usage_ledger_created', 'created_at'),
+    )
+
+
+class UsageRollup(db.Model):
+    """Per-user, per-day totals built from usage_ledger by rollup_usage.py"""
+    __tablename__ = 'usage_rollups'
+
+    user_id = db.Column(
+        db.String(36),
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    day = db.Column(db.Date, primary_key=True)
+    calls = db.Column(db.Integer, nullable=False, default=0)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    completion_tokens = db.Column(db.Integer, nullable=False, default=0)
+    credits_charged = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StripeEvent(db.Model):
+    """
+    Inbox of verified Stripe webhook events, keyed by Stripe's event id so
+    redeliveries are dropped on insert. Applied asynchronously, in order
+    per customer, by app/services/stripe_inbox.py.
+    """
+    __tablename__ = 'stripe_events'
+
+    id = db.Column(db.String(255), primary_key=True)
+    type = db.Column(db.String(100), nullable=False)
+    customer_id = db.Column(db.String(255), nullable=True)
+    # Stripe's event.created (epoch seconds); the per-customer apply order
+    created = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    # pending -> processing -> processed | failed
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    claimed_by = db.Column(db.String(64), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    received_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_stripe_events_status_created', 'status', 'created'),
+        db.Index('ix_stripe_events_customer_status', 'customer_id', 'status'),
+    )
+
+
+class StripeCacheEntry(db.Model):
+    """
+    Local copy of a Stripe object (price, checkout session) as the API
+    returned it. Filled lazily, refreshed or dropped by webhook events, and
+    re-fetched once expires_at passes.
+    """
+    __tablename__ = 'stripe_cache'
+
+    id = db.Column(db.String(255), primary_key=True)
+    object = db.Column(db.String(32), nullable=False)
+    # Object this entry depends on (a price's product, a session's
+    # subscription), so events for it can invalidate the entry
+    related_id = db.Column(db.String(255), nullable=True, index=True)
+    data = db.Column(db.Text, nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class EnterpriseApplication(db.Model):
+    """Enterprise plan application from the pricing-page modal"""
+    __tablename__ = 'enterprise_applications'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(255), nullable=False)
+    company_email = db.Column(db.String(255), nullable=False)
+    company_name = db.Column(db.String(255), nullable=False)
+    seats_needed = db.Column(db.String(50), nullable=True)
+    budget_range = db.Column(db.String(100), nullable=True)
+    notes = db.Column(db.Text, nullable=True)
+    checkout_session_id = db.Column(db.String(255), nullable=True)
+    checkout_url = db.Column(db.Text, nullable=True)
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+
+class OutboundEmail(db.Model):
+    """
+    Durable outbound mail queue, drained by app/services/mail_queue.py.
+    `preparer` names a function that fills in the message just before it
+    is sent (e.g. to create a checkout link), with `context` as its input.
+    """
+    __tablename__ = 'outbound_emails'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255), nullable=True)
+    recipients = db.Column(db.JSON, nullable=False)
+    body = db.Column(db.Text, nullable=True)
+    html = db.Column(db.Text, nullable=True)
+    preparer = db.Column(db.String(64), nullable=True)
+    context = db.Column(db.JSON, nullable=True)
+    # queued -> sending -> sent | failed
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    next_attempt_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+    claimed_by = db.Column(db.String(64), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_outbound_emails_status_next_attempt', 'status', 'next_attempt_at'),
+    )
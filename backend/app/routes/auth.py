@@ -1,17 +1,24 @@
 # backend/app/routes/auth.py
 
+import logging
 from flask import Blueprint, request, jsonify, current_app
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, current_user
+from sqlalchemy import update
 from app import db
 from app.models import User
-import stripe
+from app.services import passwords, plans, user_cache
+from app.services.stripe_client import get_stripe
+
+logger = logging.getLogger(__name__)
 
 auth_bp = Blueprint('auth', __name__)
 
-@auth_bp.before_app_request
-def _set_stripe_key():
-    stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
+@auth_bp.errorhandler(passwords.HasherBusy)
+def _hasher_busy(e):
+    response = jsonify(message=str(e))
+    response.status_code = e.status_code
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
 
 @auth_bp.route('/signup', methods=['POST'])
 def signup():
@@ -32,11 +39,13 @@ def signup():
     user = User(
         name          = name,
         email         = email,
-        password_hash = generate_password_hash(password),
+        password_hash = passwords.hash_password(password),
         subscription_plan = plan_key,
         seat_limit    = 1 + extra_seats,
         max_seats     = 1 + extra_seats
     )
+    # Free allowance until a paid plan's checkout completes
+    plans.apply_allowance(user, 'essential')
     db.session.add(user)
     db.session.commit()
 
@@ -59,7 +68,7 @@ def signup():
 
     frontend = current_app.config['FRONTEND_URL'].rstrip('/')
 
-    session = stripe.checkout.Session.create(
+    session = get_stripe().checkout.Session.create(
         payment_method_types=['card'],
         mode='subscription',
         line_items=[{ 'price': price_id, 'quantity': 1 }],
@@ -86,18 +95,37 @@ def login():
         return jsonify(message="Email and password required"), 400
 
     user = User.query.filter_by(email=email).first()
-    if not user or not check_password_hash(user.password_hash, password):
+    if not passwords.verify_password(user.password_hash if user else None, password):
         return jsonify(message="Invalid credentials"), 401
 
+    if passwords.needs_rehash(user.password_hash):
+        _upgrade_hash(user, password)
+
     token = create_access_token(identity=str(user.id))
     return jsonify(token=token, user={ 'id':user.id,'email':user.email,'name':user.name }), 200
 
 
+def _upgrade_hash(user, password):
+    """Re-hash with the current cost; skipped if the password changed meanwhile"""
+    try:
+        db.session.execute(
+            update(User)
+            .where(User.id == user.id, User.password_hash == user.password_hash)
+            .values(password_hash=passwords.hash_password(password))
+            .execution_options(synchronize_session=False)
+        )
+        user_cache.changed(user.id)
+        db.session.commit()
+    except passwords.HasherBusy:
+        # The login already succeeded; upgrade next time
+        pass
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Password hash upgrade failed for user {user.id}: {e}")
+
+
 @auth_bp.route('/me', methods=['GET'])
 @jwt_required()
 def get_current_user():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify(error="User not found"), 404
-    return jsonify(id=user.id, email=user.email, name=user.name), 200
+    # Loaded (usually from cache) by the JWT user lookup; unknown users get a 404 there
+    return jsonify(id=current_user.id, email=current_user.email, name=current_user.name), 200
@@ -1,48 +1,71 @@
 # backend/app/routes/billing.py
 
 import json
+import hashlib
 from flask import Blueprint, request, jsonify, current_app, abort
-from flask_jwt_extended import jwt_required, get_jwt_identity
-import stripe
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
 
 from app import db
 from app.models import User
+from app.services import stripe_cache, stripe_inbox
+from app.services.stripe_client import get_stripe
+from app.services.idempotency import idempotent, request_key
 
 billing_bp = Blueprint('billing', __name__, url_prefix='/api/billing')
 
-@billing_bp.before_app_request
-def _set_stripe_key():
-    stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
-
-
 @billing_bp.route('/plans', methods=['GET'])
 def list_plans():
     """
-    Return your plan_key → Stripe Price ID map for the frontend.
+    Return plan_key → price details (price_id, amount, currency, interval,
+    product) for the frontend, served from the local Stripe cache.
     """
-    return jsonify(current_app.config.get('STRIPE_PRICE_IDS', {})), 200
+    price_ids = current_app.config.get('STRIPE_PRICE_IDS', {})
+    prices = stripe_cache.get_prices(price_ids.values())
+    return jsonify({
+        plan_key: stripe_cache.price_details(price_id, prices.get(price_id))
+        for plan_key, price_id in price_ids.items()
+        if price_id
+    }), 200
+
+
+def _stripe_idempotency_key(*scope):
+    """
+    Forward the client's Idempotency-Key to Stripe too, so a retry that
+    lands on another host still can't create a second object
+    """
+    key = request_key()
+    if not key:
+        return None
+    # Hashed to stay within Stripe's 255-character limit
+    return hashlib.sha256(':'.join([request.endpoint, *scope, key]).encode()).hexdigest()
 
 
 @billing_bp.route('/create-payment-intent', methods=['POST'])
+@idempotent
 def create_payment_intent():
     """
     Legacy one-off PaymentIntent flow (amount in cents).
+    Send an Idempotency-Key header to make retries safe.
     """
+    stripe = get_stripe()
     data = request.get_json() or {}
     amount = int(data.get('amount', 0))
     intent = stripe.PaymentIntent.create(
         amount=amount,
         currency='usd',
+        idempotency_key=_stripe_idempotency_key(),
     )
     return jsonify({ "client_secret": intent.client_secret }), 200
 
 
 @billing_bp.route('/create-checkout-session', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_checkout_session():
     """
     Create a Subscription‐mode Checkout Session.
     Expects { "plan_key": "essential" } in the JSON body.
+    Send an Idempotency-Key header to make retries safe.
     """
     data     = request.get_json() or {}
     plan_key = data.get('plan_key')
@@ -53,6 +76,7 @@ def create_checkout_session():
     if not price_id:
         return jsonify({ "msg": f"Unknown plan_key {plan_key}" }), 400
 
+    stripe = get_stripe()
     user_id = get_jwt_identity()
     frontend = current_app.config.get('FRONTEND_BASE_URL').rstrip('/')
     success_url = f"{frontend}/pricing?session_id={{CHECKOUT_SESSION_ID}}&status=success"
@@ -63,8 +87,11 @@ def create_checkout_session():
         mode='subscription',
         line_items=[{ 'price': price_id, 'quantity': 1 }],
         metadata={ 'user_id': user_id, 'plan_key': plan_key },
+        # Copied onto the subscription so reconcile_stripe.py can match it
+        subscription_data={ 'metadata': { 'user_id': user_id, 'plan_key': plan_key } },
         success_url=success_url,
         cancel_url=cancel_url,
+        idempotency_key=_stripe_idempotency_key(user_id),
     )
     return jsonify({ 'sessionId': session.id }), 200
 
@@ -74,14 +101,15 @@ def get_checkout_session():
     """
     Optional helper: fetch a Checkout Session (expand subscription if you like).
     Frontend can call /api/billing/checkout-session?session_id=...
+    Completed sessions are cached, so repeat polls don't reach Stripe.
     """
     session_id = request.args.get('session_id')
     if not session_id:
         return jsonify({ "msg": "Missing session_id" }), 400
 
+    stripe = get_stripe()
     try:
-        sess = stripe.checkout.Session.retrieve(session_id, expand=['subscription'])
-        return jsonify(sess.to_dict()), 200
+        return jsonify(stripe_cache.get_checkout_session(session_id)), 200
     except stripe.error.StripeError as e:
         return jsonify({ "msg": str(e) }), 400
 
@@ -91,7 +119,12 @@ def stripe_webhook():
     """
     Receive events from Stripe to keep your DB in sync.
     Be sure to set STRIPE_WEBHOOK_SECRET in your .env.
+
+    Events are only verified and stored here (duplicates ignored), then
+    applied in the background by app/services/stripe_inbox.py, so Stripe
+    gets its 200 straight away.
     """
+    stripe     = get_stripe()
     payload    = request.data
     sig_header = request.headers.get('Stripe-Signature')
     secret     = current_app.config.get('STRIPE_WEBHOOK_SECRET')
@@ -101,30 +134,10 @@ def stripe_webhook():
     except (ValueError, stripe.error.SignatureVerificationError):
         return abort(400)
 
-    # ----- handle relevant events -----
-    if event.type == 'checkout.session.completed':
-        sess = event.data.object
-        user = User.query.get(sess.metadata.get('user_id'))
-        if user:
-            user.stripe_customer_id     = sess.customer
-            user.stripe_subscription_id = sess.subscription
-            user.subscription_plan      = sess.metadata.get('plan_key')
-            db.session.commit()
-
-    elif event.type == 'invoice.payment_succeeded':
-        inv = event.data.object
-        # e.g. send receipt, top up credits, etc.
-
-    elif event.type == 'customer.subscription.deleted':
-        sub = event.data.object
-        user = User.query.filter_by(stripe_subscription_id=sub.id).first()
-        if user:
-            # downgrade them or mark inactive
-            user.subscription_plan      = 'essential'
-            user.stripe_subscription_id = None
-            db.session.commit()
-
-    # …add any other handlers you need…
+    if stripe_inbox.store(event, payload):
+        consumer = stripe_inbox.ensure_consumer(current_app._get_current_object())
+        if consumer:
+            consumer.wake()
 
     return '', 200
 
@@ -135,13 +148,15 @@ def cancel_subscription():
     """
     Cancel the logged‐in user’s active subscription.
     """
-    user = User.query.get(get_jwt_identity())
-    if not user or not user.stripe_subscription_id:
+    # The cached snapshot answers the common "nothing to cancel" case
+    if not current_user.stripe_subscription_id:
         return jsonify({ "msg": "No active subscription" }), 400
 
+    stripe = get_stripe()
     try:
         # Cancel at period end:
-        stripe.Subscription.modify(user.stripe_subscription_id, cancel_at_period_end=True)
+        stripe.Subscription.modify(current_user.stripe_subscription_id, cancel_at_period_end=True)
+        user = db.session.get(User, current_user.id)
         user.subscription_plan = 'essential'
         db.session.commit()
     except stripe.error.StripeError as e:
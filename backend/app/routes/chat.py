@@ -1,35 +1,165 @@
 # app/routes/chat.py
 
 import os
-import openai
-from flask import Blueprint, request, jsonify, current_app
+import json
+import time
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import logging
 
+from app.services.llm_gateway import get_gateway, LLMError
+from app.services.response_cache import get_response_cache, cache_key
+from app.services.semantic_cache import get_semantic_cache
+from app import db
+from app.models import ChatJob
+from app.services import conversation, chat_pipeline, jobs, metering
+from app.services.admission import admission_controlled
+from app.services.idempotency import idempotent, stream_failed
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 chat_bp = Blueprint('chat', __name__)
 
-# Initialize OpenAI client
-def get_openai_client():
-    api_key = current_app.config.get('OPENAI_API_KEY')
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not found in configuration")
-    return openai.OpenAI(api_key=api_key)
+def _sse(data, event=None):
+    """Format a single Server-Sent Event frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+def _wants_stream(payload):
+    """Streaming is opt-in: either {"stream": true} or an SSE Accept header"""
+    if payload.get('stream'):
+        return True
+    return request.accept_mimetypes.best == 'text/event-stream'
+
+def _sse_response(frames):
+    return Response(
+        frames,
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # stop nginx buffering the stream
+        }
+    )
+
+def _bypass_cache(payload):
+    """Users can ask for a fresh answer with {"noCache": true} or Cache-Control: no-cache"""
+    if payload.get('noCache'):
+        return True
+    return 'no-cache' in request.headers.get('Cache-Control', '')
+
+def _replay_cached(cached, stream, cache_status='hit'):
+    """Serve a cached reply in whichever shape the client asked for"""
+    body = {
+        'success': True,
+        'reply': cached['reply'],
+        'provider': cached['provider'],
+        'model': cached['model'],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        'cache': cache_status
+    }
+    if stream:
+        def frames():
+            yield _sse({'delta': cached['reply']})
+            done = dict(body)
+            del done['reply']
+            yield _sse(done, event='done')
+        response = _sse_response(frames())
+    else:
+        response = jsonify(body)
+    response.headers['X-Cache'] = cache_status
+    return response
+
+def _relay_stream(stream, current_user_id, cache_status, on_complete=None,
+                  on_error=None, on_cancel=None):
+    """
+    Relay LLM deltas to the client as SSE, finishing with a `done` event
+    that carries the usage block. If the client goes away the WSGI server
+    closes this generator, and closing the upstream stream drops the HTTP
+    connection so the provider stops generating.
+
+    on_complete(reply, provider, model, usage) runs after a full reply,
+    on_error() after a failed one and on_cancel(provider, model, usage)
+    after a disconnect.
+    """
+    parts = []
+    try:
+        for delta in stream:
+            parts.append(delta)
+            yield _sse({'delta': delta})
+
+        logger.info(f"{stream.provider} stream finished for user {current_user_id}")
+        if on_complete:
+            on_complete(''.join(parts), stream.provider, stream.model, stream.usage)
+        yield _sse({
+            'success': True,
+            'provider': stream.provider,
+            'model': stream.model,
+            'usage': stream.usage,
+            'cache': cache_status
+        }, event='done')
+
+    except GeneratorExit:
+        logger.info(f"Client disconnected, cancelling stream for user {current_user_id}")
+        if on_cancel:
+            on_cancel(stream.provider, stream.model, stream.usage)
+        raise
+
+    except LLMError as e:
+        logger.error(f"LLM stream error: {e}")
+        stream_failed()
+        if on_error:
+            on_error()
+        yield _sse({'error': str(e)}, event='error')
+
+    except Exception as e:
+        logger.error(f"Unexpected stream error: {e}")
+        stream_failed()
+        if on_error:
+            on_error()
+        yield _sse({'error': f'Unexpected error: {str(e)}'}, event='error')
+
+    finally:
+        stream.close()
 
 @chat_bp.route('/chat', methods=['POST'], strict_slashes=False)
 @jwt_required()
+@idempotent
+@admission_controlled
 def chat():
     """
     Handle chat requests from the Wizard component
-    Updated from basic echo to full OpenAI integration
+    Routed through the LLM gateway (OpenAI or Claude, chosen per docType)
+
+    Send {"stream": true} (or Accept: text/event-stream) to receive the
+    reply as Server-Sent Events instead of a single JSON body.
+
+    Identical requests are answered from the response cache and near
+    duplicates from the semantic cache; send {"noCache": true} to force a
+    fresh answer.
+
+    Pass a session_id to have the server keep the conversation: earlier
+    turns are replayed (recent ones verbatim, older ones summarized) within
+    a fixed token budget.
+
+    Send {"async": true} for long generations: the request is queued and a
+    job_id returned immediately (202); poll /api/chat/jobs/<job_id>.
+
+    The first generation in a saved session (other calls: every generation)
+    costs CHAT_CREDIT_COST credits (402 when none are left); cached replies
+    are free and failed generations are refunded. Token usage goes to the usage ledger.
+
+    Requests are admitted per user (concurrency and rate limits); over the
+    limit they queue briefly, then get 429 with Retry-After.
+
+    Send an Idempotency-Key header to make retries safe: a retry waits for
+    the original request and gets its response replayed.
     """
     try:
         # Get current user
         current_user_id = get_jwt_identity()
-        
+
         # Get request data
         payload = request.get_json() or {}
         user_message = payload.get('message', '').strip()
@@ -37,78 +167,157 @@ def chat():
         detailed = payload.get('detailed', True)
         system_prompt = payload.get('systemPrompt', '')
         phase = payload.get('phase', 1)
-        
+        session_id = payload.get('session_id') or payload.get('sessionId')
+        stream = _wants_stream(payload)
+
         if not user_message:
             return jsonify({'error': 'Message is required'}), 400
-        
+        if stream and payload.get('async'):
+            return jsonify({'error': 'stream and async cannot be combined'}), 400
+
         # If no system prompt provided, use a default one
         if not system_prompt:
             system_prompt = "You are a helpful business analyst assistant. Provide detailed, professional advice."
-        
-        logger.info(f"Chat request from user {current_user_id}: doc_type={doc_type}, phase={phase}, detailed={detailed}")
-        
-        # Initialize OpenAI client
-        client = get_openai_client()
-        
-        # Prepare messages for OpenAI
-        messages = [
-            {
-                "role": "system",
-                "content": system_prompt
-            },
-            {
-                "role": "user", 
-                "content": user_message
-            }
-        ]
-        
-        # Make request to OpenAI
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o",  # Use GPT-4o or gpt-4-turbo
-                messages=messages,
-                max_tokens=2000,
-                temperature=0.7,
-                top_p=1,
-                frequency_penalty=0,
-                presence_penalty=0
+
+        logger.info(f"Chat request from user {current_user_id}: doc_type={doc_type}, phase={phase}, detailed={detailed}, stream={stream}")
+
+        # Shared, pooled gateway for this worker
+        gateway = get_gateway()
+
+        # Prepare messages for the LLM
+        has_history = False
+        if session_id:
+            messages, has_history = conversation.build_messages(
+                current_user_id, session_id, system_prompt, user_message
             )
-            
-            # Extract the reply
-            if response.choices and len(response.choices) > 0:
-                reply = response.choices[0].message.content
-                
-                logger.info(f"OpenAI response received for user {current_user_id}")
-                
-                return jsonify({
-                    'success': True,
-                    'reply': reply,
-                    'usage': {
-                        'prompt_tokens': response.usage.prompt_tokens if response.usage else 0,
-                        'completion_tokens': response.usage.completion_tokens if response.usage else 0,
-                        'total_tokens': response.usage.total_tokens if response.usage else 0
-                    }
-                })
-            else:
-                logger.error("No choices in OpenAI response")
-                return jsonify({'error': 'No response from AI'}), 500
-                
-        except openai.RateLimitError as e:
-            logger.error(f"OpenAI rate limit error: {e}")
-            return jsonify({'error': 'Rate limit exceeded. Please try again later.'}), 429
-            
-        except openai.AuthenticationError as e:
-            logger.error(f"OpenAI authentication error: {e}")
-            return jsonify({'error': 'API authentication failed. Please check your OpenAI API key.'}), 500
-            
-        except openai.APIError as e:
-            logger.error(f"OpenAI API error: {e}")
-            return jsonify({'error': f'API error: {str(e)}'}), 500
-            
+        else:
+            messages = [
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": user_message
+                }
+            ]
+
+        ctx = {
+            'user_id': current_user_id,
+            'session_id': session_id,
+            'user_message': user_message,
+            'doc_type': doc_type,
+            'messages': messages,
+            'max_tokens': 2000,
+            'temperature': 0.7,
+            'cache_key': None,
+            'namespace': None,
+            'audited': None,
+            'credits_charged': 0
+        }
+
+        # Exact-match cache, keyed on the primary target for this docType
+        cache = get_response_cache()
+        cache_status = 'bypass' if _bypass_cache(payload) else 'miss'
+        if cache is not None:
+            provider, model = gateway.route(doc_type)[0]
+            ctx['cache_key'] = cache_key(f'{provider}:{model}', messages, ctx['temperature'], ctx['max_tokens'])
+            if cache_status == 'miss':
+                cached = cache.get(ctx['cache_key'])
+                if cached:
+                    logger.info(f"Response cache hit for user {current_user_id}")
+                    chat_pipeline.remember(ctx, cached['reply'])
+                    return _replay_cached(cached, stream)
+
+        # Near-duplicate cache, scoped to this docType, phase and system prompt.
+        # Skipped once a conversation has history, since the message alone
+        # no longer determines the answer.
+        semantic = None if has_history else get_semantic_cache()
+        if semantic is not None:
+            ctx['namespace'] = semantic.namespace(doc_type, phase, system_prompt)
+            if cache_status == 'miss':
+                match = semantic.lookup(ctx['namespace'], user_message)
+                if match:
+                    entry_id, cached, similarity, audit = match
+                    if not audit:
+                        logger.info(f"Semantic cache hit for user {current_user_id} (similarity={similarity:.2f})")
+                        chat_pipeline.remember(ctx, cached['reply'])
+                        return _replay_cached(cached, stream, 'semantic')
+                    # Sampled audit: answer fresh and compare afterwards
+                    ctx['audited'] = {'entry_id': entry_id, 'reply': cached['reply'], 'pid': os.getpid()}
+
+        # Reserve credits before spending tokens; cache hits above are free
+        try:
+            ctx['credits_charged'] = metering.reserve(current_user_id, session_id, doc_type)
+        except metering.InsufficientCredits as e:
+            logger.info(f"User {current_user_id} is out of credits")
+            return jsonify({'error': str(e)}), e.status_code
+
+        def store(reply, provider, model, usage):
+            chat_pipeline.record_usage(ctx, usage, provider, model)
+            chat_pipeline.store_reply(ctx, reply, provider, model)
+
+        def refund():
+            try:
+                chat_pipeline.refund(ctx)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Credit refund failed for user {current_user_id}: {e}")
+
+        def cancelled(provider, model, usage):
+            # The provider already billed us for what it generated
+            chat_pipeline.record_usage(ctx, usage, provider, model)
+
+        # Background job mode: accept now, generate on a job runner
+        if payload.get('async'):
+            job = jobs.enqueue(current_user_id, ctx)
+            jobs.ensure_runner(current_app._get_current_object())
+            logger.info(f"Queued chat job {job.id} for user {current_user_id}")
+            return jsonify({
+                'success': True,
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': f'/api/chat/jobs/{job.id}',
+                'cache': cache_status
+            }), 202
+
+        # Make request through the gateway
+        try:
+            if stream:
+                # Open the upstream stream before responding so auth and
+                # rate-limit failures still map to proper HTTP status codes
+                upstream = gateway.stream(doc_type, messages, max_tokens=ctx['max_tokens'], temperature=ctx['temperature'])
+                response = _sse_response(stream_with_context(
+                    _relay_stream(upstream, current_user_id, cache_status, store, refund, cancelled)
+                ))
+                response.headers['X-Cache'] = cache_status
+                return response
+
+            completion = chat_pipeline.run_completion(ctx)
+
+            logger.info(f"{completion.provider} response received for user {current_user_id}")
+
+            response = jsonify({
+                'success': True,
+                'reply': completion.text,
+                'provider': completion.provider,
+                'model': completion.model,
+                'usage': completion.usage,
+                'cache': cache_status
+            })
+            response.headers['X-Cache'] = cache_status
+            return response
+
+        except LLMError as e:
+            logger.error(f"LLM error ({type(e).__name__}): {e}")
+            refund()
+            return jsonify({'error': str(e)}), e.status_code
+
         except Exception as e:
-            logger.error(f"Unexpected OpenAI error: {e}")
+            logger.error(f"Unexpected LLM error: {e}")
+            refund()
             return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
-    
+
     except Exception as e:
         logger.error(f"Chat endpoint error: {e}")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
@@ -130,31 +339,77 @@ def test_chat():
     """
     return jsonify({
         'message': 'Chat route is working',
-        'openai_configured': bool(current_app.config.get('OPENAI_API_KEY'))
+        'openai_configured': bool(current_app.config.get('OPENAI_API_KEY')),
+        'claude_configured': bool(current_app.config.get('CLAUDE_API_KEY'))
+    })
+
+@chat_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_chat_job(job_id):
+    """
+    Poll a background generation. ?wait=N (max 25s) holds the request until
+    the job finishes or N seconds pass, so clients can long-poll instead of
+    hammering the endpoint.
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        wait = min(max(request.args.get('wait', 0, type=float), 0), 25)
+        deadline = time.monotonic() + wait
+
+        # Make sure someone in this process is working the queue
+        jobs.ensure_runner(current_app._get_current_object())
+
+        while True:
+            job = db.session.get(ChatJob, job_id)
+            if not job or job.user_id != current_user_id:
+                return jsonify({'error': 'Job not found'}), 404
+            if job.status in jobs.FINISHED or time.monotonic() >= deadline:
+                return jsonify({'success': True, 'job': job.to_dict()})
+            db.session.expire_all()
+            time.sleep(0.5)
+
+    except Exception as e:
+        logger.error(f"Error fetching chat job {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@chat_bp.route('/cache/stats', methods=['GET'])
+@jwt_required()
+def get_cache_stats():
+    """
+    Hit rates for the exact and near-duplicate caches on this worker
+    """
+    exact = get_response_cache()
+    semantic = get_semantic_cache()
+    return jsonify({
+        'success': True,
+        'exact': exact.stats() if exact else None,
+        'semantic': semantic.stats() if semantic else None
     })
 
 @chat_bp.route('/models', methods=['GET'])
 @jwt_required()
 def get_available_models():
     """
-    Get available OpenAI models
+    Get available chat models from every configured provider
     """
     try:
-        client = get_openai_client()
-        models = client.models.list()
-        
+        by_provider = get_gateway().list_models()
+
         # Filter for chat models
         chat_models = [
-            model.id for model in models.data 
-            if 'gpt' in model.id.lower() and any(x in model.id for x in ['3.5', '4'])
+            model_id for model_id in by_provider.get('openai', [])
+            if 'gpt' in model_id.lower() and any(x in model_id for x in ['3.5', '4'])
         ]
-        
+        chat_models += [
+            model_id for model_id in by_provider.get('anthropic', [])
+            if model_id.startswith('claude')
+        ]
+
         return jsonify({
             'success': True,
             'models': sorted(chat_models)
         })
-        
+
     except Exception as e:
         logger.error(f"Error fetching models: {e}")
         return jsonify({'error': str(e)}), 500
-
@@ -1,61 +1,77 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import User
+from sqlalchemy.orm import load_only
+from app.models import Session
 from app import db
+from app.services import aggregates
+from app.services.conditional import make_etag, is_not_modified, not_modified_response, etagged_json
 from datetime import datetime, timedelta
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+RECENT_SESSIONS = 5
+
+def plan_info(agg):
+    """Credit usage for the plan card; credits_remaining None means unlimited"""
+    if agg.credits_remaining is None:
+        return {
+            'used': agg.credits_used,
+            'limit': None,
+            'remaining': None,
+            'percentRemaining': 100
+        }
+    limit = agg.credits_used + agg.credits_remaining
+    return {
+        'used': agg.credits_used,
+        'limit': limit,
+        'remaining': agg.credits_remaining,
+        'percentRemaining': round(100 * agg.credits_remaining / limit) if limit else 0
+    }
+
 @dashboard_bp.route('/api/dashboard', methods=['GET'])
 @jwt_required()
 def get_dashboard_data():
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        
-        if not user:
+
+        # One primary-key read; the aggregate row is kept current by the
+        # session and credit write paths
+        agg = aggregates.get(current_user_id)
+        if not agg:
             return jsonify({'error': 'User not found'}), 404
 
-        # Mock data for now - you can replace with real database queries later
+        etag = make_etag('dashboard', current_user_id, agg.version)
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+
+        recent = (
+            Session.query
+            .filter_by(user_id=current_user_id)
+            .options(load_only(Session.session_id, Session.name, Session.created, Session.status))
+            .order_by(Session.timestamp.desc())
+            .limit(RECENT_SESSIONS)
+            .all()
+        )
+
         dashboard_data = {
             'sessions': [
                 {
-                    'id': 1,
-                    'name': 'Market Analysis Q1',
-                    'created_at': '2025-01-15',
-                    'status': 'completed'
-                },
-                {
-                    'id': 2,
-                    'name': 'SWOT Analysis - Product Launch',
-                    'created_at': '2025-01-10',
-                    'status': 'in_progress'
-                },
-                {
-                    'id': 3,
-                    'name': 'Gap Analysis - Customer Service',
-                    'created_at': '2025-01-05',
-                    'status': 'completed'
+                    'id': s.session_id,
+                    'name': s.name,
+                    'created_at': s.created.date().isoformat(),
+                    'status': s.status
                 }
+                for s in recent
             ],
             'metrics': {
-                'pending': 1,  # Sessions in progress
-                'all': 3       # Total sessions
-            },
-            'docTypeCounts': {
-                'market_analysis': 1,
-                'swot_analysis': 1,
-                'gap_analysis': 1
+                'pending': agg.pending_count,  # Sessions in progress
+                'all': agg.all_count           # Total sessions
             },
-            'planInfo': {
-                'used': 25,
-                'limit': 100,
-                'remaining': 75,
-                'percentRemaining': 75
-            }
+            'docTypeCounts': agg.doc_type_counts,
+            'planInfo': plan_info(agg)
         }
-        
-        return jsonify(dashboard_data), 200
-        
+
+        return etagged_json(dashboard_data, etag)
+
     except Exception as e:
         return jsonify({'error': 'Failed to fetch dashboard data'}), 500
@@ -0,0 +1,62 @@
+# app/routes/metrics.py
+
+import hmac
+import logging
+
+from flask import Blueprint, Response, current_app, jsonify, request
+from sqlalchemy import func
+
+from app import db
+from app.models import ChatJob, StripeEvent
+from app.services import mail_queue, metrics
+
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def _backlog_gauges():
+    """Shared queue depths, straight from the database"""
+    lines = []
+    stats = mail_queue.stats()
+    lines += metrics.render_family(
+        'mail_queue_messages', 'gauge', 'Outbound emails by status',
+        [({'status': s}, stats[s]) for s in mail_queue.UNSENT],
+    )
+    lines += metrics.render_family(
+        'mail_queue_oldest_due_seconds', 'gauge', 'Age of the oldest email waiting to be sent',
+        [({}, stats['oldest_due_seconds'])],
+    )
+    for name, model, statuses, documentation in (
+        ('stripe_events_backlog', StripeEvent, ('pending', 'processing'), 'Stripe webhook events not yet applied'),
+        ('chat_jobs_backlog', ChatJob, ('queued', 'running'), 'Background chat jobs not yet finished'),
+    ):
+        # Only unfinished rows, which the (status, created) indexes keep cheap to count
+        counts = dict(
+            db.session.query(model.status, func.count())
+            .filter(model.status.in_(statuses))
+            .group_by(model.status)
+            .all()
+        )
+        lines += metrics.render_family(name, 'gauge', documentation,
+                                       [({'status': status}, counts.get(status, 0)) for status in statuses])
+    return lines
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def scrape():
+    """
+    Prometheus exposition for every worker on this box. Set METRICS_TOKEN
+    to require `Authorization: Bearer <token>`.
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    lines = metrics.REGISTRY.render()
+    try:
+        lines += _backlog_gauges()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to read queue depths for metrics: {e}")
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -2,117 +2,351 @@
 
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from datetime import datetime, timezone
+import base64
 import json
-import os
-from datetime import datetime
 import logging
 
+from sqlalchemy import and_, delete, insert, or_, update
+from sqlalchemy.orm import load_only, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import db
+from app.models import Session, SessionMessage
+from app.services import aggregates, metrics
+from app.services.json_patch import apply_patch, JsonPatchError
+from app.services.conditional import (
+    make_etag, is_not_modified, precondition_failed,
+    not_modified_response, etagged_json, conflict_response
+)
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 sessions_bp = Blueprint('sessions', __name__)
 
-# Simple file-based storage for sessions (you can replace with database later)
-SESSIONS_DIR = 'sessions_data'
+@sessions_bp.after_request
+def _count_store_bytes(response):
+    """Session payload bytes moved to and from the store, for /metrics"""
+    if response.status_code < 300:
+        if request.method in ('POST', 'PATCH'):
+            metrics.SESSION_STORE_BYTES.inc(request.content_length or 0, op='write')
+        elif request.method == 'GET' and not response.is_streamed:
+            metrics.SESSION_STORE_BYTES.inc(response.calculate_content_length() or 0, op='read')
+    return response
 
-def ensure_sessions_dir():
-    """Ensure the sessions directory exists"""
-    if not os.path.exists(SESSIONS_DIR):
-        os.makedirs(SESSIONS_DIR)
+# Listing projection: the list view only needs these
+SUMMARY_FIELDS = (
+    'session_id', 'name', 'document_type', 'status', 'current_phase',
+    'created', 'timestamp', 'completed_at', 'version', 'message_count'
+)
+FULL_FIELDS = SUMMARY_FIELDS + ('notes', 'chat_history')
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
 
-def get_user_sessions_file(user_id):
-    """Get the sessions file path for a user"""
-    ensure_sessions_dir()
-    return os.path.join(SESSIONS_DIR, f'user_{user_id}_sessions.json')
+def parse_timestamp(value):
+    """Parse a client ISO-8601 string into a naive UTC datetime (None if invalid)"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
 
-def load_user_sessions(user_id):
-    """Load sessions for a user"""
-    sessions_file = get_user_sessions_file(user_id)
-    if os.path.exists(sessions_file):
-        try:
-            with open(sessions_file, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Error loading sessions for user {user_id}: {e}")
-            return {}
-    return {}
-
-def save_user_sessions(user_id, sessions):
-    """Save sessions for a user"""
-    sessions_file = get_user_sessions_file(user_id)
+def get_user_session(user_id, session_id):
+    """Load one session row via the (user_id, session_id) unique index"""
+    return Session.query.filter_by(user_id=user_id, session_id=session_id).first()
+
+def session_etag(session):
+    return make_etag('session', session.id, session.version)
+
+def bump_version(session, **values):
+    """
+    Increment the version (and set `values`) in one UPDATE. When the client
+    sent If-Match it is conditional on the version this request checked, so
+    of two writers holding the same ETag only one gets through. Returns the
+    new version, or None if another write got there first.
+    """
+    query = update(Session).where(Session.id == session.id)
+    if request.if_match:
+        query = query.where(Session.version == session.version)
+    version = db.session.execute(
+        query
+        .values(version=Session.version + 1, **values)
+        .returning(Session.version)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if version is not None:
+        set_committed_value(session, 'version', version)
+    return version
+
+def lost_race(session):
+    """412 for a write that lost to a concurrent one, with the current ETag"""
+    db.session.rollback()
+    current = db.session.query(Session.version).filter_by(id=session.id).scalar()
+    return conflict_response(make_etag('session', session.id, current))
+
+def encode_cursor(session):
+    raw = json.dumps([session.timestamp.isoformat(), session.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Return (timestamp, id) from an opaque cursor; ValueError if malformed"""
+    padded = cursor + '=' * (-len(cursor) % 4)
     try:
-        with open(sessions_file, 'w') as f:
-            json.dump(sessions, f, indent=2)
-        return True
-    except Exception as e:
-        logger.error(f"Error saving sessions for user {user_id}: {e}")
-        return False
+        timestamp, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(timestamp), int(pk)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def parse_fields(raw):
+    """?fields=summary (default) | full | comma-separated list"""
+    if not raw or raw == 'summary':
+        return SUMMARY_FIELDS
+    if raw == 'full':
+        return FULL_FIELDS
+    fields = tuple(f.strip() for f in raw.split(',') if f.strip())
+    unknown = [f for f in fields if f not in FULL_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ('session_id',) + tuple(f for f in fields if f != 'session_id')
+
+def project(session, fields):
+    data = {}
+    for field in fields:
+        if field == 'chat_history':
+            data[field] = [m.message for m in session.messages]
+        else:
+            value = getattr(session, field)
+            data[field] = value.isoformat() if isinstance(value, datetime) else value
+    return data
+
+def insert_messages(session_pk, start, messages):
+    """Bulk-insert chat_history entries at positions start, start+1, ..."""
+    if not messages:
+        return
+    now = datetime.utcnow()
+    db.session.execute(insert(SessionMessage), [
+        {'session_pk': session_pk, 'position': start + i, 'message': m, 'created_at': now}
+        for i, m in enumerate(messages)
+    ])
 
 @sessions_bp.route('', methods=['POST'])
 @jwt_required()
 def save_session():
     """
-    Save a session
+    Save a session (full document). Prefer PATCH /<session_id> for
+    autosaves, which only sends what changed.
     """
     try:
         current_user_id = get_jwt_identity()
         data = request.get_json()
-        
+
         if not data:
             return jsonify({'error': 'No data provided'}), 400
-        
+
         session_id = data.get('session_id')
         if not session_id:
             return jsonify({'error': 'Session ID is required'}), 400
-        
-        # Load existing sessions
-        sessions = load_user_sessions(current_user_id)
-        
-        # Add/update session
-        sessions[session_id] = {
-            'session_id': session_id,
-            'name': data.get('name', ''),
-            'document_type': data.get('document_type', ''),
-            'current_phase': data.get('current_phase', 1),
-            'chat_history': data.get('chat_history', []),
-            'notes': data.get('notes', {}),
-            'created': data.get('created', datetime.now().isoformat()),
-            'timestamp': datetime.now().isoformat(),
-            'status': data.get('status', 'in_progress'),
-            'user_id': current_user_id
-        }
-        
-        # Save sessions
-        if save_user_sessions(current_user_id, sessions):
-            logger.info(f"Session {session_id} saved for user {current_user_id}")
-            return jsonify({'success': True, 'session_id': session_id})
+
+        # Add/update just this session's row
+        session = get_user_session(current_user_id, session_id)
+        before = None
+        if session is None:
+            session = Session(
+                session_id=session_id,
+                user_id=current_user_id,
+                created=parse_timestamp(data.get('created')) or datetime.utcnow()
+            )
+            db.session.add(session)
+            db.session.flush()
         else:
-            return jsonify({'error': 'Failed to save session'}), 500
-            
+            if precondition_failed(session_etag(session)):
+                return conflict_response(session_etag(session))
+            before = (session.document_type, session.status)
+            if bump_version(session) is None:
+                return lost_race(session)
+            SessionMessage.query.filter_by(session_pk=session.id).delete(synchronize_session=False)
+
+        chat_history = data.get('chat_history', [])
+        session.name = data.get('name', '')
+        session.document_type = data.get('document_type', '')
+        session.current_phase = data.get('current_phase', 1)
+        session.notes = data.get('notes', {})
+        session.status = data.get('status', 'in_progress')
+        if session.status == 'completed' and (before is None or before[1] != 'completed'):
+            session.completed_at = datetime.utcnow()
+        session.message_count = len(chat_history)
+        session.timestamp = datetime.utcnow()
+        insert_messages(session.id, 0, chat_history)
+        aggregates.session_changed(current_user_id, before, (session.document_type, session.status))
+
+        db.session.commit()
+        logger.info(f"Session {session_id} saved for user {current_user_id}")
+        return etagged_json(
+            {'success': True, 'session_id': session_id, 'version': session.version},
+            session_etag(session)
+        )
+
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error saving session: {e}")
         return jsonify({'error': str(e)}), 500
 
+@sessions_bp.route('/<session_id>', methods=['PATCH'])
+@jwt_required()
+def patch_session(session_id):
+    """
+    Apply an incremental update to a session. JSON payload:
+      {
+        "base_version": 7,                       # version the client last saw
+        "append": [ {chat turn}, ... ],          # new chat_history entries
+        "notes": [ {"op": "replace", "path": "/phase1", "value": "..."} ],
+        "current_phase": 2,                      # optional scalar updates
+        "name": "...", "status": "..."
+      }
+    Only the appended turns and the touched columns are written. A stale
+    base_version gets 409 with the current version so the client can rebase.
+    An If-Match header may be sent instead of base_version (412 on mismatch).
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        data = request.get_json() or {}
+
+        base_version = data.get('base_version')
+        if not isinstance(base_version, int) and not request.if_match:
+            return jsonify({'error': 'base_version or If-Match is required'}), 400
+        append = data.get('append') or []
+        if not isinstance(append, list):
+            return jsonify({'error': 'append must be a list of chat turns'}), 400
+
+        session = get_user_session(current_user_id, session_id)
+        if session is None:
+            return jsonify({'error': 'Session not found'}), 404
+        if precondition_failed(session_etag(session)):
+            return conflict_response(session_etag(session))
+        if not isinstance(base_version, int):
+            base_version = session.version
+        if session.version != base_version:
+            return jsonify({'error': 'Version conflict', 'version': session.version}), 409
+
+        values = {
+            'version': Session.version + 1,
+            'message_count': Session.message_count + len(append),
+            'timestamp': datetime.utcnow()
+        }
+        if data.get('notes'):
+            values['notes'] = apply_patch(session.notes or {}, data['notes'])
+        for field in ('current_phase', 'name', 'status'):
+            if field in data:
+                values[field] = data[field]
+        if values.get('status') == 'completed' and session.status != 'completed':
+            values['completed_at'] = values['timestamp']
+
+        # Conditional on the version we checked, so concurrent patches can't interleave
+        updated = db.session.execute(
+            update(Session)
+            .where(Session.id == session.id, Session.version == base_version)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if updated != 1:
+            db.session.rollback()
+            current = db.session.query(Session.version).filter_by(id=session.id).scalar()
+            return jsonify({'error': 'Version conflict', 'version': current}), 409
+
+        insert_messages(session.id, session.message_count, append)
+        aggregates.session_changed(
+            current_user_id,
+            (session.document_type, session.status),
+            (session.document_type, values.get('status', session.status))
+        )
+        db.session.commit()
+
+        logger.info(f"Session {session_id} patched to v{base_version + 1} for user {current_user_id}")
+        return etagged_json(
+            {'success': True, 'session_id': session_id, 'version': base_version + 1},
+            make_etag('session', session.id, base_version + 1)
+        )
+
+    except JsonPatchError as e:
+        db.session.rollback()
+        return jsonify({'error': f'Invalid notes patch: {e}'}), 400
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error patching session {session_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @sessions_bp.route('', methods=['GET'])
 @jwt_required()
 def get_sessions():
     """
-    Get all sessions for the current user
+    List the current user's sessions, newest first, one page at a time.
+    Query params:
+      limit          page size (default 50, max 200)
+      cursor         next_cursor from the previous page
+      status         filter, e.g. in_progress / completed
+      document_type  filter, e.g. market_analysis
+      fields         summary (default), full, or a comma-separated list
     """
     try:
         current_user_id = get_jwt_identity()
-        sessions = load_user_sessions(current_user_id)
-        
-        # Convert to list and sort by timestamp
-        sessions_list = list(sessions.values())
-        sessions_list.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        
-        return jsonify({
+
+        try:
+            fields = parse_fields(request.args.get('fields'))
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+
+        # Keyset pagination on (timestamp, id), served by the user/timestamp indexes
+        query = Session.query.filter(Session.user_id == current_user_id)
+        if request.args.get('status'):
+            query = query.filter(Session.status == request.args['status'])
+        if request.args.get('document_type'):
+            query = query.filter(Session.document_type == request.args['document_type'])
+        if after:
+            timestamp, pk = after
+            query = query.filter(or_(
+                Session.timestamp < timestamp,
+                and_(Session.timestamp == timestamp, Session.id < pk)
+            ))
+
+        # Every session write bumps the user's aggregate version, so one
+        # primary-key read decides whether the page can have changed
+        agg = aggregates.get(current_user_id)
+        etag = make_etag('sessions', current_user_id, agg.version if agg else 0,
+                         request.query_string.decode())
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+
+        # Only load the columns the projection needs
+        columns = [getattr(Session, f) for f in fields if f != 'chat_history']
+        query = query.options(load_only(Session.id, Session.timestamp, *columns))
+        if 'chat_history' in fields:
+            query = query.options(selectinload(Session.messages))
+
+        page = (
+            query
+            .order_by(Session.timestamp.desc(), Session.id.desc())
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        return etagged_json({
             'success': True,
-            'sessions': sessions_list
-        })
-        
+            'sessions': [project(s, fields) for s in page],
+            'next_cursor': encode_cursor(page[-1]) if has_more else None
+        }, etag)
+
     except Exception as e:
         logger.error(f"Error getting sessions: {e}")
         return jsonify({'error': str(e)}), 500
@@ -125,16 +359,20 @@ def get_session(session_id):
     """
     try:
         current_user_id = get_jwt_identity()
-        sessions = load_user_sessions(current_user_id)
-        
-        if session_id not in sessions:
+        session = get_user_session(current_user_id, session_id)
+
+        if session is None:
             return jsonify({'error': 'Session not found'}), 404
-        
-        return jsonify({
+
+        etag = session_etag(session)
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+
+        return etagged_json({
             'success': True,
-            'session': sessions[session_id]
-        })
-        
+            'session': session.to_dict()
+        }, etag)
+
     except Exception as e:
         logger.error(f"Error getting session {session_id}: {e}")
         return jsonify({'error': str(e)}), 500
@@ -147,30 +385,30 @@ def complete_session():
     """
     try:
         current_user_id = get_jwt_identity()
-        data = request.get_json()
-        
+        data = request.get_json() or {}
+
         session_id = data.get('session_id')
         if not session_id:
             return jsonify({'error': 'Session ID is required'}), 400
-        
-        # Load existing sessions
-        sessions = load_user_sessions(current_user_id)
-        
-        if session_id not in sessions:
+
+        session = get_user_session(current_user_id, session_id)
+        if session is None:
             return jsonify({'error': 'Session not found'}), 404
-        
+        if precondition_failed(session_etag(session)):
+            return conflict_response(session_etag(session))
+
         # Update session status
-        sessions[session_id]['status'] = 'completed'
-        sessions[session_id]['completed_at'] = datetime.now().isoformat()
-        
-        # Save sessions
-        if save_user_sessions(current_user_id, sessions):
-            logger.info(f"Session {session_id} marked as completed for user {current_user_id}")
-            return jsonify({'success': True})
-        else:
-            return jsonify({'error': 'Failed to update session'}), 500
-            
+        before = (session.document_type, session.status)
+        if bump_version(session, status='completed', completed_at=datetime.utcnow()) is None:
+            return lost_race(session)
+        aggregates.session_changed(current_user_id, before, (session.document_type, 'completed'))
+
+        db.session.commit()
+        logger.info(f"Session {session_id} marked as completed for user {current_user_id}")
+        return etagged_json({'success': True, 'version': session.version}, session_etag(session))
+
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error completing session: {e}")
         return jsonify({'error': str(e)}), 500
 
@@ -182,22 +420,27 @@ def delete_session(session_id):
     """
     try:
         current_user_id = get_jwt_identity()
-        sessions = load_user_sessions(current_user_id)
-        
-        if session_id not in sessions:
+        session = get_user_session(current_user_id, session_id)
+
+        if session is None:
             return jsonify({'error': 'Session not found'}), 404
-        
-        # Remove session
-        del sessions[session_id]
-        
-        # Save sessions
-        if save_user_sessions(current_user_id, sessions):
-            logger.info(f"Session {session_id} deleted for user {current_user_id}")
-            return jsonify({'success': True})
-        else:
-            return jsonify({'error': 'Failed to delete session'}), 500
-            
+        if precondition_failed(session_etag(session)):
+            return conflict_response(session_etag(session))
+
+        # Conditional like bump_version(), so a stale If-Match can't delete newer work
+        query = delete(Session).where(Session.id == session.id)
+        if request.if_match:
+            query = query.where(Session.version == session.version)
+        if db.session.execute(query.execution_options(synchronize_session=False)).rowcount != 1:
+            return lost_race(session)
+        # Explicit so SQLite without foreign_keys=ON doesn't leave orphans
+        SessionMessage.query.filter_by(session_pk=session.id).delete(synchronize_session=False)
+        aggregates.session_changed(current_user_id, (session.document_type, session.status), None)
+        db.session.commit()
+        logger.info(f"Session {session_id} deleted for user {current_user_id}")
+        return jsonify({'success': True})
+
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error deleting session: {e}")
         return jsonify({'error': str(e)}), 500
-
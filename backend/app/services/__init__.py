@@ -0,0 +1,3 @@
+# app/services/__init__.py
+#
+# Shared, process-level helpers used by the route blueprints.
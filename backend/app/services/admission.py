@@ -0,0 +1,254 @@
+# app/services/admission.py
+"""
+Per-user admission control for /api/chat.
+
+Two limits, both kept in the local SQLite store so every gunicorn worker on
+the box sees the same counts:
+
+- a concurrency semaphore: at most `users.max_concurrent_sessions`
+  (ADMISSION_MAX_CONCURRENT when unset) generations in flight per user,
+  held as leases that are released when the response is closed;
+- a token bucket: ADMISSION_RATE_PER_MINUTE requests per user, with bursts
+  of up to ADMISSION_BURST.
+
+A request that can't be admitted takes a ticket in a per-user FIFO queue
+and waits up to ADMISSION_QUEUE_TIMEOUT seconds; only the oldest waiting
+ticket may be admitted, so a user's requests run in arrival order. When
+the wait runs out (or the queue is already ADMISSION_MAX_QUEUE deep) the
+request is rejected with 429 and a Retry-After hint.
+
+Each admission check is one BEGIN IMMEDIATE transaction, which serializes
+checks across processes. Leases carry the owning pid and an expiry, so a
+worker that dies mid-request can't hold a slot forever.
+"""
+
+import math
+import os
+import random
+import time
+import uuid
+import logging
+from functools import wraps
+
+from flask import current_app, jsonify
+from flask_jwt_extended import current_user, get_jwt_identity
+
+from app.services import local_store
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+
+    def __init__(self, path, max_concurrent=3, rate_per_minute=30, burst=10,
+                 queue_timeout=10.0, max_queue=20, lease_ttl=600, poll_interval=0.05):
+        self.path = path
+        self.max_concurrent = max_concurrent
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        conn = local_store.connect(path)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS admission_leases ('
+            ' lease_id TEXT PRIMARY KEY,'
+            ' user_id TEXT NOT NULL,'
+            ' pid INTEGER NOT NULL,'
+            ' expires_at REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_admission_leases_user '
+            'ON admission_leases (user_id)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS admission_buckets ('
+            ' user_id TEXT PRIMARY KEY,'
+            ' tokens REAL NOT NULL,'
+            ' updated_at REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS admission_queue ('
+            ' ticket INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' user_id TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_admission_queue_user '
+            'ON admission_queue (user_id, ticket)'
+        )
+
+    def _try_admit(self, conn, user_id, limit, ticket):
+        """
+        One admission attempt inside an open transaction. Returns
+        (lease_id, None) on success, else (None, seconds until it might succeed).
+        """
+        now = time.time()
+        conn.execute('DELETE FROM admission_leases WHERE expires_at <= ?', (now,))
+        conn.execute('DELETE FROM admission_queue WHERE expires_at <= ?', (now,))
+
+        if ticket is not None:
+            head = conn.execute(
+                'SELECT MIN(ticket) FROM admission_queue WHERE user_id = ?', (user_id,)
+            ).fetchone()[0]
+            if head != ticket:
+                return None, self.poll_interval
+        elif conn.execute(
+            'SELECT 1 FROM admission_queue WHERE user_id = ? LIMIT 1', (user_id,)
+        ).fetchone():
+            # Others are already waiting; join the back of the queue
+            return None, self.poll_interval
+
+        leases = conn.execute(
+            'SELECT lease_id, pid FROM admission_leases WHERE user_id = ?', (user_id,)
+        ).fetchall()
+        if len(leases) >= limit:
+            dead = [lease_id for lease_id, pid in leases if not local_store.pid_alive(pid)]
+            if dead:
+                conn.executemany('DELETE FROM admission_leases WHERE lease_id = ?', [(d,) for d in dead])
+            if len(leases) - len(dead) >= limit:
+                return None, self.poll_interval
+
+        row = conn.execute(
+            'SELECT tokens, updated_at FROM admission_buckets WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+        if tokens < 1:
+            conn.execute(
+                'INSERT OR REPLACE INTO admission_buckets (user_id, tokens, updated_at) VALUES (?, ?, ?)',
+                (user_id, tokens, now),
+            )
+            return None, (1 - tokens) / self.rate if self.rate > 0 else 60.0
+
+        conn.execute(
+            'INSERT OR REPLACE INTO admission_buckets (user_id, tokens, updated_at) VALUES (?, ?, ?)',
+            (user_id, tokens - 1, now),
+        )
+        lease_id = uuid.uuid4().hex
+        conn.execute(
+            'INSERT INTO admission_leases (lease_id, user_id, pid, expires_at) VALUES (?, ?, ?, ?)',
+            (lease_id, user_id, os.getpid(), now + self.lease_ttl),
+        )
+        if ticket is not None:
+            conn.execute('DELETE FROM admission_queue WHERE ticket = ?', (ticket,))
+        return lease_id, None
+
+    def acquire(self, user_id, limit=None):
+        """Admit one request for `user_id`, waiting in line if needed; returns a lease id"""
+        limit = limit or self.max_concurrent
+        conn = local_store.connect(self.path)
+        deadline = time.monotonic() + self.queue_timeout
+        ticket = None
+        try:
+            while True:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    lease_id, wait = self._try_admit(conn, user_id, limit, ticket)
+                    if lease_id is None and ticket is None:
+                        depth = conn.execute(
+                            'SELECT COUNT(*) FROM admission_queue WHERE user_id = ?', (user_id,)
+                        ).fetchone()[0]
+                        if depth >= self.max_queue:
+                            conn.execute('COMMIT')
+                            raise AdmissionRejected('Too many queued requests', max(1, math.ceil(wait)))
+                        ticket = conn.execute(
+                            'INSERT INTO admission_queue (user_id, expires_at) VALUES (?, ?)',
+                            (user_id, time.time() + self.queue_timeout + 5),
+                        ).lastrowid
+                    conn.execute('COMMIT')
+                except AdmissionRejected:
+                    raise
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+
+                if lease_id is not None:
+                    ticket = None
+                    return lease_id
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or wait > remaining:
+                    # Don't hold the worker for a token that can't arrive in time
+                    raise AdmissionRejected('Too many requests', max(1, math.ceil(wait)))
+                # Jitter keeps waiting workers from polling in lockstep
+                time.sleep(min(remaining, self.poll_interval * random.uniform(1, 2)))
+        finally:
+            if ticket is not None:
+                conn.execute('DELETE FROM admission_queue WHERE ticket = ?', (ticket,))
+
+    def release(self, lease_id):
+        local_store.connect(self.path).execute(
+            'DELETE FROM admission_leases WHERE lease_id = ?', (lease_id,)
+        )
+
+    def stats(self, user_id):
+        conn = local_store.connect(self.path)
+        now = time.time()
+        return {
+            'in_flight': conn.execute(
+                'SELECT COUNT(*) FROM admission_leases WHERE user_id = ? AND expires_at > ?', (user_id, now)
+            ).fetchone()[0],
+            'queued': conn.execute(
+                'SELECT COUNT(*) FROM admission_queue WHERE user_id = ? AND expires_at > ?', (user_id, now)
+            ).fetchone()[0],
+        }
+
+
+def get_admission(app=None):
+    """Return this app's admission controller, or None when disabled"""
+    app = app or current_app._get_current_object()
+    if 'admission' not in app.extensions:
+        controller = None
+        if app.config.get('ADMISSION_ENABLED', True):
+            controller = AdmissionController(
+                local_store.default_path(app),
+                max_concurrent=int(app.config.get('ADMISSION_MAX_CONCURRENT', 3)),
+                rate_per_minute=float(app.config.get('ADMISSION_RATE_PER_MINUTE', 30)),
+                burst=int(app.config.get('ADMISSION_BURST', 10)),
+                queue_timeout=float(app.config.get('ADMISSION_QUEUE_TIMEOUT', 10)),
+                max_queue=int(app.config.get('ADMISSION_MAX_QUEUE', 20)),
+                lease_ttl=int(app.config.get('ADMISSION_LEASE_TTL', 600)),
+            )
+        app.extensions['admission'] = controller
+    return app.extensions['admission']
+
+
+def admission_controlled(view):
+    """
+    Admit the JWT user before running `view` (apply below @jwt_required).
+    The lease is held until the response is closed, so a streamed reply
+    keeps its slot until the last byte is sent or the client goes away.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        controller = get_admission()
+        if controller is None:
+            return view(*args, **kwargs)
+
+        user_id = get_jwt_identity()
+        limit = current_user.max_concurrent_sessions
+        try:
+            lease_id = controller.acquire(user_id, limit)
+        except AdmissionRejected as e:
+            logger.warning(f"Rejected chat request from user {user_id}: {e}")
+            response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except BaseException:
+            controller.release(lease_id)
+            raise
+        response.call_on_close(lambda: controller.release(lease_id))
+        return response
+
+    return wrapper
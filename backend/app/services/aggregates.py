@@ -0,0 +1,177 @@
+# app/services/aggregates.py
+"""
+Incrementally maintained per-user dashboard aggregates.
+
+Callers invoke these hooks inside the transaction that changes a session or
+consumes credits, before committing, so the counters can never drift from
+the rows they describe. Session writes lock the aggregate row FOR UPDATE (a
+no-op on SQLite, which serializes writers anyway) so concurrent writes for
+the same user apply one after the other; credit charges are a single
+relative UPDATE and take no lock up front.
+
+A missing row is rebuilt from the sessions table on first touch, so users
+created before this table existed are backfilled lazily;
+`python rebuild_aggregates.py` backfills everyone at once.
+"""
+
+from sqlalchemy import func, select, update
+
+from app import db
+from app.models import Session, UsageLedger, User, UserAggregate
+
+
+def _is_pending(status):
+    return status != 'completed'
+
+
+def _counts_for(user_id):
+    """Recompute (pending, all, doc_type_counts) from the sessions table"""
+    rows = (
+        db.session.query(Session.document_type, Session.status, func.count(Session.id))
+        .filter(Session.user_id == user_id)
+        .group_by(Session.document_type, Session.status)
+        .all()
+    )
+    pending = total = 0
+    doc_types = {}
+    for document_type, status, count in rows:
+        total += count
+        if _is_pending(status):
+            pending += count
+        if document_type:
+            doc_types[document_type] = doc_types.get(document_type, 0) + count
+    return pending, total, doc_types
+
+
+def rebuild_user(user_id):
+    """Recompute one user's aggregate row from scratch (caller commits)"""
+    pending, total, doc_types = _counts_for(user_id)
+    agg = db.session.get(UserAggregate, user_id)
+    if agg is None:
+        agg = UserAggregate(user_id=user_id, credits_used=0, version=0)
+        db.session.add(agg)
+    agg.pending_count = pending
+    agg.all_count = total
+    agg.doc_type_counts = doc_types
+    agg.credits_used = (
+        db.session.query(func.coalesce(func.sum(UsageLedger.credits_charged), 0))
+        .filter(UsageLedger.user_id == user_id)
+        .scalar()
+    )
+    agg.credits_remaining = db.session.query(User.credits_remaining).filter_by(id=user_id).scalar()
+    agg.version = (agg.version or 0) + 1
+    return agg
+
+
+def get(user_id):
+    """
+    Read-only fetch for the dashboard; builds the row if it's missing.
+    Returns None for an unknown user.
+    """
+    agg = db.session.get(UserAggregate, user_id)
+    if agg is None:
+        if db.session.get(User, user_id) is None:
+            return None
+        agg = rebuild_user(user_id)
+        db.session.commit()
+    return agg
+
+
+def _locked(user_id):
+    agg = (
+        UserAggregate.query
+        .filter_by(user_id=user_id)
+        .with_for_update()
+        .first()
+    )
+    if agg is None:
+        # Counts come from the table, which already reflects the caller's
+        # pending change once flushed
+        db.session.flush()
+        return rebuild_user(user_id), True
+    return agg, False
+
+
+def session_changed(user_id, before, after):
+    """
+    Apply one session write. `before`/`after` are (document_type, status)
+    tuples, or None for a create/delete.
+    """
+    agg, rebuilt = _locked(user_id)
+    if rebuilt:
+        return agg
+
+    doc_types = dict(agg.doc_type_counts or {})
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None:
+            continue
+        document_type, status = state
+        agg.all_count += sign
+        if _is_pending(status):
+            agg.pending_count += sign
+        if document_type:
+            doc_types[document_type] = doc_types.get(document_type, 0) + sign
+            if doc_types[document_type] <= 0:
+                del doc_types[document_type]
+    agg.doc_type_counts = doc_types
+    agg.version += 1
+    return agg
+
+
+def credits_consumed(user_id, amount):
+    """
+    Record a credit charge (or a refund, with a negative amount). A single
+    UPDATE with no lock taken up front, so parallel charges for the same
+    user don't queue behind each other; the balance is copied from the
+    users row inside the same statement.
+    """
+    updated = db.session.execute(
+        update(UserAggregate)
+        .where(UserAggregate.user_id == user_id)
+        .values(
+            credits_used=UserAggregate.credits_used + amount,
+            credits_remaining=(
+                select(User.credits_remaining)
+                .where(User.id == user_id)
+                .scalar_subquery()
+            ),
+            version=UserAggregate.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not updated:
+        # Rebuilt from the ledger, which already holds the caller's row once flushed
+        _locked(user_id)
+
+
+def balances_changed(user_ids):
+    """
+    Copy users.credits_remaining onto existing aggregate rows after a bulk
+    change that isn't a charge (caller commits). Missing rows pick the
+    balance up when they are rebuilt.
+    """
+    db.session.execute(
+        update(UserAggregate)
+        .where(UserAggregate.user_id.in_(user_ids))
+        .values(
+            credits_remaining=(
+                select(User.credits_remaining)
+                .where(User.id == UserAggregate.user_id)
+                .scalar_subquery()
+            ),
+            version=UserAggregate.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rebuild_all(batch_size=500):
+    """Backfill/repair every user's row; returns the number of users processed"""
+    processed = 0
+    user_ids = [uid for (uid,) in db.session.query(User.id).order_by(User.id)]
+    for start in range(0, len(user_ids), batch_size):
+        for user_id in user_ids[start:start + batch_size]:
+            rebuild_user(user_id)
+            processed += 1
+        db.session.commit()
+    return processed
@@ -0,0 +1,89 @@
+# app/services/chat_pipeline.py
+"""
+Steps of a chat generation shared by the request path in routes/chat.py and
+the background job runner.
+
+Everything a generation needs is carried in a plain, JSON-serializable
+`ctx` dict so a queued job can be finished by any worker process:
+
+    user_id, session_id, user_message, doc_type, messages,
+    max_tokens, temperature, cache_key, namespace, audited, credits_charged
+"""
+
+import os
+import logging
+
+from app.services import conversation, metering
+from app.services.llm_gateway import get_gateway
+from app.services.response_cache import get_response_cache
+from app.services.semantic_cache import get_semantic_cache
+
+logger = logging.getLogger(__name__)
+
+
+def remember(ctx, reply):
+    """Append the exchange to server-side conversation memory"""
+    if ctx.get('session_id') and reply:
+        conversation.record_exchange(ctx['user_id'], ctx['session_id'], ctx['user_message'], reply)
+
+
+def store_reply(ctx, reply, provider, model):
+    """Write a fresh reply to conversation memory and both cache tiers"""
+    if not reply:
+        return
+    remember(ctx, reply)
+
+    value = {'reply': reply, 'provider': provider, 'model': model}
+    cache = get_response_cache()
+    if cache is not None and ctx.get('cache_key'):
+        cache.set(ctx['cache_key'], value)
+
+    semantic = get_semantic_cache()
+    if semantic is None or not ctx.get('namespace'):
+        return
+    audited = ctx.get('audited')
+    if audited:
+        # Entry ids are per process; a job finished elsewhere can't audit
+        if audited['pid'] == os.getpid():
+            agreement = semantic.audit(audited['entry_id'], audited['reply'], reply)
+            logger.info(f"Semantic cache audit agreement={agreement:.2f}")
+    else:
+        semantic.add(ctx['namespace'], ctx['user_message'], value)
+
+
+def record_usage(ctx, usage, provider, model):
+    """Append this generation's token counts to the usage ledger"""
+    try:
+        metering.record_usage(
+            ctx['user_id'], usage, provider, model,
+            session_id=ctx.get('session_id'), doc_type=ctx.get('doc_type'),
+        )
+    except Exception as e:
+        # Losing a usage row must never cost the user their reply
+        logger.error(f"Failed to record usage for user {ctx['user_id']}: {e}")
+
+
+def refund(ctx):
+    """Give back the credits reserved for a generation that failed"""
+    metering.refund(
+        ctx['user_id'], ctx.get('credits_charged'),
+        session_id=ctx.get('session_id'), doc_type=ctx.get('doc_type'),
+    )
+    ctx['credits_charged'] = 0
+
+
+def run_completion(ctx):
+    """
+    Blocking completion through the gateway, with caches, memory and the
+    usage ledger updated. Credits are reserved by the caller, which also
+    refunds them if this raises.
+    """
+    completion = get_gateway().complete(
+        ctx['doc_type'],
+        ctx['messages'],
+        max_tokens=ctx['max_tokens'],
+        temperature=ctx['temperature'],
+    )
+    record_usage(ctx, completion.usage, completion.provider, completion.model)
+    store_reply(ctx, completion.text, completion.provider, completion.model)
+    return completion
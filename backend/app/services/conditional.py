@@ -0,0 +1,50 @@
+# app/services/conditional.py
+"""
+Helpers for conditional requests: version-based ETags, 304 Not Modified on
+If-None-Match, and 412 Precondition Failed on If-Match.
+
+ETags are built from row versions (or other cheap counters), so a matching
+GET can be answered before anything is loaded or serialized.
+"""
+
+import hashlib
+
+from flask import request, jsonify, make_response
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return digest[:32]
+
+
+def is_not_modified(etag):
+    """True when the client's If-None-Match already has this representation"""
+    return request.if_none_match.contains_weak(etag)
+
+
+def precondition_failed(etag):
+    """True when the client sent If-Match and it no longer matches"""
+    if not request.if_match:
+        return False
+    return not request.if_match.contains(etag)
+
+
+def not_modified_response(etag):
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def etagged_json(payload, etag, status=200):
+    """jsonify with an ETag; private, always-revalidate caching for browsers"""
+    response = make_response(jsonify(payload), status)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def conflict_response(etag):
+    response = make_response(jsonify({'error': 'Precondition failed: resource has changed'}), 412)
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,221 @@
+# app/services/conversation.py
+"""
+Server-side conversation memory for /api/chat.
+
+Each prompt is built inside a fixed token budget: the system prompt, a
+rolling summary of older turns, as many recent turns verbatim as fit, and
+the new message. Token counts are stored on each turn when it is written,
+so building a prompt never re-tokenizes history.
+
+When the unsummarized tail grows past CONVERSATION_WINDOW_TOKENS, the oldest
+turns are folded into the summary by a background thread after the reply
+has been sent, so the summarization call never adds to request latency.
+"""
+
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import ConversationTurn, ConversationSummary
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on rows fetched per prompt, whatever the session length
+MAX_WINDOW_TURNS = 40
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a business analysis conversation. "
+    "Merge the new turns into the current summary. Keep facts, figures, "
+    "decisions and open questions; drop pleasantries. Stay under 300 words."
+)
+
+_encoder = None
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='conversation-summary')
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def count_tokens(text):
+    """Exact count with tiktoken when installed, otherwise ~4 chars/token"""
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding('o200k_base')
+        except Exception:
+            _encoder = False
+    if _encoder:
+        return len(_encoder.encode(text))
+    return max(1, int(math.ceil(len(text) / 4.0)))
+
+
+def build_messages(user_id, session_id, system_prompt, user_message):
+    """
+    Return (messages, has_history) for the next call in this session.
+    """
+    budget = int(current_app.config.get('CONVERSATION_TOKEN_BUDGET', 6000))
+    summary = db.session.get(ConversationSummary, (user_id, session_id))
+    through = summary.summarized_through if summary else 0
+
+    used = count_tokens(system_prompt) + count_tokens(user_message)
+    if summary and summary.summary:
+        used += summary.token_count
+
+    recent = (
+        ConversationTurn.query
+        .filter(
+            ConversationTurn.user_id == user_id,
+            ConversationTurn.session_id == session_id,
+            ConversationTurn.id > through,
+        )
+        .order_by(ConversationTurn.id.desc())
+        .limit(MAX_WINDOW_TURNS)
+        .all()
+    )
+    window = []
+    for turn in recent:
+        if used + turn.token_count > budget:
+            break
+        window.append(turn)
+        used += turn.token_count
+    window.reverse()
+
+    messages = [{'role': 'system', 'content': system_prompt}]
+    if summary and summary.summary:
+        messages.append({
+            'role': 'system',
+            'content': f"Summary of the earlier conversation:\n{summary.summary}"
+        })
+    messages += [{'role': t.role, 'content': t.content} for t in window]
+    messages.append({'role': 'user', 'content': user_message})
+
+    has_history = bool(window) or bool(summary and summary.summary)
+    return messages, has_history
+
+
+def record_exchange(user_id, session_id, user_message, reply):
+    """Persist one user/assistant exchange and fold old turns if needed"""
+    db.session.add_all([
+        ConversationTurn(
+            user_id=user_id,
+            session_id=session_id,
+            role='user',
+            content=user_message,
+            token_count=count_tokens(user_message),
+        ),
+        ConversationTurn(
+            user_id=user_id,
+            session_id=session_id,
+            role='assistant',
+            content=reply,
+            token_count=count_tokens(reply),
+        ),
+    ])
+    db.session.commit()
+
+    window_tokens = int(current_app.config.get('CONVERSATION_WINDOW_TOKENS', 3000))
+    summary = db.session.get(ConversationSummary, (user_id, session_id))
+    through = summary.summarized_through if summary else 0
+    unsummarized = (
+        db.session.query(func.coalesce(func.sum(ConversationTurn.token_count), 0))
+        .filter(
+            ConversationTurn.user_id == user_id,
+            ConversationTurn.session_id == session_id,
+            ConversationTurn.id > through,
+        )
+        .scalar()
+    )
+    if unsummarized > window_tokens:
+        _schedule_fold(current_app._get_current_object(), user_id, session_id)
+
+
+def _schedule_fold(app, user_id, session_id):
+    key = (user_id, session_id)
+    with _in_flight_lock:
+        if key in _in_flight:
+            return
+        _in_flight.add(key)
+    _executor.submit(_fold, app, user_id, session_id)
+
+
+def _fold(app, user_id, session_id):
+    """Fold everything but the newest half-window of turns into the summary"""
+    from app.services import metering
+    from app.services.llm_gateway import get_gateway
+
+    try:
+        with app.app_context():
+            keep_tokens = int(app.config.get('CONVERSATION_WINDOW_TOKENS', 3000)) // 2
+            summary = db.session.get(ConversationSummary, (user_id, session_id))
+            if summary is None:
+                summary = ConversationSummary(
+                    user_id=user_id,
+                    session_id=session_id,
+                    summary='',
+                    token_count=0,
+                    summarized_through=0,
+                )
+                db.session.add(summary)
+
+            turns = (
+                ConversationTurn.query
+                .filter(
+                    ConversationTurn.user_id == user_id,
+                    ConversationTurn.session_id == session_id,
+                    ConversationTurn.id > summary.summarized_through,
+                )
+                .order_by(ConversationTurn.id.desc())
+                .all()
+            )
+            kept = 0
+            fold = []
+            for turn in turns:
+                if kept + turn.token_count <= keep_tokens and not fold:
+                    kept += turn.token_count
+                else:
+                    fold.append(turn)
+            if not fold:
+                return
+            fold.reverse()
+
+            transcript = '\n'.join(
+                f"{'User' if t.role == 'user' else 'Assistant'}: {t.content}" for t in fold
+            )
+            completion = get_gateway(app).complete(
+                'conversation_summary',
+                [
+                    {'role': 'system', 'content': SUMMARY_PROMPT},
+                    {'role': 'user', 'content': (
+                        f"Current summary:\n{summary.summary or '(none)'}\n\n"
+                        f"New turns:\n{transcript}"
+                    )},
+                ],
+                max_tokens=500,
+                temperature=0.2,
+            )
+
+            metering.record_usage(
+                user_id, completion.usage, completion.provider, completion.model,
+                session_id=session_id, kind='summary',
+            )
+
+            summary.summary = completion.text
+            summary.token_count = count_tokens(completion.text)
+            summary.summarized_through = fold[-1].id
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Another worker created the summary row first; it will catch up
+                db.session.rollback()
+            logger.info(f"Folded {len(fold)} turns into summary for session {session_id}")
+    except Exception as e:
+        logger.error(f"Conversation summary failed for session {session_id}: {e}")
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard((user_id, session_id))
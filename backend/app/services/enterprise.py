@@ -0,0 +1,90 @@
+# app/services/enterprise.py
+"""
+Enterprise applications: recorded in the request, everything slow
+(notifying sales, creating the Stripe checkout link, emailing the
+applicant) happens from the mail queue.
+"""
+
+from flask import current_app
+
+from app import db
+from app.models import EnterpriseApplication
+from app.services import mail_queue
+from app.services.stripe_client import get_stripe
+
+
+def submit(data):
+    """Record an application and queue both emails in one transaction"""
+    application = EnterpriseApplication(
+        name=data['name'],
+        company_email=data['company_email'],
+        company_name=data['company_name'],
+        seats_needed=str(data.get('seats_needed') or ''),
+        budget_range=data.get('budget_range'),
+        notes=data.get('notes'),
+    )
+    db.session.add(application)
+    db.session.flush()
+
+    # 1) Email you/sales ops
+    mail_queue.enqueue(
+        subject=f"[Enterprise Application] {application.company_name}",
+        recipients=[current_app.config['ADMIN_NOTIFICATION_EMAIL']],
+        body=f"""
+New enterprise application:
+
+Name:       {application.name}
+Company:    {application.company_name}
+Email:      {application.company_email}
+Seats:      {application.seats_needed}
+Budget:     {application.budget_range}
+Notes:      {application.notes}
+""",
+    )
+
+    # 2) + 3) Checkout link for the applicant, created at send time
+    mail_queue.enqueue(
+        subject="Your Enterprise Signup Link",
+        recipients=[application.company_email],
+        preparer='enterprise_signup_link',
+        context={'application_id': application.id},
+    )
+    db.session.commit()
+    return application
+
+
+def _checkout_url(application):
+    """Create (once) the Stripe Checkout session for an application"""
+    if application.checkout_url:
+        return application.checkout_url
+    frontend = current_app.config['FRONTEND_BASE_URL'].rstrip('/')
+    session = get_stripe().checkout.Session.create(
+        customer_email=application.company_email,
+        payment_method_types=['card'],
+        line_items=[{
+            'price': current_app.config['ENTERPRISE_PRICE_ID'],
+            'quantity': 1,
+        }],
+        mode='subscription',
+        success_url = f"{frontend}/enterprise/success?session_id={{CHECKOUT_SESSION_ID}}",
+        cancel_url  = f"{frontend}/enterprise/cancel",
+        # A retried send reuses the session instead of creating another
+        idempotency_key=f'enterprise-application-{application.id}',
+    )
+    application.checkout_session_id = session.id
+    application.checkout_url = session.url
+    db.session.commit()
+    return application.checkout_url
+
+
+@mail_queue.preparer('enterprise_signup_link')
+def _signup_link_email(email):
+    application = db.session.get(EnterpriseApplication, email.context['application_id'])
+    email.body = f"""
+Thanks for your interest in our Enterprise plan!
+
+Please complete your subscription here:
+{_checkout_url(application)}
+
+(If you have any trouble, reply to this email and we’ll help you out.)
+"""
@@ -0,0 +1,247 @@
+# app/services/idempotency.py
+"""
+Idempotency-Key support for POST endpoints.
+
+The first request carrying a given key claims it in the local store and
+runs; its response is saved for IDEMPOTENCY_TTL seconds and replayed
+verbatim (with `Idempotent-Replayed: true`) to any retry with the same key.
+A retry that arrives while the first request is still running waits for
+its result instead of starting a second upstream call, and gets 409 if it
+isn't ready within IDEMPOTENCY_WAIT_TIMEOUT.
+
+Keys are scoped per endpoint and per user, and bound to a fingerprint of
+the request body: reusing a key for a different request is a 422.
+
+5xx and 429 responses are not saved, so a retry after a transient failure
+runs again. Streamed (SSE) responses are saved once the stream has been
+sent in full, unless the view reported that it failed part-way
+(stream_failed()). An in-progress claim is a lease with the owner's pid and an
+expiry, so a crashed worker never blocks a key for long.
+"""
+
+import hashlib
+import json
+import os
+import time
+import logging
+from functools import wraps
+
+from flask import Response, current_app, g, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+from app.services import local_store
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# Headers that describe the stored body rather than the response
+_SKIP_HEADERS = {'content-length', 'transfer-encoding', 'set-cookie'}
+
+
+class IdempotencyStore:
+
+    def __init__(self, path, ttl=86400, lock_ttl=300):
+        self.path = path
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        conn = local_store.connect(path)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS idempotency_keys ('
+            ' scope TEXT NOT NULL,'
+            ' key TEXT NOT NULL,'
+            ' fingerprint TEXT NOT NULL,'
+            ' owner_pid INTEGER,'
+            ' status INTEGER,'
+            ' headers TEXT,'
+            ' body BLOB,'
+            ' expires_at REAL NOT NULL,'
+            ' PRIMARY KEY (scope, key))'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expires '
+            'ON idempotency_keys (expires_at)'
+        )
+
+    def claim(self, scope, key, fingerprint):
+        """
+        Try to take the key. Returns ('claimed', None), ('done', row),
+        ('in_progress', None) or ('mismatch', None).
+        """
+        conn = local_store.connect(self.path)
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM idempotency_keys WHERE expires_at <= ?', (now,))
+            row = conn.execute(
+                'SELECT fingerprint, owner_pid, status, headers, body FROM idempotency_keys '
+                'WHERE scope = ? AND key = ?',
+                (scope, key),
+            ).fetchone()
+            if row is not None:
+                if row[0] != fingerprint:
+                    result = ('mismatch', None)
+                elif row[2] is not None:
+                    result = ('done', row)
+                elif local_store.pid_alive(row[1]):
+                    result = ('in_progress', None)
+                else:
+                    # Owner died without finishing; take over
+                    row = None
+            if row is None:
+                conn.execute(
+                    'INSERT OR REPLACE INTO idempotency_keys '
+                    '(scope, key, fingerprint, owner_pid, expires_at) VALUES (?, ?, ?, ?, ?)',
+                    (scope, key, fingerprint, os.getpid(), now + self.lock_ttl),
+                )
+                result = ('claimed', None)
+            conn.execute('COMMIT')
+            return result
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def complete(self, scope, key, status, headers, body):
+        local_store.connect(self.path).execute(
+            'UPDATE idempotency_keys SET status = ?, headers = ?, body = ?, owner_pid = NULL, expires_at = ? '
+            'WHERE scope = ? AND key = ?',
+            (status, json.dumps(headers), body, time.time() + self.ttl, scope, key),
+        )
+
+    def abandon(self, scope, key):
+        """Drop an unfinished claim so the next retry runs the request again"""
+        local_store.connect(self.path).execute(
+            'DELETE FROM idempotency_keys WHERE scope = ? AND key = ? AND status IS NULL',
+            (scope, key),
+        )
+
+
+def get_idempotency_store(app=None):
+    app = app or current_app._get_current_object()
+    if 'idempotency' not in app.extensions:
+        app.extensions['idempotency'] = IdempotencyStore(
+            local_store.default_path(app),
+            ttl=int(app.config.get('IDEMPOTENCY_TTL', 86400)),
+            lock_ttl=int(app.config.get('IDEMPOTENCY_LOCK_TTL', 300)),
+        )
+    return app.extensions['idempotency']
+
+
+def request_key():
+    """The Idempotency-Key sent with this request, or None"""
+    key = request.headers.get(HEADER, '').strip()
+    return key or None
+
+
+def _scope():
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    return f'{request.endpoint}:{identity or "anonymous"}'
+
+
+def _replay(row):
+    _, _, status, headers, body = row
+    response = Response(body, status=status, headers=json.loads(headers))
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def stream_failed():
+    """
+    Call from a streamed response that ends in an error sent in-band (the
+    status was already 200): the key is released instead of saving the
+    stream, so a retry runs again. Needs the request context
+    (stream_with_context).
+    """
+    outcome = g.get('idempotency_outcome')
+    if outcome is not None:
+        outcome['failed'] = True
+
+
+def _cacheable(status):
+    return status < 500 and status != 429
+
+
+def idempotent(view):
+    """
+    Honour an Idempotency-Key header on `view`. Requests without the header
+    are passed straight through. Apply below @jwt_required and above any
+    admission control, so waiting retries don't hold a slot.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request_key()
+        if key is None:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        store = get_idempotency_store()
+        scope = _scope()
+        fingerprint = hashlib.sha256(request.method.encode() + b' ' + request.path.encode() + b'\n' + request.get_data()).hexdigest()
+        deadline = time.monotonic() + float(current_app.config.get('IDEMPOTENCY_WAIT_TIMEOUT', 60))
+
+        while True:
+            state, row = store.claim(scope, key, fingerprint)
+            if state == 'claimed':
+                break
+            if state == 'done':
+                logger.info(f"Replaying response for {HEADER} {key} on {request.endpoint}")
+                return _replay(row)
+            if state == 'mismatch':
+                return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+            if time.monotonic() >= deadline:
+                response = jsonify({'error': 'A request with this Idempotency-Key is still in progress'})
+                response.status_code = 409
+                response.headers['Retry-After'] = '1'
+                return response
+            time.sleep(0.25)
+
+        # Shared with stream_failed(), which runs later, inside the stream
+        outcome = g.idempotency_outcome = {}
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except BaseException:
+            store.abandon(scope, key)
+            raise
+
+        if not _cacheable(response.status_code):
+            store.abandon(scope, key)
+            return response
+
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in _SKIP_HEADERS]
+        if not response.is_streamed:
+            store.complete(scope, key, response.status_code, headers, response.get_data())
+            return response
+
+        # Streamed: save what was sent once the stream has run to the end
+        chunks = []
+        finished = []
+        body = response.response
+
+        def tee():
+            try:
+                for chunk in body:
+                    chunks.append(chunk if isinstance(chunk, bytes) else chunk.encode())
+                    yield chunk
+                finished.append(True)
+            finally:
+                # Pass a client disconnect through to the view's generator
+                if hasattr(body, 'close'):
+                    body.close()
+
+        def on_close():
+            if finished and not outcome.get('failed'):
+                store.complete(scope, key, response.status_code, headers, b''.join(chunks))
+            else:
+                store.abandon(scope, key)
+
+        response.response = tee()
+        response.call_on_close(on_close)
+        return response
+
+    return wrapper
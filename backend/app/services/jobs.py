@@ -0,0 +1,257 @@
+# app/services/jobs.py
+"""
+Background job mode for long chat generations.
+
+The chat_jobs table is the queue, so jobs survive restarts and any worker
+process can finish a job another one accepted. A JobRunner is a small pool
+of threads that claim queued rows with a conditional UPDATE, run the
+generation through chat_pipeline and store the result on the row. A
+maintenance thread heartbeats the jobs this runner holds and re-queues
+running jobs whose heartbeat went stale because their worker died.
+
+A job the provider rate-limits goes back in the queue with run_after set,
+so it isn't claimed again until its backoff (exponential plus jitter, or
+the provider's Retry-After when it sends one) has passed.
+
+Runners start lazily inside web workers when CHAT_JOB_WORKERS > 0, or as a
+dedicated process via `python run_jobs.py`.
+"""
+
+import os
+import random
+import socket
+import threading
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+
+from app import db
+from app.models import ChatJob
+from app.services import chat_pipeline
+from app.services.llm_gateway import LLMError, RateLimitError
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ('succeeded', 'failed')
+
+
+def enqueue(user_id, ctx):
+    job = ChatJob(user_id=user_id, status='queued', payload=ctx)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+class JobRunner:
+
+    def __init__(self, app, workers, poll_interval=1.0, heartbeat_interval=15,
+                 stale_after=120, max_attempts=3, backoff_base=5, backoff_max=300):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self._active = set()
+        self._active_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'chat-job-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._maintain, name='chat-job-maintenance', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        logger.info(f"Chat job runner {self.name} started with {self.workers} workers")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _claim(self):
+        """Atomically move the oldest due queued job to running; None if none is due"""
+        while True:
+            now = datetime.utcnow()
+            job_id = (
+                db.session.query(ChatJob.id)
+                .filter(
+                    ChatJob.status == 'queued',
+                    or_(ChatJob.run_after.is_(None), ChatJob.run_after <= now),
+                )
+                .order_by(ChatJob.created_at)
+                .limit(1)
+                .scalar()
+            )
+            if job_id is None:
+                return None
+            claimed = db.session.execute(
+                update(ChatJob)
+                .where(ChatJob.id == job_id, ChatJob.status == 'queued')
+                .values(
+                    status='running',
+                    claimed_by=self.name,
+                    heartbeat_at=now,
+                    attempts=ChatJob.attempts + 1,
+                )
+            ).rowcount
+            db.session.commit()
+            if claimed == 1:
+                return job_id
+            # Another runner won the race; try the next one
+
+    def _backoff(self, attempts, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _run(self, job_id):
+        job = db.session.get(ChatJob, job_id)
+        with self._active_lock:
+            self._active.add(job_id)
+        try:
+            ctx = dict(job.payload, user_id=job.user_id)
+            completion = chat_pipeline.run_completion(ctx)
+            job.status = 'succeeded'
+            job.result = {
+                'success': True,
+                'reply': completion.text,
+                'provider': completion.provider,
+                'model': completion.model,
+                'usage': completion.usage,
+            }
+        except RateLimitError as e:
+            if job.attempts < self.max_attempts:
+                delay = self._backoff(job.attempts, e.retry_after)
+                logger.warning(f"Job {job_id} rate limited, retrying in {delay:.0f}s")
+                job.status = 'queued'
+                job.claimed_by = None
+                job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+            else:
+                job.status = 'failed'
+                job.error = str(e)
+        except LLMError as e:
+            job.status = 'failed'
+            job.error = str(e)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            job.status = 'failed'
+            job.error = f'Unexpected error: {str(e)}'
+        finally:
+            if job.status in FINISHED:
+                job.finished_at = datetime.utcnow()
+            db.session.commit()
+            if job.status == 'failed':
+                self._refund(job)
+            with self._active_lock:
+                self._active.discard(job_id)
+
+    def _refund(self, job):
+        try:
+            chat_pipeline.refund(dict(job.payload, user_id=job.user_id))
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to refund credits for job {job.id}: {e}")
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    job_id = self._claim()
+                    if job_id is not None:
+                        self._run(job_id)
+                        continue
+            except Exception as e:
+                logger.error(f"Chat job worker error: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _maintain(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    self.heartbeat()
+                    self.requeue_stale()
+            except Exception as e:
+                logger.error(f"Chat job maintenance error: {e}")
+            self._stop.wait(self.heartbeat_interval)
+
+    def heartbeat(self):
+        with self._active_lock:
+            active = list(self._active)
+        if active:
+            db.session.execute(
+                update(ChatJob)
+                .where(ChatJob.id.in_(active), ChatJob.status == 'running')
+                .values(heartbeat_at=datetime.utcnow())
+            )
+            db.session.commit()
+
+    def requeue_stale(self):
+        """Recover jobs whose worker stopped heartbeating (crash or restart)"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        stale = (ChatJob.status == 'running', ChatJob.heartbeat_at < cutoff)
+        requeued = db.session.execute(
+            update(ChatJob)
+            .where(*stale, ChatJob.attempts < self.max_attempts)
+            .values(status='queued', claimed_by=None)
+        ).rowcount
+        lost = (
+            db.session.query(ChatJob.id)
+            .filter(*stale, ChatJob.attempts >= self.max_attempts)
+            .all()
+        )
+        failed = 0
+        for (job_id,) in lost:
+            # One row at a time so only the runner that actually fails a
+            # job refunds it
+            if db.session.execute(
+                update(ChatJob)
+                .where(ChatJob.id == job_id, *stale)
+                .values(status='failed', error='Worker lost too many times', finished_at=datetime.utcnow())
+            ).rowcount:
+                db.session.commit()
+                failed += 1
+                self._refund(db.session.get(ChatJob, job_id))
+        db.session.commit()
+        if requeued or failed:
+            logger.warning(f"Recovered stale chat jobs: {requeued} re-queued, {failed} failed")
+
+
+def build_runner(app, workers=None):
+    return JobRunner(
+        app,
+        workers if workers is not None else int(app.config.get('CHAT_JOB_WORKERS', 2)),
+        poll_interval=float(app.config.get('CHAT_JOB_POLL_INTERVAL', 1.0)),
+        stale_after=int(app.config.get('CHAT_JOB_STALE_AFTER', 120)),
+        max_attempts=int(app.config.get('CHAT_JOB_MAX_ATTEMPTS', 3)),
+        backoff_base=float(app.config.get('CHAT_JOB_BACKOFF_BASE', 5)),
+        backoff_max=float(app.config.get('CHAT_JOB_BACKOFF_MAX', 300)),
+    )
+
+
+_runner_lock = threading.Lock()
+
+
+def ensure_runner(app):
+    """Start this process's embedded runner once (never inherited across fork)"""
+    if int(app.config.get('CHAT_JOB_WORKERS', 2)) <= 0:
+        return None
+    entry = app.extensions.get('chat_job_runner')
+    if entry and entry[0] == os.getpid():
+        return entry[1]
+    with _runner_lock:
+        entry = app.extensions.get('chat_job_runner')
+        if entry and entry[0] == os.getpid():
+            return entry[1]
+        runner = build_runner(app)
+        runner.start()
+        app.extensions['chat_job_runner'] = (os.getpid(), runner)
+        return runner
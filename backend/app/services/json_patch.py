@@ -0,0 +1,81 @@
+# app/services/json_patch.py
+"""
+Minimal RFC 6902 JSON Patch for session notes: add, replace and remove with
+RFC 6901 pointers ("-" appends to an array). Patches are applied to a deep
+copy so a failing op leaves the original untouched.
+"""
+
+import copy
+
+
+class JsonPatchError(ValueError):
+    pass
+
+
+def _parse_pointer(path):
+    if path == '':
+        return []
+    if not path.startswith('/'):
+        raise JsonPatchError(f"Invalid JSON pointer '{path}'")
+    return [p.replace('~1', '/').replace('~0', '~') for p in path[1:].split('/')]
+
+
+def _index(container, token, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit():
+        raise JsonPatchError(f"Invalid array index '{token}'")
+    index = int(token)
+    limit = len(container) + (1 if allow_end else 0)
+    if index >= limit:
+        raise JsonPatchError(f"Array index {index} out of range")
+    return index
+
+
+def _resolve(doc, tokens, path):
+    node = doc
+    for token in tokens:
+        try:
+            node = node[_index(node, token)] if isinstance(node, list) else node[token]
+        except (KeyError, TypeError):
+            raise JsonPatchError(f"Path '{path}' does not exist")
+    return node
+
+
+def apply_patch(doc, ops):
+    if not isinstance(ops, list):
+        raise JsonPatchError("A patch must be a list of operations")
+    doc = copy.deepcopy(doc)
+    for op in ops:
+        if not isinstance(op, dict):
+            raise JsonPatchError(f"Unsupported patch operation {op!r}")
+        kind = op.get('op')
+        path = op.get('path')
+        if kind not in ('add', 'replace', 'remove') or not isinstance(path, str):
+            raise JsonPatchError(f"Unsupported patch operation {op!r}")
+        tokens = _parse_pointer(path)
+        if not tokens:
+            if kind == 'remove':
+                raise JsonPatchError("Cannot remove the document root")
+            doc = copy.deepcopy(op.get('value'))
+            continue
+
+        parent = _resolve(doc, tokens[:-1], path)
+        last = tokens[-1]
+        if isinstance(parent, list):
+            if kind == 'add':
+                parent.insert(_index(parent, last, allow_end=True), op.get('value'))
+            elif kind == 'replace':
+                parent[_index(parent, last)] = op.get('value')
+            else:
+                del parent[_index(parent, last)]
+        elif isinstance(parent, dict):
+            if kind != 'add' and last not in parent:
+                raise JsonPatchError(f"Path '{path}' does not exist")
+            if kind == 'remove':
+                del parent[last]
+            else:
+                parent[last] = op.get('value')
+        else:
+            raise JsonPatchError(f"Path '{path}' does not exist")
+    return doc
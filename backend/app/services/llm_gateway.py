@@ -0,0 +1,697 @@
+# app/services/llm_gateway.py
+"""
+Process-wide LLM gateway.
+
+Holds one keep-alive HTTP pool per provider per worker process, routes each
+request to OpenAI or Anthropic based on the docType, and hedges slow calls:
+once the primary has been running longer than its recent latency percentile,
+the same request is sent to the secondary and whichever answers first wins.
+
+The primary runs on the calling thread. When it may be hedged it is read as
+a stream, so a hedge that answers first can close it and hand its reply to
+the caller. Hedges run on a small pool (LLM_HEDGE_MAX); when every slot is
+busy no further hedge is sent, so a slow provider can't double upstream
+traffic.
+
+Base URLs are configurable so everything can be pointed at local stub
+servers (OPENAI_BASE_URL / ANTHROPIC_BASE_URL).
+"""
+
+import email.utils
+import heapq
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+import logging
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from flask import current_app
+
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+Completion = namedtuple('Completion', ['text', 'usage', 'provider', 'model'])
+
+DEFAULT_ROUTE = {
+    'primary': 'openai:gpt-4o',
+    'secondary': 'anthropic:claude-3-5-sonnet-latest',
+}
+
+# Internal jobs that should run on cheaper models unless overridden
+INTERNAL_ROUTES = {
+    'conversation_summary': {
+        'primary': 'openai:gpt-4o-mini',
+        'secondary': 'anthropic:claude-3-5-haiku-latest',
+    },
+}
+
+
+class LLMError(Exception):
+    """Base class for provider failures, carries the HTTP status to surface"""
+    status_code = 500
+
+
+class RateLimitError(LLMError):
+    """The provider is throttling; retry_after is its Retry-After in seconds, if it sent one"""
+    status_code = 429
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AuthenticationError(LLMError):
+    status_code = 500
+
+
+class ProviderError(LLMError):
+    status_code = 500
+
+
+def _retry_after(headers):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None"""
+    value = headers.get('retry-after') if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def _usage(prompt_tokens=0, completion_tokens=0):
+    prompt_tokens = prompt_tokens or 0
+    completion_tokens = completion_tokens or 0
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': prompt_tokens + completion_tokens,
+    }
+
+
+def _parse_target(target):
+    """'openai:gpt-4o' -> ('openai', 'gpt-4o')"""
+    provider, _, model = target.partition(':')
+    return provider, model
+
+
+def _interrupt(response):
+    """
+    Wake a thread blocked reading an httpx streaming response. close() from
+    another thread doesn't, so the socket is shut down and the reader fails
+    and closes the response itself. Skipped once the response is closed,
+    since its connection may already be back in the pool.
+    """
+    if response.is_closed:
+        return
+    network = response.extensions.get('network_stream')
+    sock = network.get_extra_info('socket') if network is not None else None
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class CompletionStream:
+    """
+    Provider-neutral streaming reply. Iterating yields text deltas; `usage`
+    is populated once the stream is exhausted. `close()` drops the upstream
+    connection, which is how abandoned generations get cancelled; `abort()`
+    does the same from another thread while a read is in progress.
+    Time to first token, total latency and tokens are recorded in metrics.
+    """
+
+    def __init__(self, deltas, closer, provider, model, response=None):
+        self._deltas = deltas
+        self._closer = closer
+        self._response = response
+        self._aborted = False
+        self.provider = provider
+        self.model = model
+        self.usage = _usage()
+        self.doc_type = None
+        self.started = time.monotonic()
+        # 'complete' when the gateway reads a stream on behalf of complete()
+        self.mode = 'stream'
+
+    def __iter__(self):
+        labels = dict(provider=self.provider, model=self.model, doc_type=self.doc_type)
+        first = True
+        try:
+            for delta in self._deltas(self):
+                if first and self.mode == 'stream':
+                    metrics.LLM_TIME_TO_FIRST_TOKEN.observe(time.monotonic() - self.started, **labels)
+                first = False
+                yield delta
+        except LLMError:
+            # An aborted read (a hedge won) isn't the provider failing
+            if not self._aborted:
+                metrics.LLM_ERRORS.inc(**labels)
+            raise
+        metrics.observe_llm(self.provider, self.model, self.doc_type,
+                            time.monotonic() - self.started, self.usage, mode=self.mode)
+
+    def close(self):
+        self._closer()
+
+    def abort(self):
+        self._aborted = True
+        if self._response is not None:
+            _interrupt(self._response)
+
+
+class OpenAIProvider:
+    name = 'openai'
+
+    def __init__(self, api_key, base_url=None, timeout=60.0, max_connections=20):
+        import httpx
+        import openai  # heavy import, only paid once per worker
+
+        self._openai = openai
+        self._http = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+        self.client = openai.OpenAI(
+            api_key=api_key,
+            base_url=base_url or None,
+            http_client=self._http,
+        )
+
+    def _translate(self, e):
+        if isinstance(e, self._openai.RateLimitError):
+            response = getattr(e, 'response', None)
+            return RateLimitError(
+                'Rate limit exceeded. Please try again later.',
+                retry_after=_retry_after(response.headers if response is not None else None),
+            )
+        if isinstance(e, self._openai.AuthenticationError):
+            return AuthenticationError('API authentication failed. Please check your OpenAI API key.')
+        return ProviderError(f'API error: {str(e)}')
+
+    def complete(self, model, messages, max_tokens, temperature):
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+        except self._openai.APIError as e:
+            raise self._translate(e)
+
+        if not response.choices:
+            raise ProviderError('No response from AI')
+        usage = response.usage
+        return Completion(
+            text=response.choices[0].message.content,
+            usage=_usage(
+                usage.prompt_tokens if usage else 0,
+                usage.completion_tokens if usage else 0,
+            ),
+            provider=self.name,
+            model=model,
+        )
+
+    def stream(self, model, messages, max_tokens, temperature):
+        try:
+            upstream = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                stream_options={'include_usage': True},
+            )
+        except self._openai.APIError as e:
+            raise self._translate(e)
+
+        def deltas(handle):
+            try:
+                for chunk in upstream:
+                    if chunk.choices:
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            yield delta
+                    if getattr(chunk, 'usage', None):
+                        handle.usage = _usage(
+                            chunk.usage.prompt_tokens,
+                            chunk.usage.completion_tokens,
+                        )
+            except self._openai.APIError as e:
+                raise self._translate(e)
+
+        return CompletionStream(deltas, upstream.close, self.name, model, upstream.response)
+
+    def list_models(self):
+        try:
+            return [m.id for m in self.client.models.list().data]
+        except self._openai.APIError as e:
+            raise self._translate(e)
+
+    def close(self):
+        self._http.close()
+
+
+class AnthropicProvider:
+    """Talks to the Messages API directly over httpx, no SDK dependency"""
+
+    name = 'anthropic'
+    API_VERSION = '2023-06-01'
+
+    def __init__(self, api_key, base_url=None, timeout=60.0, max_connections=20):
+        import httpx  # imported with the first provider, not at boot
+
+        self._httpx = httpx
+        self._http = httpx.Client(
+            base_url=(base_url or 'https://api.anthropic.com').rstrip('/'),
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            headers={
+                'x-api-key': api_key,
+                'anthropic-version': self.API_VERSION,
+                'content-type': 'application/json',
+            },
+        )
+
+    @staticmethod
+    def _body(model, messages, max_tokens, temperature):
+        # Anthropic takes the system prompt as a top-level field
+        system = '\n\n'.join(m['content'] for m in messages if m['role'] == 'system')
+        body = {
+            'model': model,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            'messages': [m for m in messages if m['role'] != 'system'],
+        }
+        if system:
+            body['system'] = system
+        return body
+
+    @staticmethod
+    def _check(response):
+        if response.status_code < 400:
+            return
+        response.read()
+        detail = response.text[:500]
+        if response.status_code == 429:
+            raise RateLimitError(
+                'Rate limit exceeded. Please try again later.',
+                retry_after=_retry_after(response.headers),
+            )
+        if response.status_code in (401, 403):
+            raise AuthenticationError('API authentication failed. Please check your Claude API key.')
+        raise ProviderError(f'API error: {response.status_code} {detail}')
+
+    def complete(self, model, messages, max_tokens, temperature):
+        try:
+            response = self._http.post(
+                '/v1/messages',
+                json=self._body(model, messages, max_tokens, temperature),
+            )
+        except self._httpx.HTTPError as e:
+            raise ProviderError(f'API error: {str(e)}')
+        self._check(response)
+
+        data = response.json()
+        text = ''.join(
+            block.get('text', '') for block in data.get('content', [])
+            if block.get('type') == 'text'
+        )
+        usage = data.get('usage') or {}
+        return Completion(
+            text=text,
+            usage=_usage(usage.get('input_tokens'), usage.get('output_tokens')),
+            provider=self.name,
+            model=model,
+        )
+
+    def stream(self, model, messages, max_tokens, temperature):
+        body = self._body(model, messages, max_tokens, temperature)
+        body['stream'] = True
+        request = self._http.build_request('POST', '/v1/messages', json=body)
+        try:
+            response = self._http.send(request, stream=True)
+        except self._httpx.HTTPError as e:
+            raise ProviderError(f'API error: {str(e)}')
+        try:
+            self._check(response)
+        except LLMError:
+            response.close()
+            raise
+
+        def deltas(handle):
+            prompt_tokens = completion_tokens = 0
+            try:
+                for line in response.iter_lines():
+                    if not line.startswith('data:'):
+                        continue
+                    event = json.loads(line[5:].strip() or '{}')
+                    kind = event.get('type')
+                    if kind == 'message_start':
+                        usage = event.get('message', {}).get('usage', {})
+                        prompt_tokens = usage.get('input_tokens', 0)
+                    elif kind == 'content_block_delta':
+                        text = event.get('delta', {}).get('text')
+                        if text:
+                            yield text
+                    elif kind == 'message_delta':
+                        completion_tokens = event.get('usage', {}).get('output_tokens', 0)
+                    elif kind == 'error':
+                        raise ProviderError(f"API error: {event.get('error')}")
+                handle.usage = _usage(prompt_tokens, completion_tokens)
+            except self._httpx.HTTPError as e:
+                raise ProviderError(f'API error: {str(e)}')
+
+        return CompletionStream(deltas, response.close, self.name, model, response)
+
+    def list_models(self):
+        try:
+            response = self._http.get('/v1/models')
+        except self._httpx.HTTPError as e:
+            raise ProviderError(f'API error: {str(e)}')
+        self._check(response)
+        return [m['id'] for m in response.json().get('data', [])]
+
+    def close(self):
+        self._http.close()
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies for one provider and model"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct, min_samples):
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class _Timer:
+    """
+    One thread that runs delayed callbacks, so an armed hedge doesn't hold
+    a thread of its own while it waits
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._thread = None
+
+    def call_at(self, deadline, callback):
+        """Run callback at `deadline` (time.monotonic()); returns a handle for cancel()"""
+        entry = [deadline, next(self._seq), callback]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='llm-hedge-timer', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry
+
+    @staticmethod
+    def cancel(entry):
+        # Left in the heap and skipped when it comes due
+        entry[2] = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                _, _, callback = heapq.heappop(self._heap)
+            if callback is not None:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"Hedge timer callback failed: {e}")
+
+
+class _Race:
+    """A primary call and its (possible) hedge; the first to claim() wins"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.primary_done = False
+        self.hedge = None
+        self.winner = None
+
+    def claim(self, who):
+        with self.lock:
+            if self.winner is None:
+                self.winner = who
+            return self.winner == who
+
+
+class LLMGateway:
+
+    def __init__(self, providers, routes, hedge_percentile=95.0,
+                 hedge_min_samples=20, hedge_max=4):
+        self.providers = providers
+        self.routes = routes
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        # Per (provider, model): a short summary on a small model mustn't
+        # pull down the percentile that decides when a long analysis is hedged
+        self._latency = {}
+        self._latency_lock = threading.Lock()
+        # Only hedges run here, never primaries, and at most hedge_max at a
+        # time, so nothing ever queues behind a slot
+        self._hedge_slots = threading.BoundedSemaphore(max(hedge_max, 1))
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(hedge_max, 1),
+            thread_name_prefix='llm-hedge',
+        ) if hedge_max > 0 else None
+        self._timer = _Timer()
+
+    def _tracker(self, provider, model):
+        tracker = self._latency.get((provider, model))
+        if tracker is None:
+            with self._latency_lock:
+                tracker = self._latency.setdefault((provider, model), LatencyTracker())
+        return tracker
+
+    def route(self, doc_type):
+        """Resolve a docType to [(provider, model), ...], primary first"""
+        route = self.routes.get(doc_type) or self.routes.get('default') or DEFAULT_ROUTE
+        targets = []
+        for key in ('primary', 'secondary'):
+            if route.get(key):
+                provider, model = _parse_target(route[key])
+                if provider in self.providers:
+                    targets.append((provider, model))
+        if not targets:
+            raise ProviderError(f'No configured LLM provider for docType {doc_type}')
+        return targets
+
+    def _timed_complete(self, provider, model, messages, max_tokens, temperature, doc_type=None):
+        start = time.monotonic()
+        try:
+            result = self.providers[provider].complete(model, messages, max_tokens, temperature)
+        except LLMError:
+            metrics.LLM_ERRORS.inc(provider=provider, model=model, doc_type=doc_type)
+            raise
+        elapsed = time.monotonic() - start
+        self._tracker(provider, model).record(elapsed)
+        metrics.observe_llm(provider, model, doc_type, elapsed, result.usage)
+        return result
+
+    def complete(self, doc_type, messages, max_tokens=2000, temperature=0.7):
+        targets = self.route(doc_type)
+        primary = targets[0]
+        args = (messages, max_tokens, temperature)
+
+        hedge_after = None
+        if len(targets) > 1 and self._executor is not None:
+            hedge_after = self._tracker(*primary).percentile(
+                self.hedge_percentile, self.hedge_min_samples
+            )
+        if hedge_after is None:
+            return self._timed_complete(*primary, *args, doc_type=doc_type)
+        return self._hedged_complete(doc_type, primary, targets[1], args, hedge_after)
+
+    def _hedged_complete(self, doc_type, primary, secondary, args, hedge_after):
+        """
+        Read the primary as a stream on this thread; if it is still running
+        `hedge_after` seconds after it was sent, the timer starts a hedge.
+        A hedge that answers first closes the primary and its reply is used.
+        """
+        provider, model = primary
+        started = time.monotonic()
+        stream = self.stream(doc_type, *args)
+        stream.mode = 'complete'
+        race = _Race(stream)
+        timer = self._timer.call_at(
+            started + hedge_after,
+            lambda: self._start_hedge(race, secondary, args, doc_type, hedge_after),
+        )
+
+        text, error = None, None
+        try:
+            text = ''.join(stream)
+        except Exception as e:
+            error = e
+        finally:
+            self._timer.cancel(timer)
+            stream.close()
+        with race.lock:
+            race.primary_done = True
+            hedge = race.hedge
+
+        if error is None:
+            self._tracker(provider, model).record(time.monotonic() - started)
+            if race.claim('primary'):
+                return Completion(text=text, usage=stream.usage, provider=provider, model=model)
+        if hedge is None:
+            raise error
+        try:
+            # The hedge won (and closed the primary), or the primary failed
+            return hedge.result()
+        except LLMError:
+            if isinstance(error, LLMError):
+                raise error
+            raise
+
+    def _start_hedge(self, race, target, args, doc_type, hedge_after):
+        """Timer callback: send the hedge, unless the primary is done or no slot is free"""
+        with race.lock:
+            if race.primary_done:
+                return
+            if not self._hedge_slots.acquire(blocking=False):
+                logger.info(f"Not hedging {race.stream.provider}: all hedge slots are busy")
+                return
+            logger.info(
+                f"Hedging {race.stream.provider} after {hedge_after:.2f}s with {target[0]}:{target[1]}"
+            )
+            race.hedge = self._executor.submit(self._run_hedge, race, target, args, doc_type)
+
+    def _run_hedge(self, race, target, args, doc_type):
+        try:
+            # A losing hedge still records its latency, so the percentile stays honest
+            result = self._timed_complete(*target, *args, doc_type=doc_type)
+        finally:
+            self._hedge_slots.release()
+        if race.claim('hedge'):
+            # Drops the primary's connection; the caller picks up this result
+            race.stream.abort()
+        return result
+
+    def stream(self, doc_type, messages, max_tokens=2000, temperature=0.7):
+        """Streams go to the primary only; a hedge would double the output"""
+        provider, model = self.route(doc_type)[0]
+        started = time.monotonic()
+        try:
+            stream = self.providers[provider].stream(model, messages, max_tokens, temperature)
+        except LLMError:
+            metrics.LLM_ERRORS.inc(provider=provider, model=model, doc_type=doc_type)
+            raise
+        stream.doc_type = doc_type
+        stream.started = started
+        return stream
+
+    def list_models(self):
+        return {name: p.list_models() for name, p in self.providers.items()}
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        for provider in self.providers.values():
+            provider.close()
+
+
+def _load_routes(raw):
+    if not raw:
+        raw = {}
+    elif isinstance(raw, str):
+        raw = json.loads(raw)
+    routes = dict(INTERNAL_ROUTES)
+    routes.update(raw)
+    routes.setdefault('default', DEFAULT_ROUTE)
+    return routes
+
+
+def build_gateway(config):
+    """Build a gateway from a Flask config mapping"""
+    providers = {}
+    timeout = float(config.get('LLM_TIMEOUT', 60))
+    pool_size = int(config.get('LLM_POOL_SIZE', 20))
+
+    if config.get('OPENAI_API_KEY'):
+        providers['openai'] = OpenAIProvider(
+            config['OPENAI_API_KEY'],
+            base_url=config.get('OPENAI_BASE_URL'),
+            timeout=timeout,
+            max_connections=pool_size,
+        )
+    if config.get('CLAUDE_API_KEY'):
+        providers['anthropic'] = AnthropicProvider(
+            config['CLAUDE_API_KEY'],
+            base_url=config.get('ANTHROPIC_BASE_URL'),
+            timeout=timeout,
+            max_connections=pool_size,
+        )
+    if not providers:
+        raise ValueError("Neither OPENAI_API_KEY nor CLAUDE_API_KEY found in configuration")
+
+    return LLMGateway(
+        providers,
+        _load_routes(config.get('LLM_ROUTES')),
+        hedge_percentile=float(config.get('LLM_HEDGE_PERCENTILE', 95)),
+        hedge_min_samples=int(config.get('LLM_HEDGE_MIN_SAMPLES', 20)),
+        hedge_max=int(config.get('LLM_HEDGE_MAX', 4)),
+    )
+
+
+_gateway_lock = threading.Lock()
+
+
+def get_gateway(app=None):
+    """
+    Return this worker's gateway, building it on first use. The owning pid is
+    checked so a gateway inherited across fork() is never reused.
+    """
+    app = app or current_app._get_current_object()
+    entry = app.extensions.get('llm_gateway')
+    if entry and entry[0] == os.getpid():
+        return entry[1]
+
+    with _gateway_lock:
+        entry = app.extensions.get('llm_gateway')
+        if entry and entry[0] == os.getpid():
+            return entry[1]
+        gateway = build_gateway(app.config)
+        app.extensions['llm_gateway'] = (os.getpid(), gateway)
+        return gateway
@@ -0,0 +1,47 @@
+# app/services/local_store.py
+"""
+Tiny SQLite store for state that must be shared by every gunicorn worker on
+the same box (caches, rate limits, idempotency records) without a round trip
+to the main database.
+
+Connections are cached per thread and per process, so a connection opened
+before fork() is never reused in the child.
+"""
+
+import os
+import sqlite3
+import threading
+
+_local = threading.local()
+
+
+def default_path(app):
+    return app.config.get('LOCAL_STORE_PATH') or os.path.join(app.instance_path, 'local_store.db')
+
+
+def connect(path):
+    """Return this thread's autocommit connection to the store at `path`"""
+    conns = getattr(_local, 'conns', None)
+    if conns is None or getattr(_local, 'pid', None) != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+
+    conn = conns.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conns[path] = conn
+    return conn
+
+
+def pid_alive(pid):
+    """Whether a process on this box still exists (for reclaiming dead workers' leases)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
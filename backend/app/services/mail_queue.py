@@ -0,0 +1,291 @@
+# app/services/mail_queue.py
+"""
+Outbound mail queue.
+
+Request handlers never talk to SMTP: `enqueue()` adds a row to
+outbound_emails in the caller's transaction, so the mail is only sent if
+whatever prompted it is committed. A MailSender drains the queue in the
+background, claiming up to MAIL_QUEUE_BATCH_SIZE due messages at a time
+and sending them all over one SMTP connection (flask_mail's
+`mail.connect()`, which also honours MAIL_MAX_EMAILS).
+
+A failed message is retried with exponential backoff plus jitter
+(MAIL_QUEUE_BACKOFF_BASE doubling up to MAIL_QUEUE_BACKOFF_MAX) and marked
+failed after MAIL_QUEUE_MAX_ATTEMPTS. If the connection itself drops, the
+rest of the batch goes back to the queue without using up an attempt; the
+sender backs off on the same schedule, counted in consecutive connection
+failures, so an SMTP outage of any length delays mail but never fails it.
+
+A message can name a preparer, registered with @preparer, that fills in
+its body right before sending, for content that needs slow work (like a
+Stripe checkout link) that mustn't happen in the request.
+
+Senders start lazily inside web workers (MAIL_QUEUE_ENABLED) or as a
+dedicated process via `python process_mail_queue.py`.
+"""
+
+import os
+import random
+import smtplib
+import socket
+import threading
+import logging
+from datetime import datetime, timedelta
+
+from flask_mail import Message
+from sqlalchemy import func, update
+
+from app import db, mail
+from app.models import OutboundEmail
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+PREPARERS = {}
+
+
+def preparer(name):
+    """Register fn(email) that fills in an OutboundEmail just before it is sent"""
+    def register(fn):
+        PREPARERS[name] = fn
+        return fn
+    return register
+
+
+def enqueue(subject, recipients, body=None, html=None, sender=None, preparer=None, context=None):
+    """Queue a message (the caller commits)"""
+    email = OutboundEmail(
+        subject=subject,
+        recipients=list(recipients),
+        body=body,
+        html=html,
+        sender=sender,
+        preparer=preparer,
+        context=context,
+        status='queued',
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.session.add(email)
+    return email
+
+
+# Statuses stats() reports
+UNSENT = ('queued', 'sending', 'failed')
+
+
+def stats():
+    """
+    Queue depth by status, plus the age of the oldest due message. Sent
+    rows only ever accumulate, so they aren't counted here (see the
+    mail_queue_sent_total counter); the rest is read from the
+    (status, next_attempt_at) index.
+    """
+    counts = dict(
+        db.session.query(OutboundEmail.status, func.count(OutboundEmail.id))
+        .filter(OutboundEmail.status.in_(UNSENT))
+        .group_by(OutboundEmail.status)
+        .all()
+    )
+    oldest = (
+        db.session.query(func.min(OutboundEmail.created_at))
+        .filter(OutboundEmail.status == 'queued', OutboundEmail.next_attempt_at <= datetime.utcnow())
+        .scalar()
+    )
+    return {
+        'queued': counts.get('queued', 0),
+        'sending': counts.get('sending', 0),
+        'failed': counts.get('failed', 0),
+        'oldest_due_seconds': round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0,
+    }
+
+
+# Errors that mean the connection is gone, not that the message is bad
+_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, socket.timeout)
+
+
+class MailSender:
+
+    def __init__(self, app, batch_size=50, poll_interval=5.0, max_attempts=8,
+                 backoff_base=30, backoff_max=3600, stale_after=300):
+        self.app = app
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stale_after = stale_after
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        # Connection failures in a row, for the outage backoff
+        self._outages = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='mail-sender', daemon=True)
+        self._thread.start()
+        logger.info(f"Mail sender {self.name} started")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def wake(self):
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    self.requeue_stale()
+                    if self.send_batch():
+                        continue
+            except Exception as e:
+                logger.error(f"Mail sender error: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _claim(self):
+        due = [
+            email_id for (email_id,) in
+            db.session.query(OutboundEmail.id)
+            .filter(OutboundEmail.status == 'queued', OutboundEmail.next_attempt_at <= datetime.utcnow())
+            .order_by(OutboundEmail.next_attempt_at, OutboundEmail.id)
+            .limit(self.batch_size)
+        ]
+        if not due:
+            return []
+        db.session.execute(
+            update(OutboundEmail)
+            .where(OutboundEmail.id.in_(due), OutboundEmail.status == 'queued')
+            .values(status='sending', claimed_by=self.name, claimed_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return (
+            OutboundEmail.query
+            .filter(OutboundEmail.id.in_(due), OutboundEmail.claimed_by == self.name,
+                    OutboundEmail.status == 'sending')
+            .order_by(OutboundEmail.id)
+            .all()
+        )
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _failed(self, email, error):
+        email.attempts += 1
+        email.last_error = str(error)
+        email.claimed_by = None
+        if email.attempts >= self.max_attempts:
+            logger.error(f"Giving up on email {email.id} to {email.recipients}: {error}")
+            email.status = 'failed'
+        else:
+            delay = self._backoff(email.attempts)
+            logger.warning(f"Email {email.id} failed (attempt {email.attempts}), retrying in {delay:.0f}s: {error}")
+            email.status = 'queued'
+            email.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+
+    def _deferred(self, email, error, delay):
+        """Back in the queue after a connection failure; attempts are left alone"""
+        email.last_error = str(error)
+        email.claimed_by = None
+        email.status = 'queued'
+        email.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+
+    def _message(self, email):
+        if email.preparer:
+            PREPARERS[email.preparer](email)
+        return Message(
+            subject=email.subject,
+            recipients=email.recipients,
+            body=email.body,
+            html=email.html,
+            sender=email.sender,
+        )
+
+    def send_batch(self):
+        """Send one batch over a single connection; returns the number claimed"""
+        emails = self._claim()
+        if not emails:
+            return 0
+        pending = list(emails)
+        try:
+            with mail.connect() as conn:
+                self._outages = 0
+                while pending:
+                    email = pending[0]
+                    try:
+                        conn.send(self._message(email))
+                    except _CONNECTION_ERRORS:
+                        raise
+                    except Exception as e:
+                        self._failed(email, e)
+                    else:
+                        email.status = 'sent'
+                        email.sent_at = datetime.utcnow()
+                        email.attempts += 1
+                        metrics.MAIL_SENT.inc()
+                    pending.pop(0)
+                    db.session.commit()
+        except _CONNECTION_ERRORS + (OSError,) as e:
+            # Server unreachable or hung up: not the messages' fault, so
+            # retry the rest later without counting an attempt
+            self._outages += 1
+            delay = self._backoff(self._outages)
+            logger.warning(
+                f"SMTP connection failed with {len(pending)} emails unsent, retrying in {delay:.0f}s: {e}"
+            )
+            for email in pending:
+                self._deferred(email, e, delay)
+            db.session.commit()
+        sent = sum(1 for e in emails if e.status == 'sent')
+        logger.info(f"Mail batch: {sent}/{len(emails)} sent")
+        return len(emails)
+
+    def requeue_stale(self):
+        """Put back messages claimed by a sender that died mid-batch"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        requeued = db.session.execute(
+            update(OutboundEmail)
+            .where(OutboundEmail.status == 'sending', OutboundEmail.claimed_at < cutoff)
+            .values(status='queued', claimed_by=None)
+        ).rowcount
+        db.session.commit()
+        if requeued:
+            logger.warning(f"Re-queued {requeued} stale outbound emails")
+
+
+def build_sender(app):
+    return MailSender(
+        app,
+        batch_size=int(app.config.get('MAIL_QUEUE_BATCH_SIZE', 50)),
+        poll_interval=float(app.config.get('MAIL_QUEUE_POLL_INTERVAL', 5.0)),
+        max_attempts=int(app.config.get('MAIL_QUEUE_MAX_ATTEMPTS', 8)),
+        backoff_base=float(app.config.get('MAIL_QUEUE_BACKOFF_BASE', 30)),
+        backoff_max=float(app.config.get('MAIL_QUEUE_BACKOFF_MAX', 3600)),
+        stale_after=int(app.config.get('MAIL_QUEUE_STALE_AFTER', 300)),
+    )
+
+
+_sender_lock = threading.Lock()
+
+
+def ensure_sender(app):
+    """Start this process's embedded sender once (never inherited across fork)"""
+    if not app.config.get('MAIL_QUEUE_ENABLED', True):
+        return None
+    entry = app.extensions.get('mail_sender')
+    if entry and entry[0] == os.getpid():
+        return entry[1]
+    with _sender_lock:
+        entry = app.extensions.get('mail_sender')
+        if entry and entry[0] == os.getpid():
+            return entry[1]
+        sender = build_sender(app)
+        sender.start()
+        app.extensions['mail_sender'] = (os.getpid(), sender)
+        return sender
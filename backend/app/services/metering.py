@@ -0,0 +1,210 @@
+# app/services/metering.py
+"""
+Credit metering for /api/chat.
+
+Every movement is an append-only row in usage_ledger:
+
+    charge   credits reserved before a generation (credits_charged > 0)
+    refund   reservation returned after a failed generation (< 0)
+    chat     tokens used by a generation (no credits)
+    summary  tokens used by conversation summarization (no credits)
+
+A credit is one analysis: the first metered call in one of the user's
+saved sessions reserves CHAT_CREDIT_COST, later calls in that session are
+free. Calls without a session_id, or with one that isn't a saved session of
+the user's, are charged individually.
+
+The balance on users.credits_remaining is only ever changed by a single
+conditional UPDATE (`... WHERE credits_remaining >= cost`), so concurrent
+requests from the same account on any number of workers can never
+overspend and never lose an update. A session is claimed the same way
+(`... WHERE charged_at IS NULL`) in the transaction that decrements the
+balance, so of several parallel first calls exactly one is charged, and a
+claim is undone with the charge if the balance is short. The charge row
+and the dashboard aggregate are written in that same short transaction.
+
+Nothing reads the ledger on the hot path; reports read usage_rollups,
+built by `python rollup_usage.py`.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, case, func, or_, select, update
+
+from app import db
+from app.models import Session, UsageLedger, UsageRollup, User
+from app.services import aggregates, user_cache
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientCredits(Exception):
+    """The account has no credits left for a new analysis"""
+    status_code = 402
+
+
+# Accounts whose balance is never decremented
+_UNLIMITED = or_(User.unlimited_analysis.is_(True), User.credits_remaining.is_(None))
+
+
+def _claim_session(user_id, session_id):
+    """
+    Mark a saved session as paid for, inside the caller's transaction.
+    Returns True if this call claimed it (and must be charged), False if it
+    is already paid for, and None if the user has no such session.
+    """
+    claimed = db.session.execute(
+        update(Session)
+        .where(
+            Session.user_id == user_id,
+            Session.session_id == session_id,
+            Session.charged_at.is_(None),
+        )
+        # Not a session write, so its timestamp stays put
+        .values(charged_at=datetime.utcnow(), timestamp=Session.timestamp)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if claimed:
+        return True
+    exists = db.session.query(Session.id).filter_by(user_id=user_id, session_id=session_id).first()
+    return False if exists else None
+
+
+def reserve(user_id, session_id=None, doc_type=None, cost=None):
+    """
+    Reserve credits for a generation. Returns the number of credits charged
+    (0 when the session is already paid for) or raises InsufficientCredits.
+    Commits.
+    """
+    if cost is None:
+        cost = int(current_app.config.get('CHAT_CREDIT_COST', 1))
+    if cost <= 0:
+        return 0
+    if session_id and _claim_session(user_id, session_id) is False:
+        return 0
+
+    charged = db.session.execute(
+        update(User)
+        .where(User.id == user_id, or_(_UNLIMITED, User.credits_remaining >= cost))
+        .values(credits_remaining=case(
+            (_UNLIMITED, User.credits_remaining),
+            else_=User.credits_remaining - cost,
+        ))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if charged != 1:
+        # Also releases the session claim
+        db.session.rollback()
+        raise InsufficientCredits('No credits remaining. Upgrade your plan or buy more credits.')
+
+    db.session.add(UsageLedger(
+        user_id=user_id,
+        session_id=session_id,
+        kind='charge',
+        doc_type=doc_type,
+        credits_charged=cost,
+    ))
+    aggregates.credits_consumed(user_id, cost)
+    user_cache.changed(user_id)
+    db.session.commit()
+    return cost
+
+
+def refund(user_id, credits, session_id=None, doc_type=None):
+    """
+    Return a reservation after a failed generation, and release the
+    session's claim so the next call in it is charged again. Commits.
+    """
+    if not credits:
+        return
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id, ~_UNLIMITED)
+        .values(credits_remaining=User.credits_remaining + credits)
+        .execution_options(synchronize_session=False)
+    )
+    if session_id:
+        db.session.execute(
+            update(Session)
+            .where(Session.user_id == user_id, Session.session_id == session_id)
+            .values(charged_at=None, timestamp=Session.timestamp)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.add(UsageLedger(
+        user_id=user_id,
+        session_id=session_id,
+        kind='refund',
+        doc_type=doc_type,
+        credits_charged=-credits,
+    ))
+    aggregates.credits_consumed(user_id, -credits)
+    user_cache.changed(user_id)
+    db.session.commit()
+    logger.info(f"Refunded {credits} credit(s) to user {user_id}")
+
+
+def record_usage(user_id, usage, provider=None, model=None, session_id=None,
+                 doc_type=None, kind='chat'):
+    """Append the token counts of one LLM call. Commits."""
+    usage = usage or {}
+    prompt_tokens = int(usage.get('prompt_tokens') or 0)
+    completion_tokens = int(usage.get('completion_tokens') or 0)
+    db.session.add(UsageLedger(
+        user_id=user_id,
+        session_id=session_id,
+        kind=kind,
+        provider=provider,
+        model=model,
+        doc_type=doc_type,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=int(usage.get('total_tokens') or prompt_tokens + completion_tokens),
+        credits_charged=0,
+    ))
+    db.session.commit()
+
+
+def credits_used(user_id):
+    """Net credits charged to a user, from the ledger"""
+    return (
+        db.session.query(func.coalesce(func.sum(UsageLedger.credits_charged), 0))
+        .filter(UsageLedger.user_id == user_id)
+        .scalar()
+    )
+
+
+def rollup(day):
+    """
+    (Re)build usage_rollups for one UTC day from the ledger in a single
+    grouped query. Idempotent, so it can be re-run for late rows.
+    Returns the number of user rows written; caller commits.
+    """
+    start = datetime(day.year, day.month, day.day)
+    end = start + timedelta(days=1)
+    rows = db.session.execute(
+        select(
+            UsageLedger.user_id,
+            func.sum(case((UsageLedger.kind.in_(('chat', 'summary')), 1), else_=0)),
+            func.sum(UsageLedger.prompt_tokens),
+            func.sum(UsageLedger.completion_tokens),
+            func.sum(UsageLedger.credits_charged),
+        )
+        .where(and_(UsageLedger.created_at >= start, UsageLedger.created_at < end))
+        .group_by(UsageLedger.user_id)
+    ).all()
+
+    UsageRollup.query.filter_by(day=day).delete(synchronize_session=False)
+    db.session.add_all([
+        UsageRollup(
+            user_id=user_id,
+            day=day,
+            calls=calls or 0,
+            prompt_tokens=prompt_tokens or 0,
+            completion_tokens=completion_tokens or 0,
+            credits_charged=credits or 0,
+        )
+        for user_id, calls, prompt_tokens, completion_tokens, credits in rows
+    ])
+    return len(rows)
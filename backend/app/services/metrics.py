@@ -0,0 +1,357 @@
+# app/services/metrics.py
+"""
+Prometheus metrics, aggregated across gunicorn workers.
+
+Each process keeps its counters and histograms in memory, so recording a
+sample is a dict update under a lock. At most every METRICS_FLUSH_INTERVAL
+seconds (checked whenever something is recorded) the process writes the
+series that changed to the local store: one row per process and series,
+holding the cumulative value. GET /metrics flushes its own process and
+then sums every process's rows, so the totals are the same whichever
+worker answers the scrape. When a process has exited, its rows are folded
+into a shared archive, so counters never go backwards when a worker is
+recycled.
+
+Gauges that describe shared state, such as mail queue depth, are read from
+the database at scrape time (app/routes/metrics.py) and aren't kept here.
+
+Request latency is measured to the response headers; for streamed chat
+replies, see the LLM histograms.
+"""
+
+import bisect
+import os
+import threading
+import time
+import uuid
+import logging
+from collections import defaultdict
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.services import local_store
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+# Rows of exited processes are summed into this one
+_ARCHIVE = 'exited'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _series(name, labels, extra=''):
+    labels = ','.join(p for p in (labels, extra) if p)
+    return f'{name}{{{labels}}}' if labels else name
+
+
+def render_family(name, kind, documentation, samples):
+    """Exposition lines for one family; samples are (labels dict, value)"""
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        rendered = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        lines.append(f'{_series(name, rendered)} {_format(value)}')
+    return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        self.path = None
+        self.flush_interval = 5.0
+        self._reset()
+
+    def _reset(self):
+        # Also runs in a forked child: nothing recorded by the parent, no locks it held
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # (name, labels, suffix, bucket index) -> cumulative value in this process
+        self._values = {}
+        self._dirty = set()
+        self._next_flush = 0.0
+        self._process = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+    def configure(self, path, flush_interval=5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        conn = local_store.connect(path)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS metric_processes ('
+            ' process TEXT PRIMARY KEY,'
+            ' pid INTEGER NOT NULL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS metric_values ('
+            ' process TEXT NOT NULL,'
+            ' name TEXT NOT NULL,'
+            ' labels TEXT NOT NULL,'
+            ' suffix TEXT NOT NULL,'
+            ' idx INTEGER NOT NULL,'
+            ' value REAL NOT NULL,'
+            ' PRIMARY KEY (process, name, labels, suffix, idx))'
+        )
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def add(self, updates):
+        with self._lock:
+            for key, amount in updates:
+                self._values[key] = self._values.get(key, 0) + amount
+                self._dirty.add(key)
+        if self.path and time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def flush(self):
+        """Write this process's changed series; skipped if another thread is already at it"""
+        if not self.path or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                rows = [(self._process, *key, self._values[key]) for key in self._dirty]
+                self._dirty = set()
+                self._next_flush = time.monotonic() + self.flush_interval
+            if not rows:
+                return
+            conn = local_store.connect(self.path)
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute(
+                    'INSERT OR IGNORE INTO metric_processes (process, pid) VALUES (?, ?)',
+                    (self._process, os.getpid()),
+                )
+                conn.executemany(
+                    'INSERT INTO metric_values (process, name, labels, suffix, idx, value) '
+                    'VALUES (?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (process, name, labels, suffix, idx) DO UPDATE SET value = excluded.value',
+                    rows,
+                )
+                conn.execute('COMMIT')
+            except Exception as e:
+                conn.execute('ROLLBACK')
+                with self._lock:
+                    self._dirty.update(row[1:5] for row in rows)
+                logger.warning(f"Metrics flush failed: {e}")
+        finally:
+            self._flush_lock.release()
+
+    def _fold_exited(self, conn):
+        for process, pid in conn.execute('SELECT process, pid FROM metric_processes').fetchall():
+            if process == self._process or local_store.pid_alive(pid):
+                continue
+            conn.execute(
+                'INSERT INTO metric_values (process, name, labels, suffix, idx, value) '
+                'SELECT ?, name, labels, suffix, idx, value FROM metric_values WHERE process = ? '
+                'ON CONFLICT (process, name, labels, suffix, idx) DO UPDATE SET value = value + excluded.value',
+                (_ARCHIVE, process),
+            )
+            conn.execute('DELETE FROM metric_values WHERE process = ?', (process,))
+            conn.execute('DELETE FROM metric_processes WHERE process = ?', (process,))
+
+    def collect(self):
+        """name -> [(labels, suffix, idx, value)], summed over every process on the box"""
+        if not self.path:
+            with self._lock:
+                rows = [(*key, value) for key, value in self._values.items()]
+        else:
+            self.flush()
+            conn = local_store.connect(self.path)
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._fold_exited(conn)
+                rows = conn.execute(
+                    'SELECT name, labels, suffix, idx, SUM(value) FROM metric_values '
+                    'GROUP BY name, labels, suffix, idx'
+                ).fetchall()
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        families = defaultdict(list)
+        for name, labels, suffix, idx, value in rows:
+            families[name].append((labels, suffix, idx, value))
+        return families
+
+    def render(self):
+        families = self.collect()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render(families.get(metric.name, [])))
+        return lines
+
+
+REGISTRY = Registry()
+os.register_at_fork(after_in_child=REGISTRY._reset)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        registry.register(self)
+
+    def _labels(self, labels):
+        return ','.join(f'{k}="{_escape(labels.get(k) or "")}"' for k in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount:
+            self.registry.add([((self.name, self._labels(labels), '', -1), amount)])
+
+    def render(self, rows):
+        return [f'{_series(self.name, labels)} {_format(value)}' for labels, _, _, value in sorted(rows)]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        # Bucket counts are stored per bucket and made cumulative when rendered;
+        # index len(buckets) is +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        self.registry.add([
+            ((self.name, labels, '_bucket', index), 1),
+            ((self.name, labels, '_sum', -1), value),
+        ])
+
+    def render(self, rows):
+        series = defaultdict(lambda: [defaultdict(float), 0.0])
+        for labels, suffix, idx, value in rows:
+            if suffix == '_bucket':
+                series[labels][0][idx] += value
+            elif suffix == '_sum':
+                series[labels][1] += value
+        lines = []
+        for labels in sorted(series):
+            counts, total = series[labels]
+            cumulative = 0
+            for index, bound in enumerate(self.buckets + (float('inf'),)):
+                cumulative += counts.get(index, 0)
+                le = '+Inf' if bound == float('inf') else _format(bound)
+                bucket = _series(self.name + '_bucket', labels, f'le="{le}"')
+                lines.append(f'{bucket} {_format(cumulative)}')
+            lines.append(f'{_series(self.name + "_sum", labels)} {_format(total)}')
+            lines.append(f'{_series(self.name + "_count", labels)} {_format(cumulative)}')
+        return lines
+
+
+# ----- the metrics -----
+
+_ROUTE = ('blueprint', 'route', 'method')
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time to response headers, by route', _ROUTE)
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'Requests by route and status', _ROUTE + ('status',))
+DB_QUERIES_PER_REQUEST = Histogram(
+    'db_queries_per_request', 'SQL statements run per request', _ROUTE, buckets=COUNT_BUCKETS)
+DB_SECONDS_PER_REQUEST = Histogram(
+    'db_time_per_request_seconds', 'Time spent in SQL per request', _ROUTE)
+DB_QUERY_SECONDS = Histogram(
+    'db_query_duration_seconds', 'Duration of individual SQL statements', ('statement',), buckets=QUERY_BUCKETS)
+
+_LLM = ('provider', 'model', 'doc_type')
+
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    'llm_time_to_first_token_seconds', 'Time from sending a streamed request to its first token', _LLM)
+LLM_REQUEST_SECONDS = Histogram(
+    'llm_request_duration_seconds', 'Total LLM call latency', _LLM + ('mode',))
+LLM_TOKENS = Counter(
+    'llm_tokens_total', 'Tokens used by LLM calls', _LLM + ('kind',))
+LLM_ERRORS = Counter(
+    'llm_errors_total', 'Failed LLM calls', _LLM)
+
+STRIPE_REQUEST_SECONDS = Histogram(
+    'stripe_request_duration_seconds', 'Stripe API call latency', ('method', 'endpoint', 'status'))
+
+SESSION_STORE_BYTES = Counter(
+    'session_store_bytes_total', 'Session payload bytes read from and written to the store', ('op',))
+
+MAIL_SENT = Counter(
+    'mail_queue_sent_total', 'Outbound emails sent')
+
+
+def observe_llm(provider, model, doc_type, seconds, usage=None, mode='complete'):
+    labels = dict(provider=provider, model=model, doc_type=doc_type)
+    LLM_REQUEST_SECONDS.observe(seconds, mode=mode, **labels)
+    usage = usage or {}
+    LLM_TOKENS.inc(usage.get('prompt_tokens') or 0, kind='prompt', **labels)
+    LLM_TOKENS.inc(usage.get('completion_tokens') or 0, kind='completion', **labels)
+
+
+# ----- SQLAlchemy -----
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('metrics_started', None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    DB_QUERY_SECONDS.observe(seconds, statement=statement.lstrip().split(None, 1)[0].upper())
+    if has_request_context() and '_metrics_started' in g:
+        g._db_queries += 1
+        g._db_seconds += seconds
+
+
+# ----- Flask -----
+
+def _request_started():
+    g._metrics_started = time.perf_counter()
+    g._db_queries = 0
+    g._db_seconds = 0.0
+
+
+def _request_finished(response):
+    started = g.pop('_metrics_started', None)
+    if started is None:
+        return response
+    labels = dict(
+        blueprint=request.blueprint or '',
+        route=request.url_rule.rule if request.url_rule else 'unmatched',
+        method=request.method,
+    )
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, **labels)
+    HTTP_REQUESTS.inc(status=str(response.status_code), **labels)
+    DB_QUERIES_PER_REQUEST.observe(g.get('_db_queries', 0), **labels)
+    DB_SECONDS_PER_REQUEST.observe(g.get('_db_seconds', 0.0), **labels)
+    return response
+
+
+def init_app(app):
+    REGISTRY.configure(
+        local_store.default_path(app),
+        flush_interval=float(app.config.get('METRICS_FLUSH_INTERVAL', 5)),
+    )
+    app.before_request(_request_started)
+    app.after_request(_request_finished)
@@ -0,0 +1,130 @@
+# app/services/passwords.py
+"""
+Password hashing off the request thread.
+
+Hashes are werkzeug's, made with the operator-configured method and cost
+(PASSWORD_HASH_METHOD / PASSWORD_HASH_ITERATIONS). Hashing and checking run
+on a small per-process thread pool of PASSWORD_HASH_WORKERS threads; hashlib
+releases the GIL while deriving, so a login burst can use at most that many
+cores per worker and everything else keeps running. At most
+PASSWORD_HASH_MAX_QUEUE more calls may wait for the pool; beyond that, or
+after PASSWORD_HASH_TIMEOUT seconds of waiting, HasherBusy is raised and
+the route answers 503 with Retry-After.
+
+A stored hash whose method prefix differs from the one werkzeug writes for
+the configured method (older iteration count, other scrypt parameters,
+another algorithm) `needs_rehash()`; login upgrades it after the password
+has been verified.
+
+Measure the cost settings with `python benchmark_passwords.py`.
+"""
+
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+
+class HasherBusy(Exception):
+    """Too many password hashes already queued in this worker"""
+    status_code = 503
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def method_string(method='pbkdf2:sha256', iterations=600000):
+    """The werkzeug method string for a configured method and cost"""
+    if method.startswith('pbkdf2') and method.count(':') < 2:
+        hash_name = method.split(':')[1] if ':' in method else 'sha256'
+        return f'pbkdf2:{hash_name}:{int(iterations)}'
+    return method
+
+
+class PasswordHasher:
+
+    def __init__(self, method='pbkdf2:sha256:600000', workers=2, max_queue=32, timeout=10.0):
+        self.method = method
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        # A well-formed hash to check against when the account doesn't exist,
+        # so unknown and known emails take the same time
+        self._dummy = generate_password_hash(os.urandom(16).hex(), method=method)
+        # What werkzeug writes before the salt, defaults filled in (e.g.
+        # "scrypt" is stored as "scrypt:32768:8:1"), so stored hashes compare
+        # against the same form
+        self.prefix = self._dummy.split('$', 1)[0]
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy('Too many sign-ins in progress, try again shortly')
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise HasherBusy('Timed out waiting to check the password')
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """Check a password; pass pwhash=None for an unknown account"""
+        ok = self._run(check_password_hash, pwhash or self._dummy, password)
+        return ok and pwhash is not None
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.prefix
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+def build_hasher(app):
+    return PasswordHasher(
+        method=method_string(
+            app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256'),
+            app.config.get('PASSWORD_HASH_ITERATIONS', 600000),
+        ),
+        workers=int(app.config.get('PASSWORD_HASH_WORKERS', 2)),
+        max_queue=int(app.config.get('PASSWORD_HASH_MAX_QUEUE', 32)),
+        timeout=float(app.config.get('PASSWORD_HASH_TIMEOUT', 10)),
+    )
+
+
+_hasher_lock = threading.Lock()
+
+
+def get_hasher(app=None):
+    """This process's hasher (its thread pool is never inherited across fork)"""
+    app = app or current_app._get_current_object()
+    entry = app.extensions.get('password_hasher')
+    if entry and entry[0] == os.getpid():
+        return entry[1]
+    with _hasher_lock:
+        entry = app.extensions.get('password_hasher')
+        if entry and entry[0] == os.getpid():
+            return entry[1]
+        hasher = build_hasher(app)
+        app.extensions['password_hasher'] = (os.getpid(), hasher)
+        return hasher
+
+
+def hash_password(password):
+    return get_hasher().hash(password)
+
+
+def verify_password(pwhash, password):
+    return get_hasher().verify(pwhash, password)
+
+
+def needs_rehash(pwhash):
+    return get_hasher().needs_rehash(pwhash)
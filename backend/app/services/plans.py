@@ -0,0 +1,57 @@
+# app/services/plans.py
+"""
+What each subscription plan grants: seats, credits and session limits.
+
+Signup starts every account on the free allowance; the paid plan's
+allowance is applied when its Stripe checkout completes.
+"""
+
+# Plan definitions
+PLAN_CONFIG = {
+    'essential': {
+        'seat_limit': 1,
+        'credits_remaining': 3,
+        'max_seats_purchase': 0,
+        'unlimited_analysis': False,
+        'max_concurrent_sessions': None,
+    },
+    'growth': {
+        'seat_limit': 1,
+        'credits_remaining': 10,
+        'max_seats_purchase': 5,
+        'unlimited_analysis': False,
+        'max_concurrent_sessions': None,
+    },
+    'founder': {
+        'seat_limit': 1,
+        'credits_remaining': None,  # Unlimited
+        'max_seats_purchase': 0,
+        'unlimited_analysis': True,
+        'max_concurrent_sessions': 5,
+    },
+}
+
+
+def allowance(plan_key):
+    """
+    The users columns a plan sets, or None for plans without an entry
+    (priced only in Stripe), which leave the account as it is
+    """
+    plan = PLAN_CONFIG.get(plan_key)
+    if plan is None:
+        return None
+    return {
+        'credits_remaining': plan['credits_remaining'],
+        'unlimited_analysis': plan.get('unlimited_analysis', False),
+        'max_concurrent_sessions': plan.get('max_concurrent_sessions'),
+    }
+
+
+def apply_allowance(user, plan_key):
+    """Set the credit fields from a plan. Returns True if anything applied."""
+    values = allowance(plan_key)
+    if values is None:
+        return False
+    for field, value in values.items():
+        setattr(user, field, value)
+    return True
@@ -0,0 +1,45 @@
+# app/services/prefork.py
+"""
+Hooks for running under gunicorn with preload_app (see gunicorn.conf.py).
+
+The master builds the app once, then `warm()` imports the SDKs that
+workers would otherwise import lazily on first use and freezes the
+garbage collector, so the forked workers share those pages instead of
+each holding a copy. `after_fork()` runs in every worker and discards
+anything that must not be shared across processes.
+
+Everything else that is per process (LLM gateway pools, background
+threads, local store connections, the password hash pool) is created
+lazily and keyed by os.getpid(), so a worker never reuses its parent's.
+"""
+
+import gc
+import importlib
+import logging
+
+from app import db
+from app.services import stripe_client
+
+logger = logging.getLogger(__name__)
+
+# Imported lazily by the code that uses them; loaded up front only in the master
+LAZY_MODULES = ('stripe', 'httpx', 'openai')
+
+
+def warm():
+    for name in LAZY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            logger.info(f"Not preloading {name}: not installed")
+    # Objects that exist now live for the whole process; keeping them out of
+    # the collector stops it from touching (and so copying) their pages
+    gc.freeze()
+
+
+def after_fork(app):
+    """Drop connections inherited from the master (never close them: the master owns those sockets)"""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    stripe_client.reset_after_fork()
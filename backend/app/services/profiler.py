@@ -0,0 +1,229 @@
+# app/services/profiler.py
+"""
+On-demand sampling profiler for slow routes.
+
+Off unless PROFILING_ENABLED is set, in which case a request under one of
+PROFILING_ROUTES (path prefixes) is profiled when
+
+- it carries `X-Profile: <PROFILING_TOKEN>` (operators only; a wrong or
+  missing token is silently ignored), or
+- it is picked at random, with probability PROFILING_SAMPLE_RATE.
+
+A profiled request gets a sampler thread that reads the request thread's
+stack every PROFILING_INTERVAL seconds through sys._current_frames(), so
+the profiled code runs unmodified (no tracing hooks) and the cost is one
+stack walk per sample. Sampling stops when the response is closed, which
+for streamed chat replies is after the last event, or after
+PROFILING_MAX_SECONDS. At most PROFILING_MAX_ACTIVE requests per worker
+are profiled at once.
+
+Profiles are written to PROFILING_DIR (instance/profiles by default) as
+speedscope JSON (open at https://www.speedscope.app) or collapsed stacks
+(`flamegraph.pl`, or speedscope too), keeping the newest PROFILING_KEEP
+files. The response's X-Profile-Id header names the file.
+
+Only the request thread is sampled: time spent waiting on the LLM gateway's
+pool shows up as the wait, not as the provider call itself.
+"""
+
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import logging
+from collections import Counter
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'speedscope': '.speedscope.json', 'collapsed': '.folded'}
+
+
+def _short_path(filename):
+    """Path relative to whichever sys.path entry contains it"""
+    for prefix in sorted((p for p in sys.path if p), key=len, reverse=True):
+        prefix = os.path.join(os.path.abspath(prefix), '')
+        if filename.startswith(prefix):
+            return filename[len(prefix):]
+    return filename
+
+
+class Profile:
+    """Stack samples of one thread, taken from a background thread"""
+
+    def __init__(self, profile_id, name, thread_id, interval=0.005, max_seconds=120):
+        self.id = profile_id
+        self.name = name
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        # Frames are functions: (name, file, first line)
+        self.frames = []
+        self._frame_ids = {}
+        # (stack of frame indexes, root first; seconds since the previous sample)
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'profiler-{thread_id}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _frame_id(self, code):
+        index = self._frame_ids.get(code)
+        if index is None:
+            index = self._frame_ids[code] = len(self.frames)
+            self.frames.append((code.co_name, _short_path(code.co_filename), code.co_firstlineno))
+        return index
+
+    def _run(self):
+        started = last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None or now - started > self.max_seconds:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append((tuple(stack), now - last))
+            last = now
+
+    def collapsed(self):
+        """One `root;...;leaf count` line per distinct stack"""
+        labels = [f'{name} ({path}:{line})' for name, path, line in self.frames]
+        counts = Counter(stack for stack, _ in self.samples)
+        return ''.join(
+            ';'.join(labels[i] for i in stack) + f' {count}\n'
+            for stack, count in sorted(counts.items())
+        )
+
+    def speedscope(self):
+        """A sampled profile in speedscope's file format, in time order"""
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {
+                'frames': [{'name': name, 'file': path, 'line': line} for name, path, line in self.frames],
+            },
+            'profiles': [{
+                'type': 'sampled',
+                'name': self.name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weight for _, weight in self.samples),
+                'samples': [list(stack) for stack, _ in self.samples],
+                'weights': [weight for _, weight in self.samples],
+            }],
+            'name': self.name,
+            'activeProfileIndex': 0,
+            'exporter': 'sekki-platform',
+        }
+
+
+class RequestProfiler:
+
+    def __init__(self, directory, routes, token=None, sample_rate=0.0, fmt='speedscope',
+                 interval=0.005, max_seconds=120, max_active=2, keep=200):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown PROFILING_FORMAT '{fmt}'")
+        self.directory = directory
+        self.routes = tuple(routes)
+        self.token = token
+        self.sample_rate = sample_rate
+        self.fmt = fmt
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.keep = keep
+        self._slots = threading.BoundedSemaphore(max_active)
+
+    def _wanted(self):
+        if not request.path.startswith(self.routes):
+            return False
+        header = request.headers.get('X-Profile')
+        if header and self.token and hmac.compare_digest(header, self.token):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def before_request(self):
+        if not self._wanted() or not self._slots.acquire(blocking=False):
+            return
+        route = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_')
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{route}-{uuid.uuid4().hex[:6]}"
+        profile = Profile(profile_id, f'{request.method} {request.path}', threading.get_ident(),
+                          self.interval, self.max_seconds)
+        profile.start()
+        g._profile = profile
+
+    def after_request(self, response):
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            response.headers['X-Profile-Id'] = profile.id
+            response.call_on_close(lambda: self.finish(profile))
+        return response
+
+    def teardown_request(self, exc):
+        # Requests that never produced a response
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            self.finish(profile)
+
+    def finish(self, profile):
+        try:
+            profile.stop()
+            path = os.path.join(self.directory, profile.id + FORMATS[self.fmt])
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, 'w') as f:
+                if self.fmt == 'speedscope':
+                    json.dump(profile.speedscope(), f)
+                else:
+                    f.write(profile.collapsed())
+            logger.info(f"Wrote profile of {profile.name} ({len(profile.samples)} samples) to {path}")
+            self._prune()
+        except Exception as e:
+            logger.error(f"Failed to write profile {profile.id}: {e}")
+        finally:
+            self._slots.release()
+
+    def _prune(self):
+        if not self.keep:
+            return
+        names = [n for n in os.listdir(self.directory) if n.endswith(tuple(FORMATS.values()))]
+        if len(names) <= self.keep:
+            return
+        paths = sorted((os.path.join(self.directory, n) for n in names), key=os.path.getmtime)
+        for path in paths[:len(paths) - self.keep]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def init_app(app):
+    profiler = RequestProfiler(
+        directory=app.config.get('PROFILING_DIR') or os.path.join(app.instance_path, 'profiles'),
+        routes=[r.strip() for r in app.config.get('PROFILING_ROUTES', '').split(',') if r.strip()],
+        token=app.config.get('PROFILING_TOKEN'),
+        sample_rate=float(app.config.get('PROFILING_SAMPLE_RATE', 0.0)),
+        fmt=(app.config.get('PROFILING_FORMAT') or 'speedscope').lower(),
+        interval=float(app.config.get('PROFILING_INTERVAL', 0.005)),
+        max_seconds=float(app.config.get('PROFILING_MAX_SECONDS', 120)),
+        max_active=int(app.config.get('PROFILING_MAX_ACTIVE', 2)),
+        keep=int(app.config.get('PROFILING_KEEP', 200)),
+    )
+    app.extensions['request_profiler'] = profiler
+    app.before_request(profiler.before_request)
+    app.after_request(profiler.after_request)
+    app.teardown_request(profiler.teardown_request)
+    return profiler
@@ -0,0 +1,165 @@
+# app/services/response_cache.py
+"""
+Exact-match cache for chat completions.
+
+Keys are a SHA-256 over a normalized (model, messages, temperature,
+max_tokens) tuple, so whitespace-only differences still hit. Entries are
+bounded by TTL and by count with LRU eviction. The SQLite backend lives in
+the instance folder and is shared by every worker on the box; the memory
+backend is per-process and mostly useful for development.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from app.services import local_store
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def cache_key(model, messages, temperature, max_tokens):
+    normalized = {
+        'model': model,
+        'messages': [
+            {'role': m['role'], 'content': _WHITESPACE.sub(' ', m['content']).strip()}
+            for m in messages
+        ],
+        'temperature': round(float(temperature), 3),
+        'max_tokens': int(max_tokens),
+    }
+    blob = json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+class MemoryBackend:
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def size(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        conn = local_store.connect(path)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS response_cache ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL,'
+            ' last_access REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_response_cache_last_access '
+            'ON response_cache (last_access)'
+        )
+
+    def get(self, key):
+        conn = local_store.connect(self.path)
+        now = time.time()
+        row = conn.execute(
+            'SELECT value FROM response_cache WHERE key = ? AND expires_at > ?',
+            (key, now),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE response_cache SET last_access = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        conn = local_store.connect(self.path)
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO response_cache (key, value, expires_at, last_access) '
+            'VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), now + ttl, now),
+        )
+        conn.execute('DELETE FROM response_cache WHERE expires_at <= ?', (now,))
+        # Trim least-recently-used rows beyond the bound
+        conn.execute(
+            'DELETE FROM response_cache WHERE key IN ('
+            ' SELECT key FROM response_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,),
+        )
+
+    def size(self):
+        conn = local_store.connect(self.path)
+        return conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+
+class ResponseCache:
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.ttl)
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': self.backend.size(),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+def get_response_cache(app=None):
+    """Return the configured cache for this app, or None when disabled"""
+    app = app or current_app._get_current_object()
+    if 'response_cache' not in app.extensions:
+        kind = (app.config.get('RESPONSE_CACHE_BACKEND') or 'sqlite').lower()
+        max_entries = int(app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 5000))
+        if kind == 'none':
+            cache = None
+        elif kind == 'memory':
+            cache = ResponseCache(MemoryBackend(max_entries), int(app.config.get('RESPONSE_CACHE_TTL', 3600)))
+        elif kind == 'sqlite':
+            backend = SQLiteBackend(local_store.default_path(app), max_entries)
+            cache = ResponseCache(backend, int(app.config.get('RESPONSE_CACHE_TTL', 3600)))
+        else:
+            raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND '{kind}'")
+        app.extensions['response_cache'] = cache
+    return app.extensions['response_cache']
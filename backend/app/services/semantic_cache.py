@@ -0,0 +1,218 @@
+# app/services/semantic_cache.py
+"""
+Near-duplicate prompt cache.
+
+Messages are normalized (lowercased, punctuation and stopwords dropped),
+turned into word 1- and 2-gram shingles and summarized with a MinHash
+signature. Signatures are banded into an LSH index namespaced by
+(docType, phase, system prompt), so lookups only compare against a handful
+of candidates; each candidate is then confirmed with the exact Jaccard
+similarity of its shingle set before the earlier answer is reused.
+
+Everything runs locally with no embedding API. The index is per worker
+process, bounded by entry count and TTL with LRU eviction.
+
+A small fraction of hits is audited: the LLM is called anyway and the fresh
+reply compared to the cached one. Audits that disagree are counted as false
+positives and the offending entry is dropped.
+"""
+
+import hashlib
+import random
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_TOKEN = re.compile(r'[a-z0-9]+')
+_STOPWORDS = frozenset(
+    'a an and are as at be by for from has have i in is it its my of on or our '
+    'that the this to was we what with'.split()
+)
+
+
+def shingles(text):
+    words = [w for w in _TOKEN.findall(text.lower()) if w not in _STOPWORDS]
+    grams = set(words)
+    grams.update(f'{a} {b}' for a, b in zip(words, words[1:]))
+    return frozenset(grams)
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / float(len(a | b))
+
+
+def _base_hash(shingle):
+    digest = hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest()
+    return struct.unpack('<Q', digest)[0] & _MAX_HASH
+
+
+class MinHasher:
+
+    def __init__(self, num_perm=64, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [
+            (rng.randrange(1, _PRIME), rng.randrange(0, _PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, grams):
+        if not grams:
+            return (_MAX_HASH,) * self.num_perm
+        hashes = [_base_hash(g) for g in grams]
+        return tuple(
+            min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        )
+
+
+class _Entry:
+    __slots__ = ('namespace', 'grams', 'bands', 'value', 'expires_at')
+
+    def __init__(self, namespace, grams, bands, value, expires_at):
+        self.namespace = namespace
+        self.grams = grams
+        self.bands = bands
+        self.value = value
+        self.expires_at = expires_at
+
+
+class SemanticCache:
+
+    def __init__(self, threshold=0.8, max_entries=2000, ttl=3600,
+                 audit_rate=0.02, audit_threshold=0.3, num_perm=64, bands=16):
+        assert num_perm % bands == 0, 'num_perm must be divisible by bands'
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.audit_rate = audit_rate
+        self.audit_threshold = audit_threshold
+        self.rows = num_perm // bands
+        self._hasher = MinHasher(num_perm)
+        self._entries = OrderedDict()   # entry id -> _Entry, LRU order
+        self._buckets = {}              # (namespace, band, band hash) -> {entry id}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+        self.metrics = {
+            'lookups': 0,
+            'hits': 0,
+            'audits': 0,
+            'audit_false_positives': 0,
+            'evictions': 0,
+        }
+
+    @staticmethod
+    def namespace(doc_type, phase, system_prompt):
+        prompt_hash = hashlib.sha1(system_prompt.encode('utf-8')).hexdigest()
+        return f'{doc_type}:{phase}:{prompt_hash}'
+
+    def _bands(self, namespace, grams):
+        sig = self._hasher.signature(grams)
+        return [
+            (namespace, i, hash(sig[i * self.rows:(i + 1) * self.rows]))
+            for i in range(len(sig) // self.rows)
+        ]
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band]
+
+    def lookup(self, namespace, message):
+        """
+        Return (entry_id, value, similarity, audit) for the closest earlier
+        prompt above the threshold, or None. When `audit` is True the caller
+        should still call the LLM and report back through `audit()`.
+        """
+        grams = shingles(message)
+        bands = self._bands(namespace, grams)
+        now = time.time()
+        with self._lock:
+            self.metrics['lookups'] += 1
+            candidates = set()
+            for band in bands:
+                candidates.update(self._buckets.get(band, ()))
+
+            best_id, best_sim = None, 0.0
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry.expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                sim = jaccard(grams, entry.grams)
+                if sim > best_sim:
+                    best_id, best_sim = entry_id, sim
+
+            if best_id is None or best_sim < self.threshold:
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.metrics['hits'] += 1
+            audit = self._rng.random() < self.audit_rate
+            if audit:
+                self.metrics['audits'] += 1
+            return best_id, self._entries[best_id].value, best_sim, audit
+
+    def add(self, namespace, message, value):
+        grams = shingles(message)
+        bands = self._bands(namespace, grams)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(namespace, grams, bands, value, time.time() + self.ttl)
+            for band in bands:
+                self._buckets.setdefault(band, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.metrics['evictions'] += 1
+
+    def audit(self, entry_id, cached_reply, fresh_reply):
+        """Compare an audited hit against a fresh answer; drop it if they disagree"""
+        agreement = jaccard(shingles(cached_reply), shingles(fresh_reply))
+        if agreement < self.audit_threshold:
+            with self._lock:
+                self.metrics['audit_false_positives'] += 1
+                self._remove(entry_id)
+        return agreement
+
+    def stats(self):
+        with self._lock:
+            m = dict(self.metrics)
+            m['entries'] = len(self._entries)
+        m['hit_rate'] = m['hits'] / m['lookups'] if m['lookups'] else 0.0
+        m['false_positive_rate'] = (
+            m['audit_false_positives'] / m['audits'] if m['audits'] else None
+        )
+        return m
+
+
+def get_semantic_cache(app=None):
+    """Return this worker's near-duplicate cache, or None when disabled"""
+    app = app or current_app._get_current_object()
+    if 'semantic_cache' not in app.extensions:
+        cache = None
+        if app.config.get('SEMANTIC_CACHE_ENABLED', True):
+            cache = SemanticCache(
+                threshold=float(app.config.get('SEMANTIC_CACHE_THRESHOLD', 0.8)),
+                max_entries=int(app.config.get('SEMANTIC_CACHE_MAX_ENTRIES', 2000)),
+                ttl=int(app.config.get('SEMANTIC_CACHE_TTL', 3600)),
+                audit_rate=float(app.config.get('SEMANTIC_CACHE_AUDIT_RATE', 0.02)),
+            )
+        app.extensions['semantic_cache'] = cache
+    return app.extensions['semantic_cache']
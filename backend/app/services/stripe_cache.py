@@ -0,0 +1,197 @@
+# app/services/stripe_cache.py
+"""
+Local cache of the Stripe objects the billing pages read: prices (with
+their product) and completed checkout sessions.
+
+Entries live in the stripe_cache table, so every worker and host shares
+them and webhook consumers anywhere can keep them current:
+
+- lazily filled: a miss on any price fetches all active prices in one
+  paginated list call, kept even if a price missing from the listing then
+  can't be fetched; a price id Stripe doesn't know is remembered as
+  missing for STRIPE_MISSING_PRICE_TTL, so a stale id in the config
+  doesn't send every request back to Stripe; a checkout session is stored
+  once it is complete (open sessions are still changing and always go to
+  Stripe);
+- refreshed by events: checkout.session.completed stores the session
+  before the pricing result page asks for it, while price, product and
+  subscription events drop the entries they affect;
+- TTL fallback: entries expire after STRIPE_CACHE_TTL /
+  STRIPE_SESSION_CACHE_TTL in case an event is missed, and an expired
+  entry is still served if Stripe can't be reached.
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import StripeCacheEntry
+from app.services.stripe_client import get_stripe
+
+logger = logging.getLogger(__name__)
+
+
+def _plain(obj):
+    """A StripeObject (or plain dict) as JSON-ready nested dicts"""
+    if isinstance(obj, get_stripe().StripeObject):
+        return json.loads(str(obj))
+    return obj
+
+
+def _related(value):
+    return value.get('id') if isinstance(value, dict) else value
+
+
+def _put(object_type, data, related_id, ttl):
+    """Upsert one entry (flushes; the caller commits)"""
+    now = datetime.utcnow()
+    db.session.merge(StripeCacheEntry(
+        id=data['id'],
+        object=object_type,
+        related_id=related_id,
+        data=json.dumps(data),
+        fetched_at=now,
+        expires_at=now + timedelta(seconds=ttl),
+    ))
+    db.session.flush()
+
+
+def _commit():
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker cached the same object first
+        db.session.rollback()
+
+
+def _ttl(key, default):
+    return int(current_app.config.get(key, default))
+
+
+# ----- prices -----
+
+# Entry type for a price id Stripe says doesn't exist
+MISSING_PRICE = 'price.missing'
+
+def _store_price(price):
+    price = _plain(price)
+    _put('price', price, _related(price.get('product')), _ttl('STRIPE_CACHE_TTL', 3600))
+    return price
+
+
+def _fetch_prices(price_ids):
+    """Refill from Stripe: all active prices in one listing, then any stragglers"""
+    stripe = get_stripe()
+    fetched = {}
+    for price in stripe.Price.list(active=True, limit=100, expand=['data.product']).auto_paging_iter():
+        price = _store_price(price)
+        fetched[price['id']] = price
+    # The listing is kept whatever happens to the stragglers
+    _commit()
+    for price_id in set(price_ids) - set(fetched):
+        # Archived prices don't show up in the active listing
+        try:
+            fetched[price_id] = _store_price(stripe.Price.retrieve(price_id, expand=['product']))
+        except stripe.error.InvalidRequestError as e:
+            logger.warning(f"Stripe has no price {price_id}, caching the miss: {e}")
+            _put(MISSING_PRICE, {'id': price_id}, None, _ttl('STRIPE_MISSING_PRICE_TTL', 300))
+        except stripe.error.StripeError as e:
+            logger.warning(f"Stripe price {price_id} could not be fetched: {e}")
+            continue
+        _commit()
+    return fetched
+
+
+def get_prices(price_ids):
+    """price_id -> Stripe price (product expanded) for the given ids"""
+    price_ids = [p for p in price_ids if p]
+    rows = StripeCacheEntry.query.filter(StripeCacheEntry.id.in_(price_ids)).all() if price_ids else []
+    now = datetime.utcnow()
+    cached = {row.id: row for row in rows}
+    missing = [p for p in price_ids if p not in cached or cached[p].expires_at <= now]
+    prices = {p: json.loads(row.data) for p, row in cached.items() if row.object == 'price'}
+    if missing:
+        stripe = get_stripe()
+        try:
+            prices.update(_fetch_prices(missing))
+        except stripe.error.StripeError as e:
+            db.session.rollback()
+            logger.warning(f"Stripe price refresh failed, serving cached copies: {e}")
+    return prices
+
+
+def price_details(price_id, price):
+    """The fields the pricing page needs from a price"""
+    if not price:
+        return {'price_id': price_id}
+    product = price.get('product') if isinstance(price.get('product'), dict) else {}
+    recurring = price.get('recurring') or {}
+    return {
+        'price_id': price_id,
+        'nickname': price.get('nickname'),
+        'unit_amount': price.get('unit_amount'),
+        'currency': price.get('currency'),
+        'interval': recurring.get('interval'),
+        'interval_count': recurring.get('interval_count'),
+        'product': {
+            'id': product.get('id'),
+            'name': product.get('name'),
+            'description': product.get('description'),
+        } if product else None,
+    }
+
+
+# ----- checkout sessions -----
+
+def _store_session(session):
+    session = _plain(session)
+    _put('checkout.session', session, _related(session.get('subscription')),
+         _ttl('STRIPE_SESSION_CACHE_TTL', 900))
+    return session
+
+
+def get_checkout_session(session_id):
+    """A checkout session with its subscription expanded; repeat polls of a completed one stay local"""
+    row = db.session.get(StripeCacheEntry, session_id)
+    if row is not None and row.object == 'checkout.session' and row.expires_at > datetime.utcnow():
+        return json.loads(row.data)
+    stripe = get_stripe()
+    try:
+        session = stripe.checkout.Session.retrieve(session_id, expand=['subscription'])
+    except stripe.error.APIConnectionError:
+        if row is not None:
+            logger.warning(f"Stripe unreachable, serving cached checkout session {session_id}")
+            return json.loads(row.data)
+        raise
+    if session.get('status') != 'complete':
+        return _plain(session)
+    session = _store_session(session)
+    _commit()
+    return session
+
+
+# ----- webhook hooks (run inside the inbox consumer's batch) -----
+
+def invalidate(*ids):
+    ids = [i for i in ids if i]
+    if ids:
+        StripeCacheEntry.query.filter(
+            (StripeCacheEntry.id.in_(ids)) | (StripeCacheEntry.related_id.in_(ids))
+        ).delete(synchronize_session=False)
+
+
+def apply_event(event):
+    """Keep the cache in step with a Stripe event; never fails the event"""
+    obj = event.data.object
+    try:
+        with db.session.begin_nested():
+            if event.type == 'checkout.session.completed':
+                _store_session(get_stripe().checkout.Session.retrieve(obj.id, expand=['subscription']))
+            elif event.type.startswith(('price.', 'product.', 'customer.subscription.')):
+                invalidate(obj.id)
+    except Exception as e:
+        logger.warning(f"Stripe cache update for {event.type} failed: {e}")
@@ -0,0 +1,83 @@
+# app/services/stripe_client.py
+"""
+Lazy access to the Stripe SDK.
+
+Importing `stripe` builds its whole resource and service tree, which is
+more than half of create_app()'s import time, and many processes never
+call Stripe (job runners, the mail sender, a worker until someone opens
+the billing pages). Code that talks to Stripe calls `get_stripe()` in the
+function instead of importing the SDK at module level. The first call
+imports it; every call points it at this app's key and API base.
+
+With gunicorn's preload mode, gunicorn.conf.py imports it once in the
+master so workers share those pages, and `reset_after_fork()` drops any
+HTTP client the master opened.
+"""
+
+import re
+import sys
+import time
+from urllib.parse import urlsplit
+
+from flask import current_app
+
+from app.services import metrics
+
+# A path segment that is an object id (cus_Nx3..., cs_test_a1...), not a resource name
+_OBJECT_ID = re.compile(r'^[a-z]+_\w*[0-9A-Z]\w*$')
+
+
+def _endpoint(url):
+    """/v1/checkout/sessions/cs_test_123 -> /v1/checkout/sessions/{id}"""
+    path = urlsplit(url).path
+    return '/'.join('{id}' if _OBJECT_ID.match(part) else part for part in path.split('/'))
+
+
+class TimedHTTPClient:
+    """Wraps the SDK's HTTP client to record the latency of every Stripe call"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _timed(self, call, method, url, *args, **kwargs):
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            result = call(method, url, *args, **kwargs)
+            status = str(result[1])
+            return result
+        finally:
+            metrics.STRIPE_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=method.upper(), endpoint=_endpoint(url), status=status,
+            )
+
+    def request_with_retries(self, method, url, *args, **kwargs):
+        return self._timed(self._client.request_with_retries, method, url, *args, **kwargs)
+
+    def request_stream_with_retries(self, method, url, *args, **kwargs):
+        return self._timed(self._client.request_stream_with_retries, method, url, *args, **kwargs)
+
+
+def get_stripe(app=None):
+    """The configured stripe module"""
+    app = app or current_app
+    import stripe
+    stripe.api_key = app.config['STRIPE_SECRET_KEY']
+    if app.config.get('STRIPE_API_BASE'):
+        stripe.api_base = app.config['STRIPE_API_BASE']
+    if not isinstance(stripe.default_http_client, TimedHTTPClient):
+        stripe.default_http_client = TimedHTTPClient(stripe.new_default_http_client(
+            verify_ssl_certs=stripe.verify_ssl_certs, proxy=stripe.proxy,
+        ))
+    return stripe
+
+
+def reset_after_fork():
+    """Make a forked worker open its own connections to Stripe"""
+    stripe = sys.modules.get('stripe')
+    if stripe is not None:
+        stripe.default_http_client = None
@@ -0,0 +1,264 @@
+# app/services/stripe_inbox.py
+"""
+Asynchronous processing of Stripe webhook events.
+
+The webhook only verifies the signature and inserts the raw event into
+the stripe_events inbox; the event id is the primary key, so Stripe's
+at-least-once redeliveries are dropped on insert and the response goes
+back immediately.
+
+An InboxConsumer applies pending events in batches. It claims all of a
+customer's pending events at once (never a customer another consumer is
+still working on) and applies them in Stripe's `created` order, each in a
+savepoint so one bad event doesn't undo the batch. When an event fails,
+the customer's later events are put back and retried after it, so state
+is never applied out of order; after STRIPE_EVENT_MAX_ATTEMPTS the event
+is marked failed and the customer moves on.
+
+Consumers start lazily inside web workers (STRIPE_EVENT_CONSUMER) or as a
+dedicated process via `python process_stripe_events.py`.
+"""
+
+import json
+import os
+import socket
+import threading
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import exists, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from app import db
+from app.models import StripeEvent, User
+from app.services import aggregates, plans, stripe_cache
+from app.services.stripe_client import get_stripe
+
+logger = logging.getLogger(__name__)
+
+
+def _customer_of(event):
+    obj = event.get('data', {}).get('object', {})
+    if obj.get('object') == 'customer':
+        return obj.get('id')
+    customer = obj.get('customer')
+    if isinstance(customer, dict):
+        return customer.get('id')
+    return customer
+
+
+def store(event, payload):
+    """Insert a verified event; returns False if it was already in the inbox"""
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8')
+    db.session.add(StripeEvent(
+        id=event['id'],
+        type=event['type'],
+        customer_id=_customer_of(event),
+        created=int(event.get('created') or 0),
+        payload=payload,
+        status='pending',
+    ))
+    try:
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        logger.info(f"Ignoring duplicate Stripe event {event['id']}")
+        return False
+
+
+# ----- handlers (flush only; the consumer commits the batch) -----
+
+def _checkout_session_completed(event):
+    sess = event.data.object
+    user = db.session.get(User, (sess.get('metadata') or {}).get('user_id'))
+    if user:
+        user.stripe_customer_id     = sess.customer
+        user.stripe_subscription_id = sess.subscription
+        user.subscription_plan      = sess.metadata.get('plan_key')
+        if plans.apply_allowance(user, user.subscription_plan):
+            # Copies the new balance onto the dashboard aggregate
+            db.session.flush()
+            aggregates.credits_consumed(user.id, 0)
+
+
+def _customer_subscription_deleted(event):
+    sub = event.data.object
+    user = User.query.filter_by(stripe_subscription_id=sub.id).first()
+    if user:
+        # downgrade them or mark inactive
+        user.subscription_plan      = 'essential'
+        user.stripe_subscription_id = None
+
+
+HANDLERS = {
+    'checkout.session.completed': _checkout_session_completed,
+    'customer.subscription.deleted': _customer_subscription_deleted,
+    # invoice.payment_succeeded: e.g. send receipt, top up credits, etc.
+}
+
+
+def apply(row):
+    stripe = get_stripe()
+    event = stripe.Event.construct_from(json.loads(row.payload), stripe.api_key)
+    handler = HANDLERS.get(row.type)
+    if handler is not None:
+        handler(event)
+    stripe_cache.apply_event(event)
+    db.session.flush()
+
+
+class InboxConsumer:
+
+    def __init__(self, app, batch_size=100, poll_interval=2.0, max_attempts=5, stale_after=300):
+        self.app = app
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.stale_after = stale_after
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='stripe-inbox', daemon=True)
+        self._thread.start()
+        logger.info(f"Stripe event consumer {self.name} started")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def wake(self):
+        """Process new events now instead of at the next poll"""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    self.requeue_stale()
+                    if self.process_batch():
+                        continue
+            except Exception as e:
+                logger.error(f"Stripe event consumer error: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _claim(self):
+        """Mark a batch of pending events as ours, whole customers at a time"""
+        pending = (
+            db.session.query(StripeEvent.id, StripeEvent.customer_id)
+            .filter(StripeEvent.status == 'pending')
+            .order_by(StripeEvent.created, StripeEvent.id)
+            .limit(self.batch_size)
+            .all()
+        )
+        claim = dict(status='processing', claimed_by=self.name, claimed_at=datetime.utcnow())
+        other = aliased(StripeEvent)
+        seen = set()
+        for event_id, customer_id in pending:
+            if customer_id is None:
+                where = (StripeEvent.id == event_id,)
+            elif customer_id in seen:
+                continue
+            else:
+                seen.add(customer_id)
+                where = (
+                    StripeEvent.customer_id == customer_id,
+                    ~exists().where(other.customer_id == customer_id, other.status == 'processing'),
+                )
+            db.session.execute(
+                update(StripeEvent)
+                .where(StripeEvent.status == 'pending', *where)
+                .values(**claim)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        return (
+            StripeEvent.query
+            .filter_by(status='processing', claimed_by=self.name)
+            .order_by(StripeEvent.created, StripeEvent.id)
+            .all()
+        )
+
+    def process_batch(self):
+        """Claim and apply one batch; returns the number of events handled"""
+        events = self._claim()
+        blocked = set()
+        for row in events:
+            if row.customer_id is not None and row.customer_id in blocked:
+                # An earlier event for this customer failed; keep the order
+                row.status = 'pending'
+                row.claimed_by = None
+                continue
+            try:
+                with db.session.begin_nested():
+                    apply(row)
+                row.status = 'processed'
+                row.error = None
+                row.processed_at = datetime.utcnow()
+            except Exception as e:
+                row.attempts += 1
+                row.error = str(e)
+                if row.attempts >= self.max_attempts:
+                    logger.error(f"Giving up on Stripe event {row.id} ({row.type}): {e}")
+                    row.status = 'failed'
+                    row.processed_at = datetime.utcnow()
+                else:
+                    logger.warning(f"Stripe event {row.id} ({row.type}) failed, will retry: {e}")
+                    row.status = 'pending'
+                    row.claimed_by = None
+                    if row.customer_id is not None:
+                        blocked.add(row.customer_id)
+        db.session.commit()
+        if events:
+            logger.info(f"Applied {len(events)} Stripe events")
+        return len(events)
+
+    def requeue_stale(self):
+        """Recover events claimed by a consumer that died mid-batch"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        requeued = db.session.execute(
+            update(StripeEvent)
+            .where(StripeEvent.status == 'processing', StripeEvent.claimed_at < cutoff)
+            .values(status='pending', claimed_by=None)
+        ).rowcount
+        db.session.commit()
+        if requeued:
+            logger.warning(f"Re-queued {requeued} stale Stripe events")
+
+
+def build_consumer(app):
+    return InboxConsumer(
+        app,
+        batch_size=int(app.config.get('STRIPE_EVENT_BATCH_SIZE', 100)),
+        poll_interval=float(app.config.get('STRIPE_EVENT_POLL_INTERVAL', 2.0)),
+        max_attempts=int(app.config.get('STRIPE_EVENT_MAX_ATTEMPTS', 5)),
+        stale_after=int(app.config.get('STRIPE_EVENT_STALE_AFTER', 300)),
+    )
+
+
+_consumer_lock = threading.Lock()
+
+
+def ensure_consumer(app):
+    """Start this process's embedded consumer once (never inherited across fork)"""
+    if not app.config.get('STRIPE_EVENT_CONSUMER', True):
+        return None
+    entry = app.extensions.get('stripe_inbox')
+    if entry and entry[0] == os.getpid():
+        return entry[1]
+    with _consumer_lock:
+        entry = app.extensions.get('stripe_inbox')
+        if entry and entry[0] == os.getpid():
+            return entry[1]
+        consumer = build_consumer(app)
+        consumer.start()
+        app.extensions['stripe_inbox'] = (os.getpid(), consumer)
+        return consumer
@@ -0,0 +1,181 @@
+# app/services/stripe_reconcile.py
+"""
+Bring users' subscription fields back in line with Stripe after missed
+webhooks.
+
+Every subscription is read once through the list API with auto-pagination
+(100 per request). Subscriptions are matched to users a chunk at a time
+with one indexed IN query on stripe_subscription_id / stripe_customer_id
+(plus metadata.user_id for subscriptions created by our checkout), and
+joined in memory. Only users whose fields actually differ are written,
+as executemany UPDATEs by primary key, one commit per batch.
+
+A user's live subscription (active, trialing, past_due) always wins over
+ended ones; an ended subscription only downgrades the user if it is the
+one recorded on their row, which mirrors customer.subscription.deleted.
+A user whose plan changes also gets that plan's allowance (credits,
+unlimited analysis, session limit), as the checkout webhook would have
+applied, and the dashboard aggregate's balance is updated to match.
+"""
+
+import time
+import logging
+
+from flask import current_app
+from sqlalchemy import or_, update
+
+from app import db
+from app.models import User
+from app.services import aggregates, plans, user_cache
+from app.services.stripe_client import get_stripe
+
+logger = logging.getLogger(__name__)
+
+LIVE = ('active', 'trialing', 'past_due')
+ENDED = ('canceled', 'incomplete_expired')
+FREE_PLAN = 'essential'
+
+_FIELDS = ('subscription_plan', 'stripe_customer_id', 'stripe_subscription_id')
+
+
+def _price_id(sub):
+    items = (sub.get('items') or {}).get('data') or []
+    return items[0]['price']['id'] if items else None
+
+
+def _match(chunk):
+    """Users referenced by a chunk of subscriptions, keyed every way we can join"""
+    sub_ids = {s['id'] for s in chunk}
+    customer_ids = {s['customer'] for s in chunk if s.get('customer')}
+    user_ids = {(s.get('metadata') or {}).get('user_id') for s in chunk} - {None}
+    rows = (
+        db.session.query(User.id, *[getattr(User, f) for f in _FIELDS])
+        .filter(or_(
+            User.stripe_subscription_id.in_(sub_ids),
+            User.stripe_customer_id.in_(customer_ids),
+            User.id.in_(user_ids),
+        ))
+        .all()
+    )
+    by_sub, by_customer, by_id = {}, {}, {}
+    for row in rows:
+        by_id[row.id] = row
+        if row.stripe_subscription_id:
+            by_sub[row.stripe_subscription_id] = row
+        if row.stripe_customer_id:
+            by_customer[row.stripe_customer_id] = row
+    return by_sub, by_customer, by_id
+
+
+class Reconciler:
+
+    def __init__(self, price_to_plan, chunk_size=500, batch_size=1000, dry_run=False):
+        self.price_to_plan = price_to_plan
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        # user_id -> (rank, created, current row, desired values)
+        self._desired = {}
+        self.stats = {
+            'subscriptions': 0,
+            'matched': 0,
+            'unmatched': 0,
+            'changed': 0,
+            'updated': 0,
+            'seconds': 0.0,
+        }
+
+    def _consider(self, sub, row):
+        status = sub.get('status')
+        if status in LIVE:
+            rank = 2
+            desired = {
+                'subscription_plan': self.price_to_plan.get(_price_id(sub), row.subscription_plan),
+                'stripe_customer_id': sub.get('customer'),
+                'stripe_subscription_id': sub['id'],
+            }
+        elif status in ENDED and row.stripe_subscription_id == sub['id']:
+            rank = 1
+            desired = {
+                'subscription_plan': FREE_PLAN,
+                'stripe_customer_id': sub.get('customer') or row.stripe_customer_id,
+                'stripe_subscription_id': None,
+            }
+        else:
+            return
+        key = (rank, sub.get('created') or 0)
+        current = self._desired.get(row.id)
+        if current is None or key > current[0]:
+            self._desired[row.id] = (key, row, desired)
+
+    def _join(self, chunk):
+        by_sub, by_customer, by_id = _match(chunk)
+        for sub in chunk:
+            row = (
+                by_sub.get(sub['id'])
+                or by_customer.get(sub.get('customer'))
+                or by_id.get((sub.get('metadata') or {}).get('user_id'))
+            )
+            if row is None:
+                self.stats['unmatched'] += 1
+                continue
+            self.stats['matched'] += 1
+            self._consider(sub, row)
+
+    def _apply(self):
+        changes = []
+        for user_id, (_, row, desired) in self._desired.items():
+            diff = {f: v for f, v in desired.items() if getattr(row, f) != v}
+            if 'subscription_plan' in diff:
+                diff.update(plans.allowance(diff['subscription_plan']) or {})
+            if diff:
+                changes.append({'id': user_id, **diff})
+        self.stats['changed'] = len(changes)
+        if self.dry_run:
+            return changes
+
+        # executemany wants the same keys in every row of a batch
+        for fields in {tuple(sorted(c)) for c in changes}:
+            group = [c for c in changes if tuple(sorted(c)) == fields]
+            for start in range(0, len(group), self.batch_size):
+                batch = group[start:start + self.batch_size]
+                db.session.execute(update(User), batch)
+                if 'credits_remaining' in fields:
+                    aggregates.balances_changed([c['id'] for c in batch])
+                user_cache.changed(*(c['id'] for c in batch))
+                db.session.commit()
+                self.stats['updated'] += len(batch)
+        return changes
+
+    def run(self, subscriptions):
+        """Reconcile against an iterable of Stripe subscription objects"""
+        started = time.monotonic()
+        chunk = []
+        for sub in subscriptions:
+            self.stats['subscriptions'] += 1
+            chunk.append(sub)
+            if len(chunk) >= self.chunk_size:
+                self._join(chunk)
+                chunk = []
+        if chunk:
+            self._join(chunk)
+        changes = self._apply()
+        self.stats['seconds'] = round(time.monotonic() - started, 2)
+        return changes
+
+
+def list_subscriptions(page_size=100):
+    """Every subscription on the account, fetched page by page"""
+    return get_stripe().Subscription.list(status='all', limit=page_size).auto_paging_iter()
+
+
+def price_to_plan(app=None):
+    app = app or current_app._get_current_object()
+    return {price: plan for plan, price in app.config.get('STRIPE_PRICE_IDS', {}).items() if price}
+
+
+def reconcile(dry_run=False, batch_size=1000, chunk_size=500):
+    reconciler = Reconciler(price_to_plan(), chunk_size=chunk_size, batch_size=batch_size, dry_run=dry_run)
+    changes = reconciler.run(list_subscriptions())
+    logger.info(f"Stripe reconciliation: {reconciler.stats}")
+    return reconciler.stats, changes
@@ -0,0 +1,187 @@
+# app/services/user_cache.py
+"""
+Authenticated-user snapshots for Flask-JWT-Extended.
+
+The user_lookup_loader below turns a token's identity into a UserSnapshot:
+a read-only copy of the users row (without the password hash) with its
+to_dict() form computed once. Routes read `current_user` instead of
+querying the row themselves. A lookup is memoized for the request, since
+the token can be verified more than once per request, and each worker
+keeps snapshots for USER_CACHE_TTL seconds.
+
+Invalidation is exact, not left to the TTL. Users rows changed through the
+ORM (signups, cancellations, webhook plan updates) are noted at flush.
+Core UPDATEs that bypass the ORM (credit reservations and refunds, bulk
+reconciliation) call `changed()` before committing. Once the transaction
+commits, each changed user's generation counter in the local store is
+bumped, and a worker only serves a snapshot whose generation still
+matches, so every worker on the box sees the change on its next request.
+Hosts that don't share the local store fall back to the TTL.
+"""
+
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+from flask import current_app, g, has_app_context, jsonify
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+from app import db, jwt
+from app.models import User
+from app.services import local_store
+
+logger = logging.getLogger(__name__)
+
+# Never copied into a snapshot
+_PRIVATE = {'password_hash'}
+_COLUMNS = [c for c in User.__table__.columns if c.name not in _PRIVATE]
+_PENDING = 'user_cache_changed'
+
+
+class UserSnapshot:
+    """Read-only stand-in for a User row: columns as attributes"""
+
+    __slots__ = ('_data', '_public')
+
+    def __init__(self, data):
+        object.__setattr__(self, '_data', data)
+        object.__setattr__(self, '_public', User.to_dict(self))
+
+    def __getattr__(self, name):
+        try:
+            return self._data[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('UserSnapshot is read-only')
+
+    def to_dict(self):
+        return dict(self._public)
+
+
+class UserCache:
+
+    def __init__(self, path, ttl=60, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # user_id -> (generation, expires_at, snapshot)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        local_store.connect(path).execute(
+            'CREATE TABLE IF NOT EXISTS user_generations ('
+            ' user_id TEXT PRIMARY KEY,'
+            ' generation INTEGER NOT NULL)'
+        )
+
+    def _generation(self, user_id):
+        row = local_store.connect(self.path).execute(
+            'SELECT generation FROM user_generations WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get(self, user_id, load):
+        """The cached snapshot for user_id, or load(user_id) (None = no such user)"""
+        # Read the generation before loading, so a change committed while we
+        # load bumps it past the one we store
+        generation = self._generation(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == generation and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                return entry[2]
+        snapshot = load(user_id)
+        if snapshot is not None and self.ttl > 0:
+            with self._lock:
+                self._entries[user_id] = (generation, now + self.ttl, snapshot)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_ids):
+        """Drop these users' snapshots in every worker sharing the store"""
+        user_ids = [str(u) for u in user_ids if u]
+        if not user_ids:
+            return
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+        local_store.connect(self.path).executemany(
+            'INSERT INTO user_generations (user_id, generation) VALUES (?, 1) '
+            'ON CONFLICT (user_id) DO UPDATE SET generation = generation + 1',
+            [(u,) for u in user_ids],
+        )
+
+
+def get_user_cache(app=None):
+    app = app or current_app._get_current_object()
+    if 'user_cache' not in app.extensions:
+        app.extensions['user_cache'] = UserCache(
+            local_store.default_path(app),
+            ttl=int(app.config.get('USER_CACHE_TTL', 60)),
+            max_entries=int(app.config.get('USER_CACHE_MAX_ENTRIES', 10000)),
+        )
+    return app.extensions['user_cache']
+
+
+def _load(user_id):
+    row = db.session.query(*_COLUMNS).filter(User.id == user_id).first()
+    return UserSnapshot(dict(row._mapping)) if row is not None else None
+
+
+def get(user_id):
+    """Snapshot of a user, memoized for the request; None for an unknown user"""
+    user_id = str(user_id)
+    memo = g.setdefault('_user_snapshots', {})
+    if user_id not in memo:
+        memo[user_id] = get_user_cache().get(user_id, _load)
+    return memo[user_id]
+
+
+def changed(*user_ids):
+    """
+    Note users whose row the current transaction changed outside the ORM;
+    their snapshots are invalidated once it commits.
+    """
+    db.session.info.setdefault(_PENDING, set()).update(str(u) for u in user_ids if u)
+
+
+# ----- invalidation hooks (every session, including background workers') -----
+
+@event.listens_for(OrmSession, 'after_flush')
+def _note_flushed(session, flush_context):
+    user_ids = {obj.id for obj in session.dirty | session.deleted if isinstance(obj, User)}
+    if user_ids:
+        session.info.setdefault(_PENDING, set()).update(user_ids)
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def _invalidate_committed(session):
+    user_ids = session.info.pop(_PENDING, None)
+    if not user_ids or not has_app_context():
+        return
+    try:
+        get_user_cache().invalidate(user_ids)
+    except Exception as e:
+        # The write itself succeeded; the TTL bounds how long a worker is stale
+        logger.error(f"User cache invalidation failed for {len(user_ids)} users: {e}")
+    if '_user_snapshots' in g:
+        for user_id in user_ids:
+            g._user_snapshots.pop(user_id, None)
+
+
+# ----- Flask-JWT-Extended hooks -----
+
+@jwt.user_lookup_loader
+def _lookup_user(jwt_header, jwt_data):
+    return get(jwt_data[current_app.config['JWT_IDENTITY_CLAIM']])
+
+
+@jwt.user_lookup_error_loader
+def _user_not_found(jwt_header, jwt_data):
+    return jsonify(error="User not found"), 404
@@ -0,0 +1,73 @@
+# backend/benchmark_passwords.py
+#
+# How many logins per second each password-hash cost allows, to pick
+# PASSWORD_HASH_ITERATIONS. For every cost it times single-threaded checks
+# (= logins per second per core) and then the same checks through the
+# PasswordHasher pool the app uses, to show how throughput scales with
+# PASSWORD_HASH_WORKERS. Needs no database or app config.
+#
+#   python benchmark_passwords.py [--iterations 100000 300000 600000 1000000]
+#                                 [--seconds 3] [--workers N] [--method pbkdf2:sha256]
+
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app.services.passwords import PasswordHasher, method_string
+
+
+def _single_core(pwhash, password, seconds):
+    timings = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline or len(timings) < 3:
+        started = time.perf_counter()
+        check_password_hash(pwhash, password)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def _pooled(method, pwhash, password, seconds, workers):
+    hasher = PasswordHasher(method=method, workers=workers, max_queue=workers * 4, timeout=60)
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+
+    def client():
+        count = 0
+        while time.perf_counter() < deadline:
+            hasher.verify(pwhash, password)
+            count += 1
+        return count
+
+    # Twice as many callers as threads keeps the pool saturated
+    with ThreadPoolExecutor(max_workers=workers * 2) as callers:
+        done = sum(callers.map(lambda _: client(), range(workers * 2)))
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+    return done / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark password hash cost settings')
+    parser.add_argument('--iterations', type=int, nargs='+', default=[100000, 300000, 600000, 1000000],
+                        help='PBKDF2 iteration counts to compare')
+    parser.add_argument('--method', default='pbkdf2:sha256', help='werkzeug hash method (default pbkdf2:sha256)')
+    parser.add_argument('--seconds', type=float, default=3.0, help='time spent on each measurement')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='hashing threads for the pooled run (default: CPU count)')
+    args = parser.parse_args()
+
+    password = 'correct horse battery staple'
+    print(f"{'iterations':>10}  {'ms/login':>9}  {'p95 ms':>7}  {'logins/s/core':>13}  "
+          f"{'logins/s x' + str(args.workers):>14}")
+    for iterations in args.iterations:
+        method = method_string(args.method, iterations)
+        pwhash = generate_password_hash(password, method=method)
+        timings = _single_core(pwhash, password, args.seconds)
+        mean = statistics.mean(timings)
+        p95 = sorted(timings)[int(len(timings) * 0.95) - 1 if len(timings) > 1 else 0]
+        pooled = _pooled(method, pwhash, password, args.seconds, args.workers)
+        print(f"{iterations:>10}  {mean * 1000:>9.1f}  {p95 * 1000:>7.1f}  {1 / mean:>13.1f}  {pooled:>14.1f}")
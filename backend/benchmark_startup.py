@@ -0,0 +1,123 @@
+# backend/benchmark_startup.py
+#
+# Startup cost of a web worker: import + create_app() time and memory.
+#
+#   cold      N fresh interpreters each import wsgi.py, as workers do without
+#             preload; --eager also imports the lazily loaded SDKs, which is
+#             what every worker paid before they were made lazy
+#   preload   this process imports wsgi.py and warms it like the gunicorn
+#             master, then forks --workers children and reads each one's
+#             RSS and private (unshared) memory from /proc
+#
+# Private memory is what each extra worker really costs the box.
+#
+#   python benchmark_startup.py [--runs 5] [--workers 4] [--eager]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+_COLD = r'''
+import json, os, sys, time
+started = time.perf_counter()
+import wsgi
+if {eager}:
+    from app.services import prefork
+    for name in prefork.LAZY_MODULES:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+elapsed = time.perf_counter() - started
+rss = 0
+with open('/proc/self/status') as f:
+    for line in f:
+        if line.startswith('VmRSS:'):
+            rss = int(line.split()[1]) * 1024
+print(json.dumps({{'seconds': elapsed, 'rss': rss, 'modules': len(sys.modules)}}))
+'''
+
+
+def _mb(n):
+    return n / (1024 * 1024)
+
+
+def _memory(pid):
+    """(rss, private) bytes for a process, from smaps_rollup"""
+    rss = private = 0
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key == 'Rss':
+                rss = int(value.split()[0]) * 1024
+            elif key in ('Private_Clean', 'Private_Dirty'):
+                private += int(value.split()[0]) * 1024
+    return rss, private
+
+
+def cold(runs, eager):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, '-c', _COLD.format(eager=eager)],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    seconds = [s['seconds'] for s in samples]
+    rss = [s['rss'] for s in samples]
+    label = 'eager SDK imports' if eager else 'lazy SDK imports'
+    print(f"cold start ({label}, {runs} runs)")
+    print(f"  import + create_app   median {statistics.median(seconds):.2f}s   max {max(seconds):.2f}s")
+    print(f"  RSS per worker        median {_mb(statistics.median(rss)):.1f} MB")
+    print(f"  modules loaded        {samples[-1]['modules']}")
+
+
+def preload(workers):
+    started = time.perf_counter()
+    import wsgi
+    from app.services import prefork
+    prefork.warm()
+    boot = time.perf_counter() - started
+
+    children = []
+    for _ in range(workers):
+        forked = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            prefork.after_fork(wsgi.app)
+            time.sleep(60)
+            os._exit(0)
+        children.append((pid, time.perf_counter() - forked))
+    time.sleep(1)
+
+    print(f"preload ({workers} workers)")
+    print(f"  master import + warm  {boot:.2f}s")
+    master_rss, _ = _memory(os.getpid())
+    print(f"  master RSS            {_mb(master_rss):.1f} MB")
+    try:
+        for pid, fork_seconds in children:
+            rss, private = _memory(pid)
+            print(f"  worker {pid:<7}  fork {fork_seconds * 1000:6.1f} ms   "
+                  f"RSS {_mb(rss):6.1f} MB   private {_mb(private):6.1f} MB")
+    finally:
+        for pid, _ in children:
+            os.kill(pid, 9)
+            os.waitpid(pid, 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure worker startup time and memory')
+    parser.add_argument('--runs', type=int, default=5, help='cold starts to time')
+    parser.add_argument('--workers', type=int, default=4, help='workers to fork in the preload run')
+    parser.add_argument('--eager', action='store_true', help='also time cold starts with the SDKs imported up front')
+    args = parser.parse_args()
+
+    cold(args.runs, eager=False)
+    if args.eager:
+        cold(args.runs, eager=True)
+    preload(args.workers)
@@ -2,32 +2,9 @@ import uuid
 from wsgi import app
 from app import db
 from app.models import User
-from werkzeug.security import generate_password_hash
+from app.services.passwords import hash_password
+from app.services.plans import PLAN_CONFIG
 
-# Plan definitions
-PLAN_CONFIG = {
-    'essential': {
-        'seat_limit': 1,
-        'credits_remaining': 3,
-        'max_seats_purchase': 0,
-        'unlimited_analysis': False,
-        'max_concurrent_sessions': None,
-    },
-    'growth': {
-        'seat_limit': 1,
-        'credits_remaining': 10,
-        'max_seats_purchase': 5,
-        'unlimited_analysis': False,
-        'max_concurrent_sessions': None,
-    },
-    'founder': {
-        'seat_limit': 1,
-        'credits_remaining': None,  # Unlimited
-        'max_seats_purchase': 0,
-        'unlimited_analysis': True,
-        'max_concurrent_sessions': 5,
-    },
-}
 
 def create_user(
     email: str,
@@ -42,7 +19,7 @@ def create_user(
     if plan is None:
         raise ValueError(f"Unknown plan: {plan_key}")
 
-    password_hash = generate_password_hash(raw_password, method='pbkdf2:sha256')
+    password_hash = hash_password(raw_password)
     user = User(
         id=str(uuid.uuid4()),
         email=email,
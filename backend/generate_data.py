@@ -0,0 +1,294 @@
+# backend/generate_data.py
+#
+# Synthetic data at scale for storage and query benchmarks: users on every
+# PLAN_CONFIG plan (create_user.py) with Stripe customer/subscription ids,
+# sessions with long-tailed chat_history sizes, the usage ledger charges
+# behind their credit balances, and matching dashboard aggregates.
+#
+# Everything derives from --seed and the user's index, so the same options
+# always produce the same rows, whatever --batch-size is; --offset appends
+# further users to an existing dataset (0..N, then N..2N). Rows are
+# generated a batch of users at a time and written with multi-row INSERTs,
+# one transaction per batch, so memory stays flat at any --users.
+#
+#   python generate_data.py --users 100000 --seed 42
+#   python generate_data.py --users 100000 --offset 100000 --seed 42      # grow to 200k
+#   python generate_data.py --users 1000 --sessions-mean 20 --messages-mean 40 --plans growth=1,founder=1
+
+import argparse
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from create_user import PLAN_CONFIG
+from wsgi import app
+from app import db
+from app.models import Session, SessionMessage, UsageLedger, User, UserAggregate
+from app.services.passwords import hash_password
+
+DOC_TYPES = ('market_analysis', 'gap_analysis', 'swot_analysis')
+DOC_TYPE_WEIGHTS = (6, 3, 2)
+PHASES = 3
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Share of each plan when --plans isn't given
+DEFAULT_PLAN_WEIGHTS = {'essential': 70, 'growth': 25, 'founder': 5}
+
+_WORDS = (
+    'market customer segment revenue growth pricing competitor channel retention churn '
+    'acquisition margin forecast demand supply strategy risk opportunity gap strength weakness '
+    'threat analysis product feature launch region enterprise startup pipeline conversion '
+    'budget cost value proposition survey interview insight trend adoption partner'
+).split()
+
+
+def _corpus(seed, size=1 << 20):
+    """A fixed block of text that message bodies are sliced from (fast, and deterministic)"""
+    rng = random.Random(f'{seed}:corpus')
+    return ' '.join(rng.choice(_WORDS) for _ in range(size // 7))[:size]
+
+
+def _lognormal(rng, mean, sigma, cap):
+    """Long-tailed positive integer with roughly the given mean"""
+    mu = math.log(max(mean, 0.01)) - sigma * sigma / 2
+    return min(cap, int(rng.lognormvariate(mu, sigma)))
+
+
+def _millis(at):
+    # Not datetime.timestamp(), which would depend on the local timezone
+    return int((at - _EPOCH).total_seconds() * 1000)
+
+
+def _stripe_id(rng, prefix):
+    return f'{prefix}_{rng.getrandbits(80):020x}'
+
+
+def parse_plans(value):
+    if not value:
+        return dict(DEFAULT_PLAN_WEIGHTS)
+    weights = {}
+    for part in value.split(','):
+        plan, _, weight = part.partition('=')
+        plan = plan.strip()
+        if plan not in PLAN_CONFIG:
+            raise SystemExit(f"Unknown plan '{plan}' (choose from {', '.join(PLAN_CONFIG)})")
+        weights[plan] = float(weight or 1)
+    return weights
+
+
+class Generator:
+
+    def __init__(self, args, password_hash):
+        self.args = args
+        self.password_hash = password_hash
+        self.corpus = _corpus(args.seed)
+        self.plans = parse_plans(args.plans)
+        self.start = datetime.fromisoformat(args.start)
+        self.span = timedelta(days=args.days)
+
+    def _text(self, rng, mean_chars):
+        length = max(8, _lognormal(rng, mean_chars, 0.8, 8000))
+        offset = rng.randrange(len(self.corpus) - length)
+        return self.corpus[offset:offset + length]
+
+    def _chat_history(self, rng, created):
+        count = _lognormal(rng, self.args.messages_mean, 1.0, self.args.max_messages)
+        at = created
+        history = []
+        for position in range(count):
+            at += timedelta(seconds=rng.randint(5, 600))
+            user_turn = position % 2 == 0
+            history.append({
+                'id': _millis(at) + position,
+                'type': 'user' if user_turn else 'ai',
+                'content': self._text(rng, 160 if user_turn else 1200),
+                'timestamp': at.isoformat() + 'Z',
+            })
+        return history, at
+
+    def user(self, index):
+        """One user's rows: (user, [(session, chat_history)], ledger rows, aggregate)"""
+        args = self.args
+        rng = random.Random(f'{args.seed}:user:{index}')
+        plan_key = rng.choices(list(self.plans), list(self.plans.values()))[0]
+        plan = PLAN_CONFIG[plan_key]
+        user_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        joined = self.start + self.span * rng.random()
+
+        # Paying plans are linked to a customer and subscription; some free
+        # users have a customer left over from a cancelled subscription
+        customer_id = subscription_id = None
+        if plan_key != 'essential':
+            customer_id, subscription_id = _stripe_id(rng, 'cus'), _stripe_id(rng, 'sub')
+        elif rng.random() < args.churned_ratio:
+            customer_id = _stripe_id(rng, 'cus')
+
+        sessions, ledger = [], []
+        charges, credits = 0, plan['credits_remaining']
+        doc_type_counts, pending = {}, 0
+        for n in range(_lognormal(rng, args.sessions_mean, 1.0, args.max_sessions)):
+            created = joined + timedelta(seconds=rng.randint(0, 90 * 86400))
+            history, last = self._chat_history(rng, created)
+            doc_type = rng.choices(DOC_TYPES, DOC_TYPE_WEIGHTS)[0]
+            completed = rng.random() < args.completed_ratio
+            session_id = f'session_{_millis(created)}{n:03d}'
+            sessions.append(({
+                'session_id': session_id,
+                'user_id': user_id,
+                'name': f"{doc_type.replace('_', ' ').title()} {n + 1}",
+                'document_type': doc_type,
+                'current_phase': PHASES if completed else rng.randint(1, PHASES),
+                'notes': {f'phase{p}': self._text(rng, 300) if rng.random() < 0.6 else '' for p in range(1, PHASES + 1)},
+                'status': 'completed' if completed else 'in_progress',
+                'version': 1 + len(history) + rng.randint(0, 5),
+                'message_count': len(history),
+                'created': created,
+                'timestamp': last,
+                'completed_at': last if completed else None,
+                'charged_at': None,
+            }, history))
+            doc_type_counts[doc_type] = doc_type_counts.get(doc_type, 0) + 1
+            pending += not completed
+
+            # The first generation in a session is charged, while credits last
+            if history and (credits is None or charges < credits):
+                charges += 1
+                sessions[-1][0]['charged_at'] = created
+                ledger.append({
+                    'user_id': user_id, 'session_id': session_id, 'kind': 'charge', 'doc_type': doc_type,
+                    'provider': None, 'model': None,
+                    'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0,
+                    'credits_charged': 1, 'created_at': created,
+                })
+            if len(history) > 1:
+                prompt, completion = rng.randint(200, 4000) * len(history), rng.randint(200, 900) * len(history)
+                ledger.append({
+                    'user_id': user_id, 'session_id': session_id, 'kind': 'chat', 'doc_type': doc_type,
+                    'provider': 'openai', 'model': 'gpt-4o',
+                    'prompt_tokens': prompt, 'completion_tokens': completion, 'total_tokens': prompt + completion,
+                    'credits_charged': 0, 'created_at': last,
+                })
+
+        credits_remaining = None if credits is None else credits - charges
+        user = {
+            'id': user_id,
+            'email': f'{args.prefix}-{index}@example.com',
+            'name': f'Synthetic User {index}',
+            'password_hash': self.password_hash,
+            'stripe_customer_id': customer_id,
+            'stripe_subscription_id': subscription_id,
+            'subscription_plan': plan_key,
+            'seat_limit': plan['seat_limit'],
+            'max_seats': plan['seat_limit'] + plan.get('max_seats_purchase', 0),
+            'unlimited_analysis': plan.get('unlimited_analysis', False),
+            'max_concurrent_sessions': plan.get('max_concurrent_sessions'),
+            'credits_remaining': credits_remaining,
+            'referral_code': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            'created_at': joined,
+            'updated_at': max([joined] + [s['timestamp'] for s, _ in sessions]),
+        }
+        aggregate = {
+            'user_id': user_id,
+            'pending_count': pending,
+            'all_count': len(sessions),
+            'doc_type_counts': doc_type_counts,
+            'credits_used': charges,
+            'credits_remaining': credits_remaining,
+            'version': 1,
+        }
+        return user, sessions, ledger, aggregate
+
+
+def write_batch(batch, message_chunk):
+    """Insert one batch of generated users in a single transaction"""
+    users, aggregates, sessions, histories, ledger = [], [], [], [], []
+    for user, user_sessions, user_ledger, aggregate in batch:
+        users.append(user)
+        aggregates.append(aggregate)
+        for session, history in user_sessions:
+            sessions.append(session)
+            histories.append(history)
+        ledger.extend(user_ledger)
+
+    # render_nulls: keep credits_remaining=None (unlimited) instead of the column default
+    db.session.execute(insert(User).execution_options(render_nulls=True), users)
+    db.session.execute(insert(UserAggregate), aggregates)
+    session_pks = db.session.scalars(
+        insert(Session).returning(Session.id, sort_by_parameter_order=True),
+        sessions
+    ).all() if sessions else []
+    if ledger:
+        db.session.execute(insert(UsageLedger), ledger)
+
+    # Messages go out in chunks as they are built, instead of all at once,
+    # through the plain table insert (the ORM bulk path adds nothing here)
+    messages = 0
+    chunk = []
+    for pk, session, history in zip(session_pks, sessions, histories):
+        for position, message in enumerate(history):
+            chunk.append({'session_pk': pk, 'position': position, 'message': message,
+                          'created_at': session['created']})
+            if len(chunk) >= message_chunk:
+                db.session.execute(insert(SessionMessage.__table__), chunk)
+                messages += len(chunk)
+                chunk = []
+    if chunk:
+        db.session.execute(insert(SessionMessage.__table__), chunk)
+        messages += len(chunk)
+    db.session.commit()
+    return len(sessions), messages, len(ledger)
+
+
+def generate(args):
+    first = f'{args.prefix}-{args.offset}@example.com'
+    if db.session.query(User.id).filter_by(email=first).first():
+        raise SystemExit(f"{first} already exists; pass --offset past the existing users or another --prefix")
+
+    # Everyone shares one password, so hash it once
+    generator = Generator(args, hash_password(args.password))
+    totals = {'users': 0, 'sessions': 0, 'messages': 0, 'ledger': 0}
+    started = time.monotonic()
+    end = args.offset + args.users
+    for batch_start in range(args.offset, end, args.batch_size):
+        batch = [generator.user(i) for i in range(batch_start, min(batch_start + args.batch_size, end))]
+        sessions, messages, ledger = write_batch(batch, args.message_chunk)
+        totals['users'] += len(batch)
+        totals['sessions'] += sessions
+        totals['messages'] += messages
+        totals['ledger'] += ledger
+        elapsed = time.monotonic() - started
+        print(f"  {totals['users']:>9} users  {totals['sessions']:>10} sessions  "
+              f"{totals['messages']:>11} messages  {elapsed:7.1f}s  "
+              f"({totals['messages'] / elapsed if elapsed else 0:,.0f} messages/s)", flush=True)
+    return totals, time.monotonic() - started
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a large synthetic dataset')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--offset', type=int, default=0, help='index of the first user (to extend a dataset)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--plans', help='plan=weight,... over PLAN_CONFIG (default essential=70,growth=25,founder=5)')
+    parser.add_argument('--sessions-mean', type=float, default=5, help='mean sessions per user (long-tailed)')
+    parser.add_argument('--max-sessions', type=int, default=500)
+    parser.add_argument('--messages-mean', type=float, default=12, help='mean chat_history length (long-tailed)')
+    parser.add_argument('--max-messages', type=int, default=1000)
+    parser.add_argument('--completed-ratio', type=float, default=0.4)
+    parser.add_argument('--churned-ratio', type=float, default=0.05, help='free users with a Stripe customer')
+    parser.add_argument('--start', default='2024-01-01', help='earliest signup date (fixed, for repeatability)')
+    parser.add_argument('--days', type=int, default=365, help='signups spread over this many days')
+    parser.add_argument('--prefix', default='synthetic', help='email prefix: <prefix>-<index>@example.com')
+    parser.add_argument('--password', default='synthetic-password')
+    parser.add_argument('--batch-size', type=int, default=500, help='users per transaction')
+    parser.add_argument('--message-chunk', type=int, default=5000, help='session_messages rows per INSERT')
+    args = parser.parse_args()
+
+    with app.app_context():
+        totals, elapsed = generate(args)
+    print(f"Generated {totals['users']} users, {totals['sessions']} sessions, {totals['messages']} messages "
+          f"and {totals['ledger']} ledger rows in {elapsed:.1f}s")
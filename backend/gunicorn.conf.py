@@ -0,0 +1,40 @@
+# backend/gunicorn.conf.py
+#
+# Picked up automatically by `gunicorn wsgi:app` run from backend/.
+#
+# With GUNICORN_PRELOAD on (the default), the master imports wsgi.py once,
+# warms the lazily imported SDKs and forks workers from it: a worker boots
+# in milliseconds, worker restarts are just as cheap, and the imported code
+# is shared between workers instead of copied into each. create_app() opens
+# no database connections or HTTP clients, and post_fork resets the ones
+# that would otherwise be shared (app/services/prefork.py).
+#
+# Measure the difference with `python benchmark_startup.py`.
+
+import multiprocessing
+import os
+
+bind                = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers             = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Threads keep long SSE replies from tying up a whole worker
+worker_class        = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads             = int(os.getenv('GUNICORN_THREADS', 8))
+timeout             = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout    = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+preload_app         = os.getenv('GUNICORN_PRELOAD', 'true').lower() in ('true', '1', 'yes')
+max_requests        = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app.services import prefork
+        prefork.warm()
+        server.log.info("Preloaded app and SDKs; forking workers")
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app.services import prefork
+        from wsgi import app  # already imported by the master
+        prefork.after_fork(app)
@@ -0,0 +1,114 @@
+# backend/import_sessions.py
+#
+# One-shot import of the legacy sessions_data/user_<id>_sessions.json files
+# into the sessions table. Safe to re-run: sessions already in the table are
+# skipped, and files for users that no longer exist are reported and ignored.
+#
+#   python import_sessions.py [--dir sessions_data] [--batch-size 500] [--dry-run]
+
+import argparse
+import glob
+import json
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from wsgi import app
+from app import db
+from app.models import Session, SessionMessage, User
+from app.routes.sessions import parse_timestamp
+
+FILE_PATTERN = re.compile(r'user_(?P<user_id>.+)_sessions\.json$')
+
+
+def session_rows(user_id, sessions, existing):
+    """
+    Turn one legacy file's {session_id: {...}} map into insert rows; the
+    chat_history list rides along and is split off before the insert.
+    """
+    now = datetime.utcnow()
+    for session_id, data in sessions.items():
+        session_id = data.get('session_id') or session_id
+        if session_id in existing:
+            continue
+        yield {
+            'session_id': session_id,
+            'user_id': user_id,
+            'name': data.get('name', ''),
+            'document_type': data.get('document_type', ''),
+            'current_phase': data.get('current_phase', 1),
+            'chat_history': data.get('chat_history') or [],
+            'message_count': len(data.get('chat_history') or []),
+            'notes': data.get('notes', {}),
+            'status': data.get('status', 'in_progress'),
+            'created': parse_timestamp(data.get('created')) or now,
+            'timestamp': parse_timestamp(data.get('timestamp')) or now,
+            'completed_at': parse_timestamp(data.get('completed_at')),
+        }
+
+
+def import_sessions(sessions_dir, batch_size=500, dry_run=False):
+    known_users = {uid for (uid,) in db.session.query(User.id)}
+    totals = {'files': 0, 'imported': 0, 'skipped_users': 0}
+    batch = []
+
+    def flush():
+        if batch and not dry_run:
+            histories = [row.pop('chat_history') for row in batch]
+            session_pks = db.session.scalars(
+                insert(Session).returning(Session.id, sort_by_parameter_order=True),
+                batch
+            ).all()
+            now = datetime.utcnow()
+            messages = [
+                {'session_pk': pk, 'position': i, 'message': m, 'created_at': now}
+                for pk, history in zip(session_pks, histories)
+                for i, m in enumerate(history)
+            ]
+            if messages:
+                db.session.execute(insert(SessionMessage), messages)
+            db.session.commit()
+        totals['imported'] += len(batch)
+        batch.clear()
+
+    for path in sorted(glob.glob(os.path.join(sessions_dir, 'user_*_sessions.json'))):
+        match = FILE_PATTERN.search(os.path.basename(path))
+        user_id = match.group('user_id')
+        totals['files'] += 1
+        if user_id not in known_users:
+            print(f"  skipping {path}: no user {user_id}")
+            totals['skipped_users'] += 1
+            continue
+
+        with open(path) as f:
+            try:
+                sessions = json.load(f)
+            except ValueError as e:
+                print(f"  skipping {path}: {e}")
+                continue
+
+        existing = {
+            sid for (sid,) in db.session.query(Session.session_id).filter_by(user_id=user_id)
+        }
+        for row in session_rows(user_id, sessions, existing):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush()
+    flush()
+    return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import legacy JSON sessions into the database')
+    parser.add_argument('--dir', default='sessions_data', help='legacy sessions directory')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help='parse and count without writing')
+    args = parser.parse_args()
+
+    with app.app_context():
+        totals = import_sessions(args.dir, args.batch_size, args.dry_run)
+        verb = 'Would import' if args.dry_run else 'Imported'
+        print(f"{verb} {totals['imported']} sessions from {totals['files']} files "
+              f"({totals['skipped_users']} files had no matching user)")
@@ -0,0 +1,3 @@
+# loadtest/__init__.py
+#
+# End-to-end load tests; see __main__.py for usage (`python -m loadtest --help`).
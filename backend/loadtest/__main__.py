@@ -0,0 +1,177 @@
+# loadtest/__main__.py
+#
+# End-to-end load test: boots wsgi:app against SQLite (or --database-url),
+# with OpenAI, Anthropic and Stripe replaced by local stubs of configurable
+# latency, drives a scenario mix with N virtual users and reports p50, p95,
+# p99 and requests per second per endpoint. Run from backend/:
+#
+#   python -m loadtest run --mix default --duration 60 --concurrency 20 --save loadtest/results/main.json
+#   python -m loadtest run --mix chat --baseline loadtest/results/main.json      # compare after the run
+#   python -m loadtest run --mix autosave=3,dashboard=1 --env ADMISSION_RATE_PER_MINUTE=600
+#   python -m loadtest compare loadtest/results/main.json loadtest/results/branch.json
+#
+# Mixes: default, chat, autosave, auth, webhooks (loadtest/scenarios.py), or
+# scenario=weight pairs. Stub delays are seeded, so two runs of the same
+# commit see the same upstream latencies. Compare exits with status 1 when an
+# endpoint's p50/p95/p99 or error rate grows, or its throughput drops, by
+# more than --threshold percent.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+
+from loadtest import report, scenarios, server
+from loadtest.stubs import LLMStub, StripeStub
+
+
+def _overrides(pairs):
+    env = {}
+    for pair in pairs or []:
+        key, sep, value = pair.partition('=')
+        if not sep:
+            raise SystemExit(f"--env expects KEY=VALUE, got {pair!r}")
+        env[key] = value
+    return env
+
+
+def _describe_database(url):
+    return url.split(':', 1)[0] if url else 'sqlite'
+
+
+def run(args):
+    mix = scenarios.parse_mix(args.mix)
+    if args.server == 'auto':
+        args.server = 'gunicorn' if server.gunicorn_available() else 'werkzeug'
+        if args.server == 'werkzeug':
+            print("gunicorn is not installed; serving with werkzeug's threaded server")
+
+    workdir = tempfile.mkdtemp(prefix='sekki-loadtest-')
+    llm = LLMStub(first_token=args.llm_first_token, token_interval=args.llm_token_interval,
+                  tokens=args.llm_tokens, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed).start()
+    env = server.environment(workdir, args.database_url, llm.url, stripe_url='', llm=args.llm,
+                             overrides=_overrides(args.env))
+    stripe = StripeStub(latency=args.stripe_latency, jitter=args.jitter, error_rate=args.error_rate,
+                        seed=args.seed, price_ids=server.price_ids(env)).start()
+    env['STRIPE_API_BASE'] = stripe.url
+    args.webhook_secret = env['STRIPE_WEBHOOK_SECRET']
+
+    process = None
+    log_path = os.path.join(workdir, 'server.log')
+    try:
+        print(f"Setting up {_describe_database(args.database_url)} database with {args.users} users")
+        accounts = server.setup(env, uuid.uuid4().hex[:8], args.users, args.password)
+
+        port = server.free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        process = server.start(env, port, log_path, args.server, args.workers, args.threads)
+        server.wait_ready(process, base_url)
+
+        print(f"Running mix {args.mix} with {args.concurrency} users for {args.warmup:g}s warmup "
+              f"+ {args.duration:g}s against {args.server} at {base_url}")
+        samples, seconds = scenarios.run(base_url, accounts, mix, args)
+    except Exception:
+        if os.path.exists(log_path):
+            with open(log_path) as f:
+                sys.stderr.write(f"--- server log ---\n{f.read()[-4000:]}\n")
+        raise
+    finally:
+        if process is not None:
+            server.stop(process)
+        llm.stop()
+        stripe.stop()
+        if args.keep:
+            print(f"Kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result = report.summarize(samples, seconds, meta={
+        'mix': args.mix,
+        'weights': mix,
+        'duration': args.duration,
+        'concurrency': args.concurrency,
+        'users': args.users,
+        'server': args.server,
+        'workers': args.workers,
+        'threads': args.threads,
+        'database': _describe_database(args.database_url),
+        'llm': {'providers': args.llm, 'first_token': args.llm_first_token,
+                'token_interval': args.llm_token_interval, 'tokens': args.llm_tokens},
+        'stripe_latency': args.stripe_latency,
+        'jitter': args.jitter,
+        'error_rate': args.error_rate,
+        'seed': args.seed,
+        'env': _overrides(args.env),
+    })
+    print()
+    report.print_table(result)
+
+    save_path = args.save or os.path.join(
+        server.BACKEND, 'loadtest', 'results', f"{datetime.now():%Y%m%d-%H%M%S}-{args.mix.replace(',', '_')}.json")
+    report.save(result, save_path)
+    print(f"\nSaved {save_path}")
+
+    if args.baseline:
+        print()
+        regressions = report.compare(report.load(args.baseline), result, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+def compare(args):
+    regressions = report.compare(report.load(args.baseline), report.load(args.current), args.threshold)
+    print(f"\n{len(regressions)} regression(s) beyond {args.threshold:g}%")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m loadtest', description='Load test the backend end to end')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('run', help='boot the app with stubs and drive a scenario mix')
+    p.add_argument('--mix', default='default', help='named mix or scenario=weight,...')
+    p.add_argument('--duration', type=float, default=60, help='measured seconds')
+    p.add_argument('--warmup', type=float, default=5, help='seconds of load before measuring')
+    p.add_argument('--concurrency', type=int, default=20, help='virtual users')
+    p.add_argument('--users', type=int, default=50, help='accounts to seed (shared round-robin)')
+    p.add_argument('--think', type=float, default=0.0, help='mean pause between scenarios, seconds')
+    p.add_argument('--password', default='loadtest-password')
+    p.add_argument('--database-url', help='e.g. postgresql://... (default: a fresh SQLite file)')
+    p.add_argument('--server', choices=('auto', 'gunicorn', 'werkzeug'), default='auto')
+    p.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    p.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    p.add_argument('--llm', choices=('both', 'openai', 'anthropic'), default='both',
+                   help='providers to configure against the stub')
+    p.add_argument('--llm-first-token', type=float, default=0.3, help='stub seconds to first token')
+    p.add_argument('--llm-token-interval', type=float, default=0.02, help='stub seconds per further token')
+    p.add_argument('--llm-tokens', type=int, default=50, help='tokens per stub reply')
+    p.add_argument('--stripe-latency', type=float, default=0.15, help='stub seconds per Stripe call')
+    p.add_argument('--jitter', type=float, default=0.2, help='relative spread of stub delays')
+    p.add_argument('--error-rate', type=float, default=0.0, help='fraction of stub calls that fail')
+    p.add_argument('--stream-ratio', type=float, default=0.5, help='fraction of chat turns streamed')
+    p.add_argument('--repeat-ratio', type=float, default=0.2, help='fraction of chat prompts repeated verbatim')
+    p.add_argument('--webhook-burst', type=int, default=20, help='events per webhook storm')
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--env', action='append', metavar='KEY=VALUE', help='extra server config (repeatable)')
+    p.add_argument('--drain-timeout', type=float, default=30, help='seconds to wait for in-flight requests')
+    p.add_argument('--save', help='result path (default: loadtest/results/<time>-<mix>.json)')
+    p.add_argument('--baseline', help='compare against this result after the run')
+    p.add_argument('--threshold', type=float, default=10.0, help='percent change counted as a regression')
+    p.add_argument('--keep', action='store_true', help='keep the database and server log')
+    p.set_defaults(func=run)
+
+    p = commands.add_parser('compare', help='compare two saved results')
+    p.add_argument('baseline')
+    p.add_argument('current')
+    p.add_argument('--threshold', type=float, default=10.0, help='percent change counted as a regression')
+    p.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# loadtest/report.py
+"""
+Latency percentiles and throughput per endpoint, saved as JSON baselines
+that later runs are compared against.
+"""
+
+import json
+import os
+import platform
+import subprocess
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from loadtest.server import BACKEND
+
+# Metrics compared against a baseline: (key, higher is worse)
+COMPARED = (('p50_ms', True), ('p95_ms', True), ('p99_ms', True), ('rps', False), ('error_rate', True))
+
+# Latency changes smaller than this are noise, whatever the percentage
+MIN_LATENCY_DELTA_MS = 2.0
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def _stats(samples, seconds):
+    latencies = sorted(s.seconds * 1000 for s in samples)
+    statuses = Counter(s.status for s in samples)
+    errors = sum(n for status, n in statuses.items() if status == 0 or status >= 500)
+    return {
+        'count': len(samples),
+        'rps': round(len(samples) / seconds, 2) if seconds else 0.0,
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'statuses': {str(status): n for status, n in sorted(statuses.items())},
+        'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND,
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def summarize(samples, seconds, meta):
+    by_endpoint = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample.endpoint].append(sample)
+    # "first byte" series are latencies only; they aren't extra requests
+    requests = [s for s in samples if not s.endpoint.endswith(' first byte')]
+    return {
+        'meta': dict(
+            meta,
+            created=datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            commit=git_commit(),
+            python=platform.python_version(),
+            measured_seconds=round(seconds, 2),
+        ),
+        'total': _stats(requests, seconds),
+        'endpoints': {name: _stats(group, seconds) for name, group in sorted(by_endpoint.items())},
+    }
+
+
+def print_table(result):
+    header = f"{'endpoint':<44} {'count':>7} {'rps':>8} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(header)
+    print('-' * len(header))
+    rows = list(result['endpoints'].items()) + [('TOTAL', result['total'])]
+    for name, stats in rows:
+        print(f"{name:<44} {stats['count']:>7} {stats['rps']:>8.2f} {stats['errors']:>5} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+        unexpected = {s: n for s, n in stats['statuses'].items() if not s.startswith(('2', '3'))}
+        if unexpected and name != 'TOTAL':
+            print(f"{'':<44} statuses {unexpected}")
+
+
+def save(result, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _change(before, after):
+    if before == 0:
+        return 0.0 if after == 0 else float('inf')
+    return (after - before) / before * 100
+
+
+def compare(baseline, current, threshold=10.0):
+    """
+    Print current against baseline per endpoint; returns the regressions as
+    (endpoint, metric, before, after, percent change)
+    """
+    for key in ('mix', 'concurrency', 'server', 'workers', 'threads', 'database'):
+        if baseline['meta'].get(key) != current['meta'].get(key):
+            print(f"warning: {key} differs from the baseline "
+                  f"({baseline['meta'].get(key)!r} -> {current['meta'].get(key)!r})")
+
+    regressions = []
+    print(f"{'endpoint':<44} {'metric':<11} {'baseline':>10} {'current':>10} {'change':>9}")
+    for name in sorted(set(baseline['endpoints']) | set(current['endpoints'])):
+        before, after = baseline['endpoints'].get(name), current['endpoints'].get(name)
+        if before is None or after is None:
+            print(f"{name:<44} {'only in ' + ('current' if before is None else 'baseline')}")
+            continue
+        for key, higher_is_worse in COMPARED:
+            change = _change(before[key], after[key])
+            worse = change > threshold if higher_is_worse else change < -threshold
+            if key.endswith('_ms') and abs(after[key] - before[key]) < MIN_LATENCY_DELTA_MS:
+                worse = False
+            if key == 'error_rate' and after['errors'] == 0:
+                worse = False
+            flag = '  REGRESSION' if worse else ''
+            print(f"{name:<44} {key:<11} {before[key]:>10} {after[key]:>10} {change:>+8.1f}%{flag}")
+            if worse:
+                regressions.append((name, key, before[key], after[key], change))
+    return regressions
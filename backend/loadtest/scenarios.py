@@ -0,0 +1,297 @@
+# loadtest/scenarios.py
+"""
+What the virtual users do.
+
+Each virtual user is a thread with its own keep-alive connection, seeded
+random generator and load-test account. It repeatedly picks a scenario by
+weight from the mix and runs it; every HTTP request is recorded as a
+Sample under a stable endpoint name.
+
+    signup     create a new account
+    login      sign in (full password hash check)
+    chat       a burst of 2-4 chat turns in one conversation, streamed or not
+    autosave   save a session, then autosave it with several PATCHes
+    dashboard  poll the dashboard with If-None-Match, and the session list
+    billing    list plans, start a checkout and poll the checkout session
+    webhooks   a storm of signed Stripe events, some of them resent
+"""
+
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+import uuid
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from sign_stripe_event import build_event, sign
+
+Sample = namedtuple('Sample', 'endpoint status seconds')
+
+MIXES = {
+    'default':  {'dashboard': 40, 'autosave': 25, 'chat': 20, 'login': 8, 'billing': 5, 'signup': 4, 'webhooks': 3},
+    'chat':     {'chat': 80, 'dashboard': 20},
+    'autosave': {'autosave': 80, 'dashboard': 20},
+    'auth':     {'login': 70, 'signup': 30},
+    'billing':  {'billing': 60, 'webhooks': 40},
+    'webhooks': {'webhooks': 100},
+}
+
+PROMPTS = (
+    'Summarize the market size for B2B invoicing software in Europe.',
+    'What are the main risks of expanding a SaaS product into Japan?',
+    'Draft three customer interview questions for a logistics startup.',
+    'List the key assumptions behind a bottom-up revenue forecast.',
+    'How should a seed-stage company price an analytics add-on?',
+)
+
+
+def parse_mix(value):
+    """A named mix, or `scenario=weight,...`"""
+    if value in MIXES:
+        return dict(MIXES[value])
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}' (choose from {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Client:
+    """One keep-alive HTTP connection, reopened after any error"""
+
+    def __init__(self, base_url, record, timeout=120):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port
+        self.record = record
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, endpoint, method, path, body=None, headers=None, token=None, stream=False):
+        """
+        Returns (status, response headers, body). For `stream` requests the
+        time to the first body byte is recorded too, as `<endpoint> first byte`.
+        """
+        headers = dict(headers or {})
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+            headers.setdefault('Content-Type', 'application/json')
+
+        started = time.perf_counter()
+        try:
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._conn.request(method, path, body=body, headers=headers)
+            response = self._conn.getresponse()
+            if stream:
+                first = response.read(1)
+                self.record(Sample(f'{endpoint} first byte', response.status, time.perf_counter() - started))
+                data = first + response.read()
+            else:
+                data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            self.record(Sample(endpoint, 0, time.perf_counter() - started))
+            return 0, {}, b''
+        self.record(Sample(endpoint, response.status, time.perf_counter() - started))
+        if response.will_close:
+            self.close()
+        return response.status, dict(response.getheaders()), data
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class VirtualUser:
+
+    def __init__(self, index, client, account, options, shared):
+        self.index = index
+        self.client = client
+        self.account = account
+        self.options = options
+        self.shared = shared
+        self.random = random.Random(options.seed * 100003 + index)
+        self.sessions = {}  # session_id -> version
+        self.dashboard_etag = None
+
+    def _json(self, data):
+        try:
+            return json.loads(data or b'{}')
+        except ValueError:
+            return {}
+
+    # ----- scenarios -----
+
+    def signup(self):
+        email = f'loadtest-signup-{uuid.uuid4().hex[:12]}@example.com'
+        self.client.request('POST /api/auth/signup', 'POST', '/api/auth/signup', {
+            'name': 'Load Test Signup', 'email': email, 'password': self.options.password, 'plan_key': 'essential',
+        })
+
+    def login(self):
+        status, _, data = self.client.request('POST /api/auth/login', 'POST', '/api/auth/login', {
+            'email': self.account['email'], 'password': self.options.password,
+        })
+        if status == 200:
+            self.account['token'] = self._json(data).get('token') or self.account['token']
+
+    def chat(self):
+        session_id = f'lt-chat-{uuid.uuid4().hex[:12]}'
+        for _ in range(self.random.randint(2, 4)):
+            # Some prompts repeat across users, as they do in practice, so the caches see hits
+            message = self.random.choice(PROMPTS)
+            if self.random.random() >= self.options.repeat_ratio:
+                message += f' (variant {self.random.randrange(10 ** 6)})'
+            stream = self.random.random() < self.options.stream_ratio
+            name = 'POST /api/chat (stream)' if stream else 'POST /api/chat'
+            self.client.request(name, 'POST', '/api/chat', {
+                'message': message, 'docType': 'market_analysis', 'sessionId': session_id, 'stream': stream,
+            }, token=self.account['token'], stream=stream)
+
+    def autosave(self):
+        token = self.account['token']
+        if not self.sessions or self.random.random() < 0.2:
+            session_id = f'lt-session-{uuid.uuid4().hex[:12]}'
+            status, _, data = self.client.request('POST /api/sessions', 'POST', '/api/sessions', {
+                'session_id': session_id,
+                'name': 'Load test analysis',
+                'document_type': 'market_analysis',
+                'current_phase': 1,
+                'notes': {'phase1': ''},
+                'chat_history': [{'role': 'user', 'content': self.random.choice(PROMPTS)}],
+            }, token=token)
+            if status != 200:
+                return
+            self.sessions[session_id] = self._json(data).get('version', 1)
+        else:
+            session_id = self.random.choice(list(self.sessions))
+
+        for i in range(self.random.randint(2, 5)):
+            status, _, data = self.client.request('PATCH /api/sessions/<id>', 'PATCH', f'/api/sessions/{session_id}', {
+                'base_version': self.sessions[session_id],
+                'append': [{'role': 'user', 'content': f'autosave {i}'}],
+                'notes': [{'op': 'replace', 'path': '/phase1', 'value': f'draft {self.random.random()}'}],
+            }, token=token)
+            body = self._json(data)
+            if status in (200, 409) and body.get('version'):
+                self.sessions[session_id] = body['version']
+
+    def dashboard(self):
+        token = self.account['token']
+        headers = {'If-None-Match': self.dashboard_etag} if self.dashboard_etag else {}
+        status, response_headers, _ = self.client.request(
+            'GET /api/dashboard', 'GET', '/api/dashboard', headers=headers, token=token)
+        if status == 200:
+            self.dashboard_etag = response_headers.get('ETag')
+        if self.random.random() < 0.3:
+            self.client.request('GET /api/sessions', 'GET', '/api/sessions', token=token)
+
+    def billing(self):
+        token = self.account['token']
+        self.client.request('GET /api/billing/plans', 'GET', '/api/billing/plans')
+        status, _, data = self.client.request(
+            'POST /api/billing/create-checkout-session', 'POST', '/api/billing/create-checkout-session',
+            {'plan_key': self.random.choice(('growth', 'founder'))},
+            headers={'Idempotency-Key': uuid.uuid4().hex}, token=token)
+        checkout_id = self._json(data).get('sessionId') if status == 200 else None
+        if checkout_id:
+            # The success page polls until the webhook lands; completed sessions are cached
+            for _ in range(2):
+                self.client.request('GET /api/billing/checkout-session', 'GET',
+                                    f'/api/billing/checkout-session?session_id={checkout_id}')
+
+    def webhooks(self):
+        for _ in range(self.options.webhook_burst):
+            resent = self.shared.sent_events and self.random.random() < 0.1
+            if resent:
+                # Stripe retries deliveries; the inbox must drop the duplicate
+                with self.shared.lock:
+                    payload = self.random.choice(self.shared.sent_events)
+            else:
+                account = self.random.choice(self.shared.accounts)
+                kind = self.random.choice(('invoice.payment_succeeded', 'checkout.session.completed'))
+                suffix = uuid.uuid4().hex[:14]
+                event = build_event(kind, argparse.Namespace(
+                    user_id=account['id'], customer=f'cus_lt{suffix}', subscription=f'sub_lt{suffix}',
+                    plan='growth', event_id=None,
+                ))
+                payload = json.dumps(event).encode()
+                with self.shared.lock:
+                    self.shared.sent_events.append(payload)
+            self.client.request('POST /api/billing/webhook', 'POST', '/api/billing/webhook', payload, headers={
+                'Content-Type': 'application/json',
+                'Stripe-Signature': sign(payload, self.options.webhook_secret),
+            })
+
+
+SCENARIOS = {
+    'signup': VirtualUser.signup,
+    'login': VirtualUser.login,
+    'chat': VirtualUser.chat,
+    'autosave': VirtualUser.autosave,
+    'dashboard': VirtualUser.dashboard,
+    'billing': VirtualUser.billing,
+    'webhooks': VirtualUser.webhooks,
+}
+
+
+class Shared:
+    """State every virtual user sees"""
+
+    def __init__(self, accounts):
+        self.accounts = accounts
+        self.sent_events = []
+        self.lock = threading.Lock()
+
+
+def run(base_url, accounts, mix, options):
+    """
+    Drive `options.concurrency` virtual users for warmup + duration seconds.
+    Returns (samples recorded after the warmup, measured seconds).
+    """
+    samples = []
+    measuring = threading.Event()
+    stop = threading.Event()
+
+    def record(sample):
+        # list.append is atomic; samples from the warmup are dropped
+        if measuring.is_set():
+            samples.append(sample)
+
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    shared = Shared(accounts)
+
+    def drive(index):
+        client = Client(base_url, record)
+        user = VirtualUser(index, client, dict(accounts[index % len(accounts)]), options, shared)
+        try:
+            while not stop.is_set():
+                SCENARIOS[user.random.choices(names, weights)[0]](user)
+                if options.think:
+                    stop.wait(user.random.expovariate(1 / options.think))
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=drive, args=(i,), daemon=True) for i in range(options.concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(options.warmup)
+    measuring.set()
+    started = time.perf_counter()
+    time.sleep(options.duration)
+    measured = time.perf_counter() - started
+    measuring.clear()
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=options.drain_timeout)
+    return samples, measured
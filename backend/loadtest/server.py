@@ -0,0 +1,167 @@
+# loadtest/server.py
+"""
+Boot the backend for a load test: environment, schema, seed users, and a
+`wsgi:app` server process pointed at the local stubs.
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PLANS = ('essential', 'growth', 'transform_basic', 'founder', 'enterprise')
+
+WEBHOOK_SECRET = 'whsec_loadtest'
+
+# Runs in a fresh interpreter with the server's environment, so the schema
+# and users are made by the same code and config the server will run
+_SETUP = r'''
+import json, uuid
+from flask_jwt_extended import create_access_token
+from flask_migrate import upgrade
+from sqlalchemy import insert
+from create_user import PLAN_CONFIG
+from wsgi import app
+from app import db
+from app.models import User
+from app.services.passwords import hash_password
+
+with app.app_context():
+    upgrade()
+    plan = PLAN_CONFIG[{plan!r}]
+    # One hash for everyone: the password is the same and hashing is slow on purpose
+    password_hash = hash_password({password!r})
+    users = [
+        {{
+            'id': str(uuid.uuid4()),
+            'email': f'loadtest-{run}-{{i}}@example.com',
+            'name': f'Load Test {{i}}',
+            'password_hash': password_hash,
+            'subscription_plan': {plan!r},
+            'seat_limit': plan['seat_limit'],
+            'credits_remaining': plan['credits_remaining'],
+            'max_seats': plan['seat_limit'] + plan.get('max_seats_purchase', 0),
+            'unlimited_analysis': plan.get('unlimited_analysis', False),
+            'max_concurrent_sessions': plan.get('max_concurrent_sessions'),
+        }}
+        for i in range({count})
+    ]
+    # render_nulls: keep credits_remaining=None (unlimited) instead of the column default
+    db.session.execute(insert(User).execution_options(render_nulls=True), users)
+    db.session.commit()
+    print(json.dumps([
+        {{'id': u['id'], 'email': u['email'], 'token': create_access_token(identity=u['id'])}}
+        for u in users
+    ]))
+'''
+
+_WERKZEUG = r'''
+from werkzeug.serving import run_simple
+from wsgi import app
+run_simple('127.0.0.1', {port}, app, threaded=True)
+'''
+
+
+def environment(workdir, database_url, llm_url, stripe_url, llm='both', overrides=None):
+    """The server's environment: isolated state, stub endpoints, test secrets"""
+    env = dict(os.environ)
+    env.update(
+        DATABASE_URL=database_url or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        LOCAL_STORE_PATH=os.path.join(workdir, 'local_store.db'),
+        JWT_SECRET_KEY='loadtest-' + 'x' * 32,
+        STRIPE_SECRET_KEY='sk_test_loadtest',
+        STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET,
+        STRIPE_API_BASE=stripe_url,
+        # Nothing to send mail to
+        MAIL_QUEUE_ENABLED='false',
+        PYTHONUNBUFFERED='1',
+    )
+    for plan in PLANS:
+        env[f'PRICE_ID_{plan.upper()}'] = f'price_loadtest_{plan}'
+    env.pop('OPENAI_API_KEY', None)
+    env.pop('CLAUDE_API_KEY', None)
+    if llm in ('both', 'openai'):
+        env.update(OPENAI_API_KEY='sk-loadtest', OPENAI_BASE_URL=f'{llm_url}/v1')
+    if llm in ('both', 'anthropic'):
+        env.update(CLAUDE_API_KEY='sk-ant-loadtest', ANTHROPIC_BASE_URL=llm_url)
+    env.update(overrides or {})
+    return env
+
+
+def price_ids(env):
+    return [env[f'PRICE_ID_{plan.upper()}'] for plan in PLANS]
+
+
+def setup(env, run, count, password, plan='founder'):
+    """Migrate the schema and insert `count` users; returns [{id, email, token}]"""
+    code = _SETUP.format(run=run, count=count, password=password, plan=plan)
+    out = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=BACKEND, env=env, capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        raise RuntimeError(f"Setup failed:\n{out.stderr[-4000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def gunicorn_available():
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start(env, port, log_path, server='gunicorn', workers=2, threads=8):
+    """Start the server in the background; returns the Popen"""
+    env = dict(env)
+    if server == 'gunicorn':
+        env.update(GUNICORN_BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads))
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+    elif server == 'werkzeug':
+        command = [sys.executable, '-c', _WERKZEUG.format(port=port)]
+    else:
+        raise ValueError(f"Unknown server '{server}'")
+    log = open(log_path, 'w')
+    try:
+        return subprocess.Popen(command, cwd=BACKEND, env=env, stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        log.close()
+
+
+def wait_ready(process, base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(f'{base_url}/api/chat/test', timeout=2) as resp:
+                if resp.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+
+def stop(process, timeout=15):
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
@@ -0,0 +1,310 @@
+# loadtest/stubs.py
+"""
+Local stand-ins for the OpenAI, Anthropic and Stripe APIs.
+
+The backend is pointed at them with OPENAI_BASE_URL, ANTHROPIC_BASE_URL and
+STRIPE_API_BASE, so a load test exercises the real SDKs, HTTP clients and
+connection pools without spending money or depending on someone else's
+latency. Each stub answers after a configurable, seeded random delay:
+
+    LLM     `first_token` seconds to the first token, then `token_interval`
+            per token for `tokens` tokens (streamed or not)
+    Stripe  `latency` seconds per call
+
+`jitter` is the relative spread of every delay (0.2 = +/-20%) and
+`error_rate` the fraction of calls answered with a 500.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class Latency:
+
+    def __init__(self, seconds, jitter=0.2, seed=0):
+        self.seconds = seconds
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, seconds=None):
+        seconds = self.seconds if seconds is None else seconds
+        with self._lock:
+            spread = self._random.uniform(-self.jitter, self.jitter)
+        return max(0.0, seconds * (1 + spread))
+
+    def sleep(self, seconds=None):
+        time.sleep(self.sample(seconds))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _failed(self):
+        stub = self.server.stub
+        return stub.error_rate and stub.random() < stub.error_rate
+
+
+# ----- LLM -----
+
+class _LLMHandler(_Handler):
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            models = [{'id': m, 'object': 'model'} for m in self.server.stub.models]
+            return self._send_json(200, {'object': 'list', 'data': models})
+        self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        stub = self.server.stub
+        request = json.loads(self._body() or b'{}')
+        path = urlsplit(self.path).path
+        if self._failed():
+            stub.latency.sleep(stub.first_token)
+            return self._send_json(500, {'error': {'type': 'api_error', 'message': 'stub failure'}})
+        if path.endswith('/chat/completions'):
+            return self._openai(request)
+        if path.endswith('/messages'):
+            return self._anthropic(request)
+        self._send_json(404, {'error': {'message': 'not found'}})
+
+    def _tokens(self, request):
+        count = min(self.server.stub.tokens, int(request.get('max_tokens') or self.server.stub.tokens))
+        return [f'token{i} ' for i in range(count)]
+
+    def _prompt_tokens(self, request):
+        # Roughly four characters per token, like the real tokenizers
+        return sum(len(str(m.get('content', ''))) for m in request.get('messages', [])) // 4 + 1
+
+    def _stream(self, frames):
+        """Send SSE frames as they are produced, chunked"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for frame in frames:
+            data = frame.encode()
+            self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _openai(self, request):
+        stub = self.server.stub
+        model = request.get('model', 'gpt-4o')
+        tokens = self._tokens(request)
+        usage = {'prompt_tokens': self._prompt_tokens(request), 'completion_tokens': len(tokens)}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        completion_id = f'chatcmpl-{uuid.uuid4().hex[:12]}'
+
+        if not request.get('stream'):
+            stub.latency.sleep(stub.first_token + stub.token_interval * len(tokens))
+            return self._send_json(200, {
+                'id': completion_id, 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': ''.join(tokens)}}],
+                'usage': usage,
+            })
+
+        def frames():
+            def chunk(delta, finish=None, with_usage=False):
+                data = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                        'model': model, 'choices': []}
+                if delta is not None:
+                    data['choices'] = [{'index': 0, 'delta': delta, 'finish_reason': finish}]
+                if with_usage:
+                    data['usage'] = usage
+                return f'data: {json.dumps(data)}\n\n'
+
+            stub.latency.sleep(stub.first_token)
+            yield chunk({'role': 'assistant', 'content': ''})
+            for token in tokens:
+                yield chunk({'content': token})
+                stub.latency.sleep(stub.token_interval)
+            yield chunk({}, finish='stop')
+            yield chunk(None, with_usage=True)
+            yield 'data: [DONE]\n\n'
+
+        self._stream(frames())
+
+    def _anthropic(self, request):
+        stub = self.server.stub
+        model = request.get('model', 'claude-3-5-sonnet-latest')
+        tokens = self._tokens(request)
+        prompt_tokens = self._prompt_tokens(request)
+        message_id = f'msg_{uuid.uuid4().hex[:12]}'
+
+        if not request.get('stream'):
+            stub.latency.sleep(stub.first_token + stub.token_interval * len(tokens))
+            return self._send_json(200, {
+                'id': message_id, 'type': 'message', 'role': 'assistant', 'model': model,
+                'content': [{'type': 'text', 'text': ''.join(tokens)}],
+                'stop_reason': 'end_turn',
+                'usage': {'input_tokens': prompt_tokens, 'output_tokens': len(tokens)},
+            })
+
+        def frames():
+            def event(kind, data):
+                data['type'] = kind
+                return f'event: {kind}\ndata: {json.dumps(data)}\n\n'
+
+            stub.latency.sleep(stub.first_token)
+            yield event('message_start', {'message': {
+                'id': message_id, 'type': 'message', 'role': 'assistant', 'model': model, 'content': [],
+                'usage': {'input_tokens': prompt_tokens, 'output_tokens': 0},
+            }})
+            yield event('content_block_start', {'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+            for token in tokens:
+                yield event('content_block_delta', {'index': 0, 'delta': {'type': 'text_delta', 'text': token}})
+                stub.latency.sleep(stub.token_interval)
+            yield event('content_block_stop', {'index': 0})
+            yield event('message_delta', {'delta': {'stop_reason': 'end_turn'},
+                                          'usage': {'output_tokens': len(tokens)}})
+            yield event('message_stop', {})
+
+        self._stream(frames())
+
+
+# ----- Stripe -----
+
+# /v1/<resource>[/<id>[/<action>]] -> id prefix for created objects
+_PREFIXES = {
+    'checkout/sessions': 'cs_test', 'payment_intents': 'pi', 'customers': 'cus',
+    'subscriptions': 'sub', 'prices': 'price', 'products': 'prod', 'invoices': 'in',
+}
+_OBJECT_TYPES = {
+    'checkout/sessions': 'checkout.session', 'payment_intents': 'payment_intent', 'customers': 'customer',
+    'subscriptions': 'subscription', 'prices': 'price', 'products': 'product', 'invoices': 'invoice',
+}
+_PATH = re.compile(r'^/v1/(?P<resource>checkout/sessions|billing_portal/sessions|[a-z_]+)(?:/(?P<id>[^/]+))?')
+
+
+class _StripeHandler(_Handler):
+
+    def _params(self):
+        # Only the flat params matter here; nested ones (metadata[x]) are kept by key
+        body = self._body().decode()
+        return {k: v[-1] for k, v in parse_qs(body).items()}
+
+    def _object(self, resource, object_id, params=None):
+        stub = self.server.stub
+        params = params or {}
+        data = {'id': object_id, 'object': _OBJECT_TYPES.get(resource, resource.rstrip('s')), 'livemode': False}
+        metadata = {k[9:-1]: v for k, v in params.items() if k.startswith('metadata[')}
+        data['metadata'] = metadata
+        if resource == 'prices':
+            data.update(active=True, currency='usd', unit_amount=stub.price_amounts.get(object_id, 4900),
+                        recurring={'interval': 'month'}, type='recurring',
+                        product={'id': f'prod_{object_id}', 'object': 'product', 'name': object_id})
+        elif resource == 'checkout/sessions':
+            data.update(status='complete', payment_status='paid', mode='subscription',
+                        customer=f'cus_{object_id[-12:]}', subscription=f'sub_{object_id[-12:]}',
+                        url=f'https://checkout.stripe.test/{object_id}')
+        elif resource == 'payment_intents':
+            data.update(amount=int(params.get('amount') or 0), currency=params.get('currency', 'usd'),
+                        status='requires_payment_method', client_secret=f'{object_id}_secret_stub')
+        elif resource == 'subscriptions':
+            data.update(status='canceled' if self.command == 'DELETE' else 'active', customer='cus_stub',
+                        items={'object': 'list', 'data': []})
+        return data
+
+    def _handle(self):
+        stub = self.server.stub
+        stub.latency.sleep()
+        if self._failed():
+            return self._send_json(500, {'error': {'type': 'api_error', 'message': 'stub failure'}})
+
+        match = _PATH.match(urlsplit(self.path).path)
+        if not match:
+            return self._send_json(404, {'error': {'type': 'invalid_request_error', 'message': 'not found'}})
+        resource, object_id = match.group('resource'), match.group('id')
+        params = self._params() if self.command == 'POST' else {}
+
+        if object_id:
+            return self._send_json(200, self._object(resource, object_id, params))
+        if self.command == 'POST':
+            prefix = _PREFIXES.get(resource, resource.rstrip('s'))
+            return self._send_json(200, self._object(resource, f'{prefix}_{uuid.uuid4().hex[:24]}', params))
+        data = []
+        if resource == 'prices':
+            data = [self._object('prices', price_id) for price_id in stub.price_amounts]
+        return self._send_json(200, {'object': 'list', 'url': f'/v1/{resource}', 'has_more': False, 'data': data})
+
+    do_GET = do_POST = do_DELETE = _handle
+
+
+# ----- servers -----
+
+class _Stub:
+    handler = None
+
+    def __init__(self, host='127.0.0.1', port=0, error_rate=0.0, seed=0):
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.handler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self._thread = None
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class LLMStub(_Stub):
+    """OpenAI Chat Completions and Anthropic Messages, streamed or not"""
+    handler = _LLMHandler
+
+    def __init__(self, first_token=0.3, token_interval=0.02, tokens=50, jitter=0.2,
+                 error_rate=0.0, seed=0, models=('gpt-4o', 'gpt-4o-mini'), **kwargs):
+        super().__init__(error_rate=error_rate, seed=seed, **kwargs)
+        self.first_token = first_token
+        self.token_interval = token_interval
+        self.tokens = tokens
+        self.models = list(models)
+        self.latency = Latency(first_token, jitter, seed)
+
+
+class StripeStub(_Stub):
+    """Enough of the Stripe API for checkout, prices, payment intents and subscriptions"""
+    handler = _StripeHandler
+
+    def __init__(self, latency=0.15, jitter=0.2, error_rate=0.0, seed=0, price_ids=(), **kwargs):
+        super().__init__(error_rate=error_rate, seed=seed, **kwargs)
+        self.latency = Latency(latency, jitter, seed)
+        self.price_amounts = {price_id: 1900 * (i + 1) for i, price_id in enumerate(price_ids)}
@@ -0,0 +1,46 @@
+"""Add conversation turns and rolling summaries
+
+Revision ID: 4c1e7a9b2d10
+Revises: 9ae3dc3062a6
+Create Date: 2025-07-20 10:14:02.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '4c1e7a9b2d10'
+down_revision = '9ae3dc3062a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('conversation_turns',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('session_id', sa.String(length=255), nullable=False),
+    sa.Column('role', sa.String(length=16), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('token_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_conversation_turns_user_session', 'conversation_turns', ['user_id', 'session_id', 'id'], unique=False)
+    op.create_table('conversation_summaries',
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('session_id', sa.String(length=255), nullable=False),
+    sa.Column('summary', sa.Text(), nullable=False),
+    sa.Column('token_count', sa.Integer(), nullable=False),
+    sa.Column('summarized_through', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'session_id')
+    )
+
+
+def downgrade():
+    op.drop_table('conversation_summaries')
+    op.drop_index('ix_conversation_turns_user_session', table_name='conversation_turns')
+    op.drop_table('conversation_turns')
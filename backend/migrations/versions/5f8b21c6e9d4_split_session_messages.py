@@ -0,0 +1,91 @@
+"""Move chat_history into session_messages and add session versions
+
+Revision ID: 5f8b21c6e9d4
+Revises: e2a9c04d7b35
+Create Date: 2025-07-24 14:31:09.407716
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5f8b21c6e9d4'
+down_revision = 'e2a9c04d7b35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('session_messages',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('session_pk', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('message', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['session_pk'], ['sessions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('session_pk', 'position', name='uq_session_messages_position')
+    )
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+        batch_op.add_column(sa.Column('message_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Copy each session's chat_history array into rows
+    conn = op.get_bind()
+    sessions = sa.table('sessions',
+        sa.column('id', sa.Integer()),
+        sa.column('chat_history', sa.JSON()),
+        sa.column('message_count', sa.Integer()),
+    )
+    messages = sa.table('session_messages',
+        sa.column('session_pk', sa.Integer()),
+        sa.column('position', sa.Integer()),
+        sa.column('message', sa.JSON()),
+        sa.column('created_at', sa.DateTime()),
+    )
+    now = datetime.utcnow()
+    for session_pk, history in conn.execute(sa.select(sessions.c.id, sessions.c.chat_history)).fetchall():
+        history = history or []
+        if history:
+            conn.execute(messages.insert(), [
+                {'session_pk': session_pk, 'position': i, 'message': m, 'created_at': now}
+                for i, m in enumerate(history)
+            ])
+        conn.execute(
+            sessions.update().where(sessions.c.id == session_pk).values(message_count=len(history))
+        )
+
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.drop_column('chat_history')
+
+
+def downgrade():
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.add_column(sa.Column('chat_history', sa.JSON(), nullable=False, server_default='[]'))
+
+    conn = op.get_bind()
+    sessions = sa.table('sessions',
+        sa.column('id', sa.Integer()),
+        sa.column('chat_history', sa.JSON()),
+    )
+    messages = sa.table('session_messages',
+        sa.column('session_pk', sa.Integer()),
+        sa.column('position', sa.Integer()),
+        sa.column('message', sa.JSON()),
+    )
+    history = {}
+    rows = conn.execute(
+        sa.select(messages.c.session_pk, messages.c.message)
+        .order_by(messages.c.session_pk, messages.c.position)
+    )
+    for session_pk, message in rows:
+        history.setdefault(session_pk, []).append(message)
+    for session_pk, items in history.items():
+        conn.execute(sessions.update().where(sessions.c.id == session_pk).values(chat_history=items))
+
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.drop_column('message_count')
+        batch_op.drop_column('version')
+    op.drop_table('session_messages')
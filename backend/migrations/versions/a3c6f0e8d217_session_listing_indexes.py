@@ -0,0 +1,27 @@
+"""Index session listings by status/document_type and timestamp
+
+Revision ID: a3c6f0e8d217
+Revises: 5f8b21c6e9d4
+Create Date: 2025-07-25 11:48:36.220458
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a3c6f0e8d217'
+down_revision = '5f8b21c6e9d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index('ix_sessions_user_status', table_name='sessions')
+    op.create_index('ix_sessions_user_status_timestamp', 'sessions', ['user_id', 'status', 'timestamp'], unique=False)
+    op.create_index('ix_sessions_user_doctype_timestamp', 'sessions', ['user_id', 'document_type', 'timestamp'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_sessions_user_doctype_timestamp', table_name='sessions')
+    op.drop_index('ix_sessions_user_status_timestamp', table_name='sessions')
+    op.create_index('ix_sessions_user_status', 'sessions', ['user_id', 'status'], unique=False)
@@ -0,0 +1,70 @@
+"""Give accounts that predate credit metering their plan's allowance
+
+Revision ID: a7c3e9f1b582
+Revises: e6b1c9d4f273
+Create Date: 2025-08-11 09:12:36.284150
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.services.plans import PLAN_CONFIG
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9f1b582'
+down_revision = 'e6b1c9d4f273'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Before metering, signup and checkout left credits_remaining at its
+    # default of 0 and nothing read it. Accounts that have never been
+    # charged get their plan's allowance, as if they had just signed up or
+    # checked out; accounts with ledger charges already have a real
+    # balance. Plans without a PLAN_CONFIG entry are left as they are.
+    conn = op.get_bind()
+    users = sa.table('users',
+        sa.column('id', sa.String()),
+        sa.column('subscription_plan', sa.String()),
+        sa.column('credits_remaining', sa.Integer()),
+        sa.column('unlimited_analysis', sa.Boolean()),
+        sa.column('max_concurrent_sessions', sa.Integer()),
+    )
+    ledger = sa.table('usage_ledger',
+        sa.column('user_id', sa.String()),
+        sa.column('kind', sa.String()),
+    )
+    aggregates = sa.table('user_aggregates',
+        sa.column('user_id', sa.String()),
+        sa.column('credits_remaining', sa.Integer()),
+        sa.column('version', sa.Integer()),
+    )
+    charged = sa.select(ledger.c.user_id).where(ledger.c.kind == 'charge')
+    for plan_key, plan in PLAN_CONFIG.items():
+        conn.execute(
+            users.update()
+            .where(users.c.subscription_plan == plan_key, users.c.id.not_in(charged))
+            .values(
+                credits_remaining=plan['credits_remaining'],
+                unlimited_analysis=plan.get('unlimited_analysis', False),
+                max_concurrent_sessions=plan.get('max_concurrent_sessions'),
+            )
+        )
+
+    # The dashboard mirrors the balance
+    conn.execute(
+        aggregates.update().values(
+            credits_remaining=(
+                sa.select(users.c.credits_remaining)
+                .where(users.c.id == aggregates.c.user_id)
+                .scalar_subquery()
+            ),
+            version=aggregates.c.version + 1,
+        )
+    )
+
+
+def downgrade():
+    # Balances from before the backfill aren't kept; nothing to undo
+    pass
@@ -0,0 +1,25 @@
+"""Index users.stripe_customer_id and stripe_subscription_id
+
+Revision ID: a8e2c5f9d603
+Revises: f3b8d2e6a915
+Create Date: 2025-08-02 14:40:19.002871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a8e2c5f9d603'
+down_revision = 'f3b8d2e6a915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_users_stripe_customer_id'), 'users', ['stripe_customer_id'], unique=False)
+    op.create_index(op.f('ix_users_stripe_subscription_id'), 'users', ['stripe_subscription_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_users_stripe_subscription_id'), table_name='users')
+    op.drop_index(op.f('ix_users_stripe_customer_id'), table_name='users')
@@ -0,0 +1,33 @@
+"""Add local Stripe object cache
+
+Revision ID: b5d9e1a7c428
+Revises: a8e2c5f9d603
+Create Date: 2025-08-04 11:26:53.718340
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b5d9e1a7c428'
+down_revision = 'a8e2c5f9d603'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stripe_cache',
+    sa.Column('id', sa.String(length=255), nullable=False),
+    sa.Column('object', sa.String(length=32), nullable=False),
+    sa.Column('related_id', sa.String(length=255), nullable=True),
+    sa.Column('data', sa.Text(), nullable=False),
+    sa.Column('fetched_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_stripe_cache_related_id'), 'stripe_cache', ['related_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_stripe_cache_related_id'), table_name='stripe_cache')
+    op.drop_table('stripe_cache')
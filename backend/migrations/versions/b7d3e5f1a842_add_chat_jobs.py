@@ -0,0 +1,41 @@
+"""Add chat_jobs queue table
+
+Revision ID: b7d3e5f1a842
+Revises: 4c1e7a9b2d10
+Create Date: 2025-07-21 16:40:51.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e5f1a842'
+down_revision = '4c1e7a9b2d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('chat_jobs',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('claimed_by', sa.String(length=64), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_chat_jobs_user_id'), 'chat_jobs', ['user_id'], unique=False)
+    op.create_index('ix_chat_jobs_status_created', 'chat_jobs', ['status', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_chat_jobs_status_created', table_name='chat_jobs')
+    op.drop_index(op.f('ix_chat_jobs_user_id'), table_name='chat_jobs')
+    op.drop_table('chat_jobs')
@@ -0,0 +1,57 @@
+"""Add enterprise applications and outbound mail queue
+
+Revision ID: c4f7a3d8e512
+Revises: b5d9e1a7c428
+Create Date: 2025-08-05 16:03:11.927405
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c4f7a3d8e512'
+down_revision = 'b5d9e1a7c428'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('enterprise_applications',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('company_email', sa.String(length=255), nullable=False),
+    sa.Column('company_name', sa.String(length=255), nullable=False),
+    sa.Column('seats_needed', sa.String(length=50), nullable=True),
+    sa.Column('budget_range', sa.String(length=100), nullable=True),
+    sa.Column('notes', sa.Text(), nullable=True),
+    sa.Column('checkout_session_id', sa.String(length=255), nullable=True),
+    sa.Column('checkout_url', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('outbound_emails',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('subject', sa.String(length=255), nullable=False),
+    sa.Column('sender', sa.String(length=255), nullable=True),
+    sa.Column('recipients', sa.JSON(), nullable=False),
+    sa.Column('body', sa.Text(), nullable=True),
+    sa.Column('html', sa.Text(), nullable=True),
+    sa.Column('preparer', sa.String(length=64), nullable=True),
+    sa.Column('context', sa.JSON(), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('claimed_by', sa.String(length=64), nullable=True),
+    sa.Column('claimed_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbound_emails_status_next_attempt', 'outbound_emails', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_outbound_emails_status_next_attempt', table_name='outbound_emails')
+    op.drop_table('outbound_emails')
+    op.drop_table('enterprise_applications')
@@ -0,0 +1,35 @@
+"""Add user_aggregates for the dashboard
+
+Revision ID: c9e4b7a1f360
+Revises: a3c6f0e8d217
+Create Date: 2025-07-28 15:22:10.671942
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c9e4b7a1f360'
+down_revision = 'a3c6f0e8d217'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_aggregates',
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('pending_count', sa.Integer(), nullable=False),
+    sa.Column('all_count', sa.Integer(), nullable=False),
+    sa.Column('doc_type_counts', sa.JSON(), nullable=False),
+    sa.Column('credits_used', sa.Integer(), nullable=False),
+    sa.Column('credits_remaining', sa.Integer(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Backfill with: python rebuild_aggregates.py
+
+
+def downgrade():
+    op.drop_table('user_aggregates')
@@ -0,0 +1,55 @@
+"""Add usage ledger and daily roll-ups
+
+Revision ID: d1f5a8c3b704
+Revises: c9e4b7a1f360
+Create Date: 2025-07-30 10:05:44.383217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd1f5a8c3b704'
+down_revision = 'c9e4b7a1f360'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('usage_ledger',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('session_id', sa.String(length=255), nullable=True),
+    sa.Column('kind', sa.String(length=32), nullable=False),
+    sa.Column('provider', sa.String(length=32), nullable=True),
+    sa.Column('model', sa.String(length=100), nullable=True),
+    sa.Column('doc_type', sa.String(length=100), nullable=True),
+    sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+    sa.Column('completion_tokens', sa.Integer(), nullable=False),
+    sa.Column('total_tokens', sa.Integer(), nullable=False),
+    sa.Column('credits_charged', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_usage_ledger_user_created', 'usage_ledger', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_usage_ledger_user_session', 'usage_ledger', ['user_id', 'session_id'], unique=False)
+    op.create_index('ix_usage_ledger_created', 'usage_ledger', ['created_at'], unique=False)
+    op.create_table('usage_rollups',
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('calls', sa.Integer(), nullable=False),
+    sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+    sa.Column('completion_tokens', sa.Integer(), nullable=False),
+    sa.Column('credits_charged', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+
+
+def downgrade():
+    op.drop_table('usage_rollups')
+    op.drop_index('ix_usage_ledger_created', table_name='usage_ledger')
+    op.drop_index('ix_usage_ledger_user_session', table_name='usage_ledger')
+    op.drop_index('ix_usage_ledger_user_created', table_name='usage_ledger')
+    op.drop_table('usage_ledger')
@@ -0,0 +1,24 @@
+"""Let rate-limited chat jobs wait before they are claimed again
+
+Revision ID: d8f2b6a4c913
+Revises: a7c3e9f1b582
+Create Date: 2025-08-11 14:03:52.917406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd8f2b6a4c913'
+down_revision = 'a7c3e9f1b582'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('chat_jobs', sa.Column('run_after', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('chat_jobs') as batch_op:
+        batch_op.drop_column('run_after')
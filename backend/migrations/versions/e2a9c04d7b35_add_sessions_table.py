@@ -0,0 +1,43 @@
+"""Add sessions table (replaces sessions_data/*.json)
+
+Revision ID: e2a9c04d7b35
+Revises: b7d3e5f1a842
+Create Date: 2025-07-23 09:02:47.551820
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e2a9c04d7b35'
+down_revision = 'b7d3e5f1a842'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sessions',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('session_id', sa.String(length=255), nullable=False),
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('document_type', sa.String(length=100), nullable=False),
+    sa.Column('current_phase', sa.Integer(), nullable=False),
+    sa.Column('chat_history', sa.JSON(), nullable=False),
+    sa.Column('notes', sa.JSON(), nullable=False),
+    sa.Column('status', sa.String(length=32), nullable=False),
+    sa.Column('created', sa.DateTime(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'session_id', name='uq_sessions_user_session')
+    )
+    op.create_index('ix_sessions_user_timestamp', 'sessions', ['user_id', 'timestamp'], unique=False)
+    op.create_index('ix_sessions_user_status', 'sessions', ['user_id', 'status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_sessions_user_status', table_name='sessions')
+    op.drop_index('ix_sessions_user_timestamp', table_name='sessions')
+    op.drop_table('sessions')
@@ -0,0 +1,24 @@
+"""Record when a session's analysis credit was charged
+
+Revision ID: e6b1c9d4f273
+Revises: c4f7a3d8e512
+Create Date: 2025-08-08 10:21:47.503816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e6b1c9d4f273'
+down_revision = 'c4f7a3d8e512'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('sessions', sa.Column('charged_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.drop_column('charged_at')
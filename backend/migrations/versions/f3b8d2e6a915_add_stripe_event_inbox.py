@@ -0,0 +1,41 @@
+"""Add Stripe webhook event inbox
+
+Revision ID: f3b8d2e6a915
+Revises: d1f5a8c3b704
+Create Date: 2025-08-01 09:12:37.540118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d2e6a915'
+down_revision = 'd1f5a8c3b704'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stripe_events',
+    sa.Column('id', sa.String(length=255), nullable=False),
+    sa.Column('type', sa.String(length=100), nullable=False),
+    sa.Column('customer_id', sa.String(length=255), nullable=True),
+    sa.Column('created', sa.Integer(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('claimed_by', sa.String(length=64), nullable=True),
+    sa.Column('claimed_at', sa.DateTime(), nullable=True),
+    sa.Column('received_at', sa.DateTime(), nullable=False),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stripe_events_status_created', 'stripe_events', ['status', 'created'], unique=False)
+    op.create_index('ix_stripe_events_customer_status', 'stripe_events', ['customer_id', 'status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_stripe_events_customer_status', table_name='stripe_events')
+    op.drop_index('ix_stripe_events_status_created', table_name='stripe_events')
+    op.drop_table('stripe_events')
@@ -0,0 +1,47 @@
+# backend/process_mail_queue.py
+#
+# Dedicated sender for the outbound mail queue. Use this instead of (or
+# alongside) the senders embedded in web workers:
+#   MAIL_QUEUE_ENABLED=false gunicorn wsgi:app   # web workers only enqueue
+#   python process_mail_queue.py                 # this process sends
+#   python process_mail_queue.py --drain         # send what's due, then exit
+#   python process_mail_queue.py --stats         # print queue depth
+#
+# For local testing point MAIL_SERVER/MAIL_PORT at `python smtp_sink.py`.
+
+import argparse
+import json
+import time
+
+from app import create_app
+from app.services import mail_queue
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Send queued outbound email')
+    parser.add_argument('--drain', action='store_true', help='send due messages and exit')
+    parser.add_argument('--stats', action='store_true', help='print queue depth and exit')
+    args = parser.parse_args()
+
+    app = create_app()
+
+    if args.stats:
+        with app.app_context():
+            print(json.dumps(mail_queue.stats(), indent=2))
+    elif args.drain:
+        sender = mail_queue.build_sender(app)
+        with app.app_context():
+            sender.requeue_stale()
+            while sender.send_batch():
+                pass
+            print(json.dumps(mail_queue.stats(), indent=2))
+    else:
+        sender = mail_queue.build_sender(app)
+        sender.start()
+        try:
+            while True:
+                time.sleep(60)
+                with app.app_context():
+                    print(f"Mail queue: {mail_queue.stats()}")
+        except KeyboardInterrupt:
+            print("Stopping mail sender...")
+            sender.stop(timeout=30)
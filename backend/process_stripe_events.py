@@ -0,0 +1,40 @@
+# backend/process_stripe_events.py
+#
+# Dedicated consumer for the Stripe webhook inbox. Use this instead of (or
+# alongside) the consumers embedded in web workers:
+#   STRIPE_EVENT_CONSUMER=false gunicorn wsgi:app   # web workers only store events
+#   python process_stripe_events.py                 # this process applies them
+#   python process_stripe_events.py --drain         # apply what's pending, then exit
+
+import argparse
+import time
+
+from app import create_app
+from app.services.stripe_inbox import build_consumer
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply stored Stripe webhook events')
+    parser.add_argument('--drain', action='store_true', help='process pending events and exit')
+    args = parser.parse_args()
+
+    app = create_app()
+    consumer = build_consumer(app)
+
+    if args.drain:
+        with app.app_context():
+            consumer.requeue_stale()
+            total = 0
+            while True:
+                count = consumer.process_batch()
+                if not count:
+                    break
+                total += count
+        print(f"Applied {total} Stripe events")
+    else:
+        consumer.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print("Stopping Stripe event consumer...")
+            consumer.stop(timeout=30)
@@ -0,0 +1,29 @@
+# backend/rebuild_aggregates.py
+#
+# Backfill or repair the per-user dashboard aggregates from the sessions
+# table. Run once after the user_aggregates migration, and any time the
+# counters are suspected to have drifted.
+#
+#   python rebuild_aggregates.py [--user-id <id>]
+
+import argparse
+
+from wsgi import app
+from app import db
+from app.services import aggregates
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild user dashboard aggregates')
+    parser.add_argument('--user-id', help='only rebuild this user')
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.user_id:
+            agg = aggregates.rebuild_user(args.user_id)
+            db.session.commit()
+            print(f"Rebuilt aggregates for {args.user_id}: "
+                  f"{agg.all_count} sessions, {agg.pending_count} pending")
+        else:
+            count = aggregates.rebuild_all(args.batch_size)
+            print(f"Rebuilt aggregates for {count} users")
@@ -0,0 +1,33 @@
+# backend/reconcile_stripe.py
+#
+# Repair users.subscription_plan / stripe_customer_id / stripe_subscription_id
+# from Stripe after missed webhooks. Reads every subscription once with the
+# paginated list API and writes only the users that differ.
+#
+#   python reconcile_stripe.py --dry-run          # show what would change
+#   python reconcile_stripe.py                    # apply
+#   STRIPE_API_BASE=http://localhost:12111 python reconcile_stripe.py   # against a local stand-in
+
+import argparse
+
+from wsgi import app
+from app.services.stripe_reconcile import reconcile
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reconcile user subscriptions with Stripe')
+    parser.add_argument('--dry-run', action='store_true', help='report changes without writing them')
+    parser.add_argument('--batch-size', type=int, default=1000, help='users per UPDATE batch')
+    parser.add_argument('--chunk-size', type=int, default=500, help='subscriptions matched per user query')
+    parser.add_argument('--verbose', action='store_true', help='print every change')
+    args = parser.parse_args()
+
+    with app.app_context():
+        stats, changes = reconcile(dry_run=args.dry_run, batch_size=args.batch_size, chunk_size=args.chunk_size)
+
+    if args.verbose or args.dry_run:
+        for change in changes:
+            print(change)
+    print(f"Subscriptions: {stats['subscriptions']} "
+          f"(matched {stats['matched']}, unmatched {stats['unmatched']})")
+    print(f"Users changed: {stats['changed']}, updated: {stats['updated']} "
+          f"in {stats['seconds']}s{' (dry run)' if args.dry_run else ''}")
@@ -0,0 +1,33 @@
+# backend/rollup_usage.py
+#
+# Roll the append-only usage ledger up into per-user daily totals for
+# reporting. Safe to re-run: each day is rebuilt from scratch. Schedule it
+# (e.g. hourly from cron) with the default arguments, which refresh today
+# and yesterday so late rows are picked up.
+#
+#   python rollup_usage.py [--days N | --date YYYY-MM-DD]
+
+import argparse
+from datetime import datetime, timedelta
+
+from wsgi import app
+from app import db
+from app.services import metering
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Roll up usage ledger into daily totals')
+    parser.add_argument('--days', type=int, default=2, help='number of days back from today (UTC) to rebuild')
+    parser.add_argument('--date', help='rebuild a single day instead (YYYY-MM-DD)')
+    args = parser.parse_args()
+
+    if args.date:
+        days = [datetime.strptime(args.date, '%Y-%m-%d').date()]
+    else:
+        today = datetime.utcnow().date()
+        days = [today - timedelta(days=n) for n in range(args.days)]
+
+    with app.app_context():
+        for day in sorted(days):
+            users = metering.rollup(day)
+            db.session.commit()
+            print(f"{day.isoformat()}: {users} users rolled up")
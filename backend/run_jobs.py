@@ -0,0 +1,27 @@
+# backend/run_jobs.py
+#
+# Dedicated chat job runner. Use this instead of (or alongside) the runners
+# embedded in web workers:
+#   CHAT_JOB_WORKERS=0 gunicorn wsgi:app      # web workers only enqueue
+#   python run_jobs.py --workers 8            # this process runs the jobs
+
+import argparse
+import time
+
+from app import create_app
+from app.services.jobs import build_runner
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run queued chat generation jobs')
+    parser.add_argument('--workers', type=int, default=4, help='number of job threads')
+    args = parser.parse_args()
+
+    app = create_app()
+    runner = build_runner(app, workers=args.workers)
+    runner.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("Stopping chat job runner...")
+        runner.stop(timeout=30)
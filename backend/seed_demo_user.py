@@ -2,7 +2,7 @@
 
 from app import create_app, db
 from app.models import User
-from werkzeug.security import generate_password_hash
+from app.services.passwords import hash_password
 
 app = create_app()
 app.app_context().push()
@@ -20,7 +20,7 @@ if existing_user:
 demo_user = User(
     email=demo_email,
     name='Demo User',
-    password_hash=generate_password_hash(demo_password, method='pbkdf2:sha256'),
+    password_hash=hash_password(demo_password),
     subscription_plan='essential',
     seat_limit=1,
     max_seats=1,
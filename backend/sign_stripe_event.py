@@ -0,0 +1,105 @@
+# backend/sign_stripe_event.py
+#
+# Build a Stripe webhook fixture, sign it with STRIPE_WEBHOOK_SECRET the way
+# Stripe does, and optionally POST it to a running backend:
+#
+#   python sign_stripe_event.py checkout.session.completed --user-id <id> \
+#       --customer cus_123 --subscription sub_123 --plan growth --post
+#   python sign_stripe_event.py --file my_event.json --post --url http://localhost:8000/api/billing/webhook
+#
+# Without --post, prints the Stripe-Signature header and the payload.
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import uuid
+import urllib.request
+
+
+def build_event(event_type, args):
+    if event_type == 'checkout.session.completed':
+        obj = {
+            'id': f'cs_test_{uuid.uuid4().hex[:24]}',
+            'object': 'checkout.session',
+            'customer': args.customer,
+            'subscription': args.subscription,
+            'metadata': {'user_id': args.user_id, 'plan_key': args.plan},
+        }
+    elif event_type == 'customer.subscription.deleted':
+        obj = {
+            'id': args.subscription,
+            'object': 'subscription',
+            'customer': args.customer,
+            'status': 'canceled',
+        }
+    elif event_type == 'invoice.payment_succeeded':
+        obj = {
+            'id': f'in_test_{uuid.uuid4().hex[:24]}',
+            'object': 'invoice',
+            'customer': args.customer,
+            'subscription': args.subscription,
+            'amount_paid': 0,
+        }
+    else:
+        sys.exit(f"No built-in fixture for {event_type}; pass --file")
+    return {
+        'id': args.event_id or f'evt_test_{uuid.uuid4().hex[:24]}',
+        'object': 'event',
+        'api_version': '2024-06-20',
+        'created': int(time.time()),
+        'livemode': False,
+        'type': event_type,
+        'data': {'object': obj},
+    }
+
+
+def sign(payload, secret, timestamp=None):
+    """Stripe-Signature header value for `payload` (t=<ts>,v1=<hmac-sha256>)"""
+    timestamp = timestamp or int(time.time())
+    signed = f'{timestamp}.'.encode() + payload
+    digest = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={digest}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sign a Stripe webhook fixture event')
+    parser.add_argument('type', nargs='?', help='event type for a built-in fixture')
+    parser.add_argument('--file', help='JSON event to sign instead of a built-in fixture')
+    parser.add_argument('--event-id', help='fixed event id (resend to test de-duplication)')
+    parser.add_argument('--user-id', help='metadata.user_id for checkout.session.completed')
+    parser.add_argument('--customer', default='cus_test_fixture')
+    parser.add_argument('--subscription', default='sub_test_fixture')
+    parser.add_argument('--plan', default='growth')
+    parser.add_argument('--secret', default=os.getenv('STRIPE_WEBHOOK_SECRET'))
+    parser.add_argument('--post', action='store_true', help='send it to --url')
+    parser.add_argument('--url', default='http://localhost:8000/api/billing/webhook')
+    args = parser.parse_args()
+
+    if not args.secret:
+        sys.exit('Set STRIPE_WEBHOOK_SECRET or pass --secret')
+    if args.file:
+        with open(args.file) as f:
+            event = json.load(f)
+    elif args.type:
+        event = build_event(args.type, args)
+    else:
+        parser.error('pass an event type or --file')
+
+    payload = json.dumps(event).encode()
+    signature = sign(payload, args.secret)
+
+    if not args.post:
+        print(f'Stripe-Signature: {signature}')
+        print(payload.decode())
+        sys.exit(0)
+
+    req = urllib.request.Request(args.url, data=payload, method='POST', headers={
+        'Content-Type': 'application/json',
+        'Stripe-Signature': signature,
+    })
+    with urllib.request.urlopen(req) as resp:
+        print(f"{event['id']} ({event['type']}): HTTP {resp.status}")
@@ -0,0 +1,93 @@
+# backend/smtp_sink.py
+#
+# Minimal local SMTP server that accepts every message and prints it (or
+# appends it to --mbox). For testing the mail queue without a real server:
+#
+#   python smtp_sink.py --port 1025
+#   MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=false python process_mail_queue.py --drain
+
+import argparse
+import socketserver
+import threading
+
+_lock = threading.Lock()
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.reply('220 smtp-sink ready')
+        mail_from, rcpt_to, messages = None, [], 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 smtp-sink')
+            elif verb == 'MAIL':
+                mail_from, rcpt_to = command[10:], []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                rcpt_to.append(command[8:])
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(chunk.decode('utf-8', 'replace'))
+                messages += 1
+                self.server.deliver(mail_from, rcpt_to, ''.join(data))
+                self.reply('250 OK: queued')
+            elif verb == 'RSET':
+                mail_from, rcpt_to = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                break
+            else:
+                self.reply('502 Command not implemented')
+        print(f"[smtp-sink] connection closed after {messages} message(s)")
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, mbox=None):
+        super().__init__(address, SinkHandler)
+        self.mbox = mbox
+        self.received = []
+
+    def deliver(self, mail_from, rcpt_to, data):
+        with _lock:
+            self.received.append((mail_from, rcpt_to, data))
+            if self.mbox:
+                with open(self.mbox, 'a') as f:
+                    f.write(f'From {mail_from}\n{data}\n')
+            else:
+                print(f"[smtp-sink] {mail_from} -> {', '.join(rcpt_to)}\n{data}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local SMTP sink for testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--mbox', help='append messages to this file instead of printing')
+    args = parser.parse_args()
+
+    server = SinkServer((args.host, args.port), args.mbox)
+    print(f"SMTP sink listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -15,6 +15,8 @@ const Sessions = () => {
   const [currentSession, setCurrentSession] = useState(null);
   const [activeTab, setActiveTab] = useState('summary');
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   // Get URL parameters
   const urlParams = new URLSearchParams(location.search);
@@ -28,40 +30,87 @@ const Sessions = () => {
 
   // Handle URL parameters
   useEffect(() => {
-    if (viewParam === 'review' && sessionIdParam) {
-      const session = sessions.find(s => s.session_id === sessionIdParam);
+    if (viewParam !== 'review' || !sessionIdParam) {
+      return;
+    }
+    // Already showing it (handleViewSession fetched it before navigating)
+    if (currentSession && currentSession.session_id === sessionIdParam) {
+      return;
+    }
+    let cancelled = false;
+    fetchSession(sessionIdParam).then((session) => {
+      if (cancelled) return;
+      // Offline: fall back to the copy the wizard keeps in localStorage
+      if (!session) {
+        try {
+          session = JSON.parse(localStorage.getItem(`session_${sessionIdParam}`));
+        } catch (e) {
+          session = null;
+        }
+      }
       if (session) {
         setView('review');
         setCurrentSession(session);
       }
-    }
-  }, [viewParam, sessionIdParam, sessions]);
+    });
+    return () => {
+      cancelled = true;
+    };
+  }, [viewParam, sessionIdParam]);
 
   // Filter sessions when filter changes
   useEffect(() => {
     filterSessions();
   }, [sessions, statusFilter]);
 
-  // Load sessions from localStorage and API
-  const loadSessions = async () => {
+  // Fetch one session with its notes and chat history (null on failure)
+  const fetchSession = async (sessionId) => {
     try {
-      setLoading(true);
-      
-      // Try to load from API first
-      const response = await fetch('http://localhost:8000/api/sessions', {
+      const response = await fetch(`http://localhost:8000/api/sessions/${sessionId}`, {
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('token')}`
         }
       });
-
       if (response.ok) {
         const data = await response.json();
         if (data.success) {
-          setSessions(data.sessions);
-          setLoading(false);
-          return;
+          return data.session;
         }
       }
+    } catch (error) {
+      console.error('Error loading session:', error);
+    }
+    return null;
+  };
+
+  // Fetch one page of session summaries, newest first (null on failure)
+  const fetchSessionPage = async (cursor) => {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    const response = await fetch(`http://localhost:8000/api/sessions${query}`, {
+      headers: {
+        'Authorization': `Bearer ${localStorage.getItem('token')}`
+      }
+    });
+    if (!response.ok) {
+      return null;
+    }
+    const data = await response.json();
+    return data.success ? data : null;
+  };
+
+  // Load sessions from localStorage and API
+  const loadSessions = async () => {
+    try {
+      setLoading(true);
+      
+      // Try to load from API first
+      const page = await fetchSessionPage(null).catch(() => null);
+      if (page) {
+        setSessions(page.sessions);
+        setNextCursor(page.next_cursor);
+        setLoading(false);
+        return;
+      }
 
       // Fallback to localStorage
       const localSessions = [];
@@ -87,6 +136,23 @@ const Sessions = () => {
     }
   };
 
+  // Append the next page of older sessions
+  const loadMoreSessions = async () => {
+    if (!nextCursor || loadingMore) return;
+    try {
+      setLoadingMore(true);
+      const page = await fetchSessionPage(nextCursor);
+      if (page) {
+        setSessions(prev => [...prev, ...page.sessions]);
+        setNextCursor(page.next_cursor);
+      }
+    } catch (error) {
+      console.error('Error loading more sessions:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // Filter sessions based on status
   const filterSessions = () => {
     if (statusFilter === 'all') {
@@ -139,9 +205,12 @@ const Sessions = () => {
   };
 
   // Handle view session
-  const handleViewSession = (session) => {
+  const handleViewSession = async (session) => {
+    // The list endpoint only returns summaries; fetch notes/history on demand
+    const fullSession = (await fetchSession(session.session_id)) || session;
+
     setView('review');
-    setCurrentSession(session);
+    setCurrentSession(fullSession);
     setActiveTab('summary');
     navigate(`/sessions?view=review&session_id=${session.session_id}`);
   };
@@ -416,6 +485,19 @@ const Sessions = () => {
               </table>
             </div>
           )}
+
+          {/* Older sessions, one page at a time */}
+          {nextCursor && (
+            <div className="load-more">
+              <button
+                onClick={loadMoreSessions}
+                disabled={loadingMore}
+                className="action-button view-button"
+              >
+                {loadingMore ? 'Loading...' : 'Load more sessions'}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>